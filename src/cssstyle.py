@@ -21,23 +21,67 @@ from csscolor import CSSColor
 from svgelements import *
 
 class CSSStyle(dict):
+
+    # vendor prefix used by each rendering engine
+    # (reading systems are targeted through their engine,
+    # e.g. iBooks, Kobo and Readium use webkit)
+    VENDOR_PREFIXES = {
+        "webkit": "-webkit-",
+        "gecko": "-moz-",
+        "trident": "-ms-",
+        "presto": "-o-"
+    }
     
     def __str__(self):
+        return self.toString()
+
+    # serialize, keeping only the vendor-prefixed properties and values
+    # whose prefix is in the given list (None = keep all of them)
+    def toString(self, prefixes=None):
         s = ""
         for name, style in sorted(self.iteritems(), key=lambda x: len(x[0])):
             if (name == "transform"):
-                s += CSSStyle.__transform(style)
+                s += CSSStyle.__transform(style, prefixes)
+                continue
+            if (not CSSStyle.__isAllowed(name, prefixes)):
                 continue
             if (isinstance(style, list)):
-                s += "".join(["%s:%s;" % (name, s) for s in style])
+                s += "".join(["%s:%s;" % (name, s) for s in style if CSSStyle.__isAllowed(s, prefixes)])
                 continue
             if (not isinstance(style, str)):
                 style = str(style)
             s += "%s:%s;" % (name, style)
         return s
+
+    # return the list of vendor prefixes for the given comma-separated list of engines,
+    # and the list of the unknown engine names
+    @classmethod
+    def getVendorPrefixes(cls, targets):
+        prefixes = []
+        unknown = []
+        for target in targets.split(","):
+            target = target.strip().lower()
+            if (len(target) == 0):
+                continue
+            if (target in cls.VENDOR_PREFIXES):
+                prefixes.append(cls.VENDOR_PREFIXES[target])
+            else:
+                unknown.append(target)
+        return prefixes, unknown
+
+    # True if the given property name or value is not vendor-prefixed,
+    # or if its prefix is allowed
+    @classmethod
+    def __isAllowed(cls, string, prefixes):
+        if ((prefixes is None) or (not string.startswith("-"))):
+            return True
+        for prefix in cls.VENDOR_PREFIXES.values():
+            if ((string.startswith(prefix)) and (prefix not in prefixes)):
+                return False
+        return True
     
     @classmethod
-    def __transform(cls, transform):
+    def __transform(cls, transform, prefixes=None):
         style = str(transform)
         s = ""
         # no longer needed
@@ -48,7 +92,8 @@ class CSSStyle(dict):
         #else:
         #    s += "-moz-transform:%s;" % transform.toStringMoz()
         for name in ["transform", "-moz-transform", "-ms-transform", "-o-transform", "-webkit-transform"]:
-            s += "%s:%s;" % (name, style)
+            if (cls.__isAllowed(name, prefixes)):
+                s += "%s:%s;" % (name, style)
         return s
     
     __re_fill_url = re.compile("url\(#(.*)\)")
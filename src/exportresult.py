@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'In-memory result of a conversion'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import codecs, os
+
+class ExportResult():
+
+    # initialize result
+    # xhtml and css are strings (or None in raster mode),
+    # xhtml_tree is the <html> lxml element (or None),
+    # images is a dict mapping relative file paths to their (binary) contents
+    def __init__(self, xhtml=None, xhtml_tree=None, css=None, images=None, log="", xhtml_file_name=None, css_file_name=None):
+        self.xhtml = xhtml
+        self.xhtml_tree = xhtml_tree
+        self.css = css
+        self.images = images
+        if (self.images is None):
+            self.images = {}
+        self.log = log
+        self.xhtml_file_name = xhtml_file_name
+        self.css_file_name = css_file_name
+
+    # write XHTML, CSS and images into the given directory,
+    # returning the list of the absolute paths of the written files
+    def write(self, output_dir_path):
+        written = []
+        if (not os.path.exists(output_dir_path)):
+            os.makedirs(output_dir_path)
+        if ((self.xhtml is not None) and (self.xhtml_file_name)):
+            written.append(self.__writeText(output_dir_path, self.xhtml_file_name, self.xhtml))
+        if ((self.css is not None) and (self.css_file_name)):
+            written.append(self.__writeText(output_dir_path, self.css_file_name, self.css))
+        for relative_file_path in sorted(self.images.keys()):
+            absolute_file_path = os.path.join(output_dir_path, relative_file_path)
+            image_dir_path = os.path.dirname(absolute_file_path)
+            if (not os.path.exists(image_dir_path)):
+                os.makedirs(image_dir_path)
+            f = open(absolute_file_path, "wb")
+            f.write(self.images[relative_file_path])
+            f.close()
+            written.append(absolute_file_path)
+        return written
+
+    # write a text file, encoded as UTF-8
+    def __writeText(self, output_dir_path, file_name, data):
+        absolute_file_path = os.path.join(output_dir_path, file_name)
+        f = codecs.open(absolute_file_path, "w", "utf-8")
+        f.write(data)
+        f.close()
+        return absolute_file_path
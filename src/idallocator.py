@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Allocate unique ids for the generated elements'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import re
+
+class IDAllocator():
+
+    DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+    # initialize allocator
+    # all the returned ids start with prefix;
+    # if compact is True, counters are written in base 36 without padding
+    # (e.g., "svg-2s" instead of "svg-000100")
+    def __init__(self, prefix, compact=False):
+        self.prefix = prefix
+        self.compact = compact
+        self.__id = 0
+        self.__counters = {}
+        self.__used = set()
+
+    # get a new id: from base (e.g., the original SVG id) if given, otherwise numeric;
+    # if base is already taken, a "-<n>" suffix is appended,
+    # where n comes from a counter kept for each base (so we never rescan);
+    # the ids derived from the new one by appending each of the given suffixes
+    # (e.g., "-img") must be free too, and they are reserved with it
+    def allocate(self, base=None, suffixes=()):
+        # always increment, so numeric ids are surely increasing
+        self.__id += 1
+        if (base is None):
+            new_id = self.prefix + self.__format(self.__id)
+            while (not self.__isFree(new_id, suffixes)):
+                self.__id += 1
+                new_id = self.prefix + self.__format(self.__id)
+        else:
+            new_id = self.prefix + self.clean(base)
+            if (not self.__isFree(new_id, suffixes)):
+                stem = new_id
+                i = self.__counters.get(stem, 0)
+                while (not self.__isFree(new_id, suffixes)):
+                    i += 1
+                    new_id = "%s-%s" % (stem, self.__format(i))
+                self.__counters[stem] = i
+        self.__used.add(new_id)
+        for suffix in suffixes:
+            self.__used.add(new_id + suffix)
+        return new_id
+
+    # mark the given (complete) id as taken
+    def reserve(self, new_id):
+        if (new_id in self.__used):
+            raise ValueError("Id '%s' is already taken" % (new_id))
+        self.__used.add(new_id)
+
+    # return True if the given (complete) id is taken
+    def isUsed(self, new_id):
+        return new_id in self.__used
+
+    # replace characters not allowed in ids
+    @classmethod
+    def clean(cls, base):
+        return re.sub(r"[^A-Za-z0-9-_]", "_", base)
+
+    # return True if the given (complete) id, and the ones derived from it, are not taken
+    def __isFree(self, new_id, suffixes):
+        if (new_id in self.__used):
+            return False
+        for suffix in suffixes:
+            if ((new_id + suffix) in self.__used):
+                return False
+        return True
+
+    # format a counter value
+    def __format(self, n):
+        if (not self.compact):
+            return "%06d" % n
+        s = ""
+        while (n > 0):
+            n, r = divmod(n, 36)
+            s = self.DIGITS[r] + s
+        return s
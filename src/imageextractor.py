@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Write images embedded as data: URIs to files'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import base64, hashlib, os, tempfile, urllib
+from namespaces import NS
+
+class ImageExtractor():
+
+    # file extension for each media type (others get DEFAULT_EXTENSION)
+    EXTENSIONS = {
+        "image/png": "png",
+        "image/jpeg": "jpg",
+        "image/jpg": "jpg",
+        "image/gif": "gif",
+        "image/svg+xml": "svg",
+        "image/bmp": "bmp",
+        "image/webp": "webp",
+    }
+    DEFAULT_EXTENSION = "bin"
+
+    # base64 characters decoded at a time (a multiple of 4)
+    CHUNK_SIZE = 65536
+
+    # length of the hash used as file name
+    HASH_LENGTH = 20
+
+    # initialize extractor, writing the images in the given directory (created if needed)
+    def __init__(self, dir_path, log=None):
+        self.__log = self.__fake_log
+        if (log):
+            self.__log = log
+        self.dir_path = os.path.abspath(dir_path)
+        self.extracted = 0
+        self.duplicates = 0
+        self.bytes_written = 0
+
+    # fake log
+    def __fake_log(self, s, t="INFO"):
+        pass
+
+    # if the href of elem (an SVGImage) is a data: URI,
+    # decode it into a file named after its content (unless already written),
+    # set elem.file_path to its absolute path and drop the URI from elem;
+    # return True if the image was extracted
+    def extract(self, elem):
+        href = elem.href
+        if ((href is None) or (not href.startswith("data:"))):
+            return False
+        comma = href.find(",")
+        if (comma < 0):
+            self.__log("IE: Malformed data URI in image with id '%s'" % (elem.id), t="WARNING")
+            return False
+        header = href[5:comma].split(";")
+        media_type = header[0].strip().lower()
+        extension = self.EXTENSIONS.get(media_type, self.DEFAULT_EXTENSION)
+        if (not os.path.exists(self.dir_path)):
+            os.makedirs(self.dir_path)
+        handle, tmp_file_path = tempfile.mkstemp(dir=self.dir_path, prefix="ink2fxl-", suffix="." + extension)
+        f = os.fdopen(handle, "wb")
+        h = hashlib.sha1()
+        try:
+            if ("base64" in header[1:]):
+                self.__decodeBase64(href, comma + 1, f, h)
+            else:
+                data = urllib.unquote(href[comma + 1:].encode("utf-8"))
+                f.write(data)
+                h.update(data)
+        except TypeError:
+            f.close()
+            os.remove(tmp_file_path)
+            self.__log("IE: Invalid data URI in image with id '%s'" % (elem.id), t="WARNING")
+            return False
+        f.close()
+        file_name = h.hexdigest()[0:self.HASH_LENGTH] + "." + extension
+        file_path = os.path.join(self.dir_path, file_name)
+        if (os.path.exists(file_path)):
+            os.remove(tmp_file_path)
+            self.duplicates += 1
+            self.__log("IE: Image with id '%s' already written as '%s'" % (elem.id, file_name))
+        else:
+            self.bytes_written += os.path.getsize(tmp_file_path)
+            # (temporary files are created readable by the owner only)
+            os.chmod(tmp_file_path, 0644)
+            os.rename(tmp_file_path, file_path)
+            self.__log("IE: Image with id '%s' written as '%s'" % (elem.id, file_name))
+        self.extracted += 1
+        # do not keep the URI in memory
+        elem.file_path = file_path
+        elem.href = file_path
+        # (the SAX attributes are read-only: use a copy)
+        attrs = dict(elem.attrs.items())
+        attrs[(NS.XLINK, "href")] = file_path
+        elem.attrs = attrs
+        return True
+
+    # decode the base64 data of href, starting at index start,
+    # writing it to f and updating the hash h, one chunk at a time
+    # (whitespace, e.g. line breaks, is ignored)
+    def __decodeBase64(self, href, start, f, h):
+        pending = ""
+        for i in range(start, len(href), self.CHUNK_SIZE):
+            chunk = pending + "".join(href[i:i + self.CHUNK_SIZE].split())
+            usable = len(chunk) - (len(chunk) % 4)
+            data = base64.b64decode(chunk[0:usable])
+            pending = chunk[usable:]
+            f.write(data)
+            h.update(data)
+        if (len(pending) > 0):
+            # missing padding
+            data = base64.b64decode(pending + "=" * (4 - len(pending)))
+            f.write(data)
+            h.update(data)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Copy or link the images referenced by a SVG document into the output'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import hashlib, json, os, shutil, tempfile, threading, urllib, urlparse
+
+# fcntl is not available on Windows: no reflinks there
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class ImageLinker():
+
+    # how images are put in the output directory
+    MODES = ["copy", "hardlink", "reflink"]
+
+    # name of the index file, inside the index directory,
+    # followed by the hash of the path of the image directory
+    INDEX_FILE_PREFIX = "ink2fxl-links-"
+
+    # length of the hash used as file name
+    HASH_LENGTH = 20
+
+    # bytes read at a time while hashing
+    CHUNK_SIZE = 1048576
+
+    # Linux ioctl cloning a file (FICLONE), used for reflinks
+    FICLONE = 0x40049409
+
+    # initialize linker:
+    # images are put in dir_path (created if needed) with the given mode,
+    # relative hrefs are resolved against base_dir_path (the directory of the SVG file);
+    # the index of the placed files is kept in index_dir_path (created if needed),
+    # outside the output, so that it is not published with the images
+    # (no index is kept if index_dir_path is None)
+    def __init__(self, dir_path, base_dir_path, mode="copy", log=None, index_dir_path=None):
+        self.__log = self.__fake_log
+        if (log):
+            self.__log = log
+        self.dir_path = os.path.abspath(dir_path)
+        self.base_dir_path = os.path.abspath(base_dir_path)
+        self.mode = mode
+        self.index_dir_path = None
+        if (index_dir_path is not None):
+            self.index_dir_path = os.path.abspath(index_dir_path)
+        self.__lock = threading.Lock()
+        self.__index = None
+        # names of the files placed (or being placed) by this linker
+        self.__placed = set()
+        self.linked = 0
+        self.duplicates = 0
+        self.skipped = 0
+
+    # fake log
+    def __fake_log(self, s, t="INFO"):
+        pass
+
+    # get the absolute path of the local file referenced by href,
+    # or None if it is not a local file or it does not exist
+    def resolve(self, href):
+        if ((href is None) or (len(href) == 0) or (href.startswith("data:"))):
+            return None
+        scheme = urlparse.urlparse(href).scheme
+        if (scheme == "file"):
+            path = urllib.url2pathname(urlparse.urlparse(href).path)
+        elif ((len(scheme) > 1) and (not os.path.isabs(href))):
+            # remote (e.g., http:), a one-letter scheme being a Windows drive
+            return None
+        else:
+            path = urllib.unquote(href)
+        path = os.path.join(self.base_dir_path, path)
+        if (not os.path.isfile(path)):
+            self.__log("IL: Linked image '%s' not found" % (path), t="WARNING")
+            return None
+        return os.path.abspath(path)
+
+    # put the file at source_path (see resolve) in the image directory,
+    # named after its content (so identical files are put there once),
+    # returning the absolute path of the placed file;
+    # a file already placed by a previous run is skipped
+    # if its size and modification time did not change;
+    # safe to be called from several threads
+    def link(self, source_path):
+        stat = os.stat(source_path)
+        self.__lock.acquire()
+        try:
+            if (self.__index is None):
+                self.__index = self.__readIndex()
+            entry = self.__index["sources"].get(source_path)
+            if ((entry is not None) and
+                    (entry["size"] == stat.st_size) and
+                    (entry["mtime"] == stat.st_mtime) and
+                    (os.path.exists(os.path.join(self.dir_path, entry["file"])))):
+                self.skipped += 1
+                self.__log("IL: Image '%s' unchanged, skipped" % (source_path))
+                return os.path.join(self.dir_path, entry["file"])
+        finally:
+            self.__lock.release()
+
+        # hash outside the lock, so files are read in parallel
+        h = hashlib.sha1()
+        f = open(source_path, "rb")
+        data = f.read(self.CHUNK_SIZE)
+        while (len(data) > 0):
+            h.update(data)
+            data = f.read(self.CHUNK_SIZE)
+        f.close()
+        file_name = h.hexdigest()[0:self.HASH_LENGTH] + os.path.splitext(source_path)[1].lower()
+        file_path = os.path.join(self.dir_path, file_name)
+
+        self.__lock.acquire()
+        try:
+            if (not os.path.exists(self.dir_path)):
+                os.makedirs(self.dir_path)
+            duplicate = ((file_name in self.__placed) or (os.path.exists(file_path)))
+            self.__placed.add(file_name)
+            self.__index["sources"][source_path] = {"file": file_name, "size": stat.st_size, "mtime": stat.st_mtime}
+            if (duplicate):
+                self.duplicates += 1
+            else:
+                self.linked += 1
+        finally:
+            self.__lock.release()
+        if (duplicate):
+            self.__log("IL: Image '%s' already in the output as '%s'" % (source_path, file_name))
+        else:
+            # copy outside the lock, so files are copied in parallel
+            self.__place(source_path, file_path)
+            self.__log("IL: Image '%s' put in the output as '%s' (%s)" % (source_path, file_name, self.mode))
+        return file_path
+
+    # write the index of the placed files, to skip them on the next run
+    def save(self):
+        self.__lock.acquire()
+        try:
+            if ((self.__index is None) or (self.index_dir_path is None) or (not os.path.exists(self.dir_path))):
+                return
+            if (not os.path.exists(self.index_dir_path)):
+                os.makedirs(self.index_dir_path)
+            handle, tmp_file_path = tempfile.mkstemp(dir=self.index_dir_path, prefix="ink2fxl-", suffix=".json")
+            os.write(handle, json.dumps(self.__index, sort_keys=True))
+            os.close(handle)
+            os.rename(tmp_file_path, self.getIndexFilePath())
+        finally:
+            self.__lock.release()
+
+    # get the path of the index file of the image directory
+    # (None if no index is kept)
+    def getIndexFilePath(self):
+        if (self.index_dir_path is None):
+            return None
+        key = hashlib.sha1(self.dir_path.encode("utf-8")).hexdigest()[0:self.HASH_LENGTH]
+        return os.path.join(self.index_dir_path, self.INDEX_FILE_PREFIX + key + ".json")
+
+    # put source_path at file_path, according to the mode
+    # (falling back to a copy if a link cannot be made, e.g. across file systems)
+    def __place(self, source_path, file_path):
+        if (self.mode == "hardlink"):
+            try:
+                os.link(source_path, file_path)
+                return
+            except OSError, e:
+                self.__log("IL: Cannot hardlink '%s' (%s): copying it" % (source_path, e.strerror), t="WARNING")
+        elif (self.mode == "reflink"):
+            try:
+                self.__reflink(source_path, file_path)
+                return
+            except (IOError, OSError), e:
+                self.__log("IL: Cannot reflink '%s' (%s): copying it" % (source_path, e.strerror), t="WARNING")
+        # copy to a temporary file first, so that an interrupted copy
+        # is never taken for a placed file
+        handle, tmp_file_path = tempfile.mkstemp(dir=self.dir_path, prefix="ink2fxl-")
+        os.close(handle)
+        shutil.copyfile(source_path, tmp_file_path)
+        os.chmod(tmp_file_path, 0644)
+        os.rename(tmp_file_path, file_path)
+
+    # clone source_path into file_path, sharing its blocks (Linux, e.g. Btrfs or XFS)
+    @classmethod
+    def __reflink(cls, source_path, file_path):
+        if (fcntl is None):
+            raise OSError(0, "not supported on this platform")
+        source = open(source_path, "rb")
+        destination = open(file_path, "wb")
+        try:
+            fcntl.ioctl(destination.fileno(), cls.FICLONE, source.fileno())
+        except:
+            destination.close()
+            os.remove(file_path)
+            raise
+        finally:
+            source.close()
+            if (not destination.closed):
+                destination.close()
+
+    # read the index file (an empty index if missing, unreadable or not kept)
+    def __readIndex(self):
+        index = {"sources": {}}
+        index_file_path = self.getIndexFilePath()
+        if ((index_file_path is not None) and (os.path.exists(index_file_path))):
+            try:
+                f = open(index_file_path, "r")
+                index = json.load(f)
+                f.close()
+            except ValueError:
+                self.__log("IL: Index '%s' is not valid, ignoring it" % (index_file_path), t="WARNING")
+        return index
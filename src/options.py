@@ -15,6 +15,8 @@ __description__ = 'Command line options, shared by svg2htmlcss and ink2fxl'
 #
 ### END changelog ###
 
+import os, tempfile
+
 class Options():
 
     # NOTE change the following paths, depending on your OS, e.g. to 
@@ -67,6 +69,14 @@ class Options():
             "default": "false",
             "help": "Use Inkscape layer label instead of id"
         },
+        {
+            "short": None,
+            "long": "--compactids",
+            "type": "inkbool",
+            "dest": "compactids",
+            "default": "false",
+            "help": "Use short base-36 counters in generated ids"
+        },
         {
             # TODO currently ignored
             "short": None,
@@ -76,6 +86,46 @@ class Options():
             "default": "false",
             "help": "Detect layers using <svg>-><g> heuristic (IGNORED)"
         },
+        {
+            "short": None,
+            "long": "--streamingparser",
+            "type": "inkbool",
+            "dest": "streamingparser",
+            "default": "false",
+            "help": "Write output while parsing, without building the whole element tree"
+        },
+        {
+            "short": None,
+            "long": "--flattengroups",
+            "type": "inkbool",
+            "dest": "flattengroups",
+            "default": "false",
+            "help": "Remove groups without visible effect, moving their transform to their children"
+        },
+        {
+            "short": None,
+            "long": "--cullelements",
+            "type": "inkbool",
+            "dest": "cullelements",
+            "default": "false",
+            "help": "Remove elements lying outside the page or covered by an opaque rect"
+        },
+        {
+            "short": None,
+            "long": "--parsecachedirectory",
+            "type": "string",
+            "dest": "parsecachedirectory",
+            "default": "",
+            "help": "Cache the parsed SVG documents in this directory, so that unchanged documents are not parsed again"
+        },
+        {
+            "short": None,
+            "long": "--parsecachesize",
+            "type": "int",
+            "dest": "parsecachesize",
+            "default": "64",
+            "help": "Maximum size of the parse cache in MB, the least recently used documents being evicted (0 = no limit)"
+        },
         ### RASTER OPTIONS ###
         {
             "short": None,
@@ -83,8 +133,24 @@ class Options():
             "type": "string",
             "dest": "rasterformat",
             "default": "png",
-            "help": "Raster format [png|jpg|jpeg]",
-            "allowedValues": ["png", "jpg", "jpeg"]
+            "help": "Raster format [png|jpg|jpeg|auto]",
+            "allowedValues": ["png", "jpg", "jpeg", "auto"]
+        },
+        {
+            "short": None,
+            "long": "--jpegquality",
+            "type": "int",
+            "dest": "jpegquality",
+            "default": "90",
+            "help": "Quality (1-100) of JPEG raster images"
+        },
+        {
+            "short": None,
+            "long": "--rasterscales",
+            "type": "string",
+            "dest": "rasterscales",
+            "default": "1",
+            "help": "Scale factors of raster images (comma-separated, e.g. 1,2), rendered once at the largest one (requires Pillow)"
         },
         {
             "short": "-b",
@@ -102,7 +168,113 @@ class Options():
             "default": "",
             "help": "Output images in subdirectory"
         },
+        {
+            "short": None,
+            "long": "--rasterjobs",
+            "type": "int",
+            "dest": "rasterjobs",
+            "default": "0",
+            "help": "Number of raster exports running in parallel (0 = number of CPUs)"
+        },
+        {
+            "short": None,
+            "long": "--rasteranalyze",
+            "type": "inkbool",
+            "dest": "rasteranalyze",
+            "default": "true",
+            "help": "Remove fully transparent raster images and trim transparent margins (requires Pillow)"
+        },
+        {
+            "short": None,
+            "long": "--mergebackgroundlayers",
+            "type": "inkbool",
+            "dest": "mergebackgroundlayers",
+            "default": "false",
+            "help": "In mixed mode, rasterize the bottom layers up to the first layer containing text into one image"
+        },
+        {
+            "short": None,
+            "long": "--rastershareddirectory",
+            "type": "string",
+            "dest": "rastershareddirectory",
+            "default": "",
+            "help": "Store the raster images (in mixed mode) and the extracted images in this directory (relative to the current directory), shared by all the pages and without duplicates"
+        },
+        {
+            "short": None,
+            "long": "--rasteratlas",
+            "type": "inkbool",
+            "dest": "rasteratlas",
+            "default": "false",
+            "help": "In mixed mode, pack the PNG raster images of the page into atlas images (requires Pillow)"
+        },
+        {
+            "short": None,
+            "long": "--pngoptimize",
+            "type": "inkbool",
+            "dest": "pngoptimize",
+            "default": "true",
+            "help": "Optimize PNG raster images, choosing their smallest lossless encoding (requires Pillow)"
+        },
+        {
+            "short": None,
+            "long": "--pngcompresslevel",
+            "type": "int",
+            "dest": "pngcompresslevel",
+            "default": "9",
+            "help": "Compression level (0-9) of optimized PNG raster images"
+        },
+        {
+            "short": None,
+            "long": "--pngquantize",
+            "type": "int",
+            "dest": "pngquantize",
+            "default": "0",
+            "help": "Quantize optimized PNG raster images to a palette with this number of colors (lossy, 0 = no quantization)"
+        },
+        {
+            "short": None,
+            "long": "--pngdither",
+            "type": "inkbool",
+            "dest": "pngdither",
+            "default": "true",
+            "help": "Dither quantized PNG raster images (opaque images only)"
+        },
+        {
+            "short": None,
+            "long": "--extractimages",
+            "type": "inkbool",
+            "dest": "extractimages",
+            "default": "true",
+            "help": "Write images embedded as data: URIs to files named after their content, in the image subdirectory (or in the shared directory)"
+        },
+        {
+            "short": None,
+            "long": "--linkedimages",
+            "type": "string",
+            "dest": "linkedimages",
+            "default": "none",
+            "help": "Put the linked images in the image subdirectory (or in the shared directory), named after their content [none|copy|hardlink|reflink]",
+            "allowedValues": ["none", "copy", "hardlink", "reflink"]
+        },
         ### VECTOR OPTIONS ###
+        {
+            "short": None,
+            "long": "--outputprofile",
+            "type": "string",
+            "dest": "outputprofile",
+            "default": "pretty",
+            "help": "Output profile [pretty|compact]",
+            "allowedValues": ["pretty", "compact"]
+        },
+        {
+            "short": None,
+            "long": "--csstargets",
+            "type": "string",
+            "dest": "csstargets",
+            "default": "webkit",
+            "help": "In compact profile, emit only the CSS vendor prefixes of these rendering engines (comma-separated) [webkit,gecko,trident,presto]"
+        },
         {
             "short": None,
             "long": "--outputxhtmlfile",
@@ -151,6 +323,30 @@ class Options():
             "default": "false",
             "help": "Insert placeholders in XHTML code"
         },
+        {
+            "short": None,
+            "long": "--coalescenativepaths",
+            "type": "inkbool",
+            "dest": "coalescenativepaths",
+            "default": "true",
+            "help": "Put consecutive native objects into a single SVG island"
+        },
+        {
+            "short": None,
+            "long": "--sanitizenative",
+            "type": "inkbool",
+            "dest": "sanitizenative",
+            "default": "true",
+            "help": "Remove editor-only data from native SVG objects"
+        },
+        {
+            "short": None,
+            "long": "--nativeprecision",
+            "type": "int",
+            "dest": "nativeprecision",
+            "default": "3",
+            "help": "Round coordinates of native SVG objects to this number of decimal digits (-1 = do not round); the linear part of transforms keeps 3 more digits"
+        },
         ### PAGE OPTIONS ###
         {
             "short": None,
@@ -265,6 +461,28 @@ class Options():
     def getOptions(cls):
         return cls.__options
 
+    # get the directory of the bookkeeping files (e.g., indices of stored images):
+    # the parse cache directory, if any, otherwise the system temporary directory,
+    # so that they are never written into the output
+    @classmethod
+    def getCacheDirectory(cls, options):
+        dir_path = options.get("parsecachedirectory", "")
+        if (len(dir_path) == 0):
+            dir_path = tempfile.gettempdir()
+        return os.path.abspath(dir_path)
+
+    # get a regular dict with the default value of each option,
+    # e.g. to use SVGExporter as a library
+    @classmethod
+    def getDefaultOptions(cls):
+        options = {}
+        for o in cls.getOptions():
+            k = o["dest"]
+            options[k] = o["default"]
+            if (o["type"] == "inkbool"):
+                options[k] = cls.isTrue(options[k])
+        return options
+
     # read config from file
     # by reading lines formatted like
     # key=value
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Cache parsed SVG documents on disk across runs'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import hashlib, marshal, os, tempfile
+import svgelements, svgparser
+
+class ParseCache():
+
+    # version of the cached data: increase it whenever the parser
+    # changes the trees it builds or the way it calls the element constructors
+    FORMAT_VERSION = 1
+
+    # extension of the cache files, inside the cache directory
+    FILE_EXTENSION = ".tree"
+
+    # initialize cache, stored in dir_path (created if needed),
+    # evicting the least recently used files beyond max_size bytes (0 = no limit)
+    def __init__(self, dir_path, max_size=0, log=None):
+        self.__log = self.__fake_log
+        if (log):
+            self.__log = log
+        self.dir_path = os.path.abspath(dir_path)
+        self.max_size = max_size
+
+    # fake log
+    def __fake_log(self, s, t="INFO"):
+        pass
+
+    # get the key of the tree built from the SVG document data
+    # by a parser with the given needs (see svgparser.Parser)
+    def getKey(self, data, needs=None, needs_layer_contents=True):
+        h = hashlib.sha1()
+        h.update("%d %d %s " % (self.FORMAT_VERSION, marshal.version, svgparser.__version__))
+        if (needs is None):
+            h.update("all ")
+        else:
+            h.update(",".join(sorted(needs)) + " ")
+        h.update("%s " % (needs_layer_contents))
+        h.update(data)
+        return h.hexdigest()
+
+    # get the tree (the SVGSVG root) cached with the given key,
+    # or None if there is none (or it cannot be read)
+    def load(self, key):
+        file_path = self.__getFilePath(key)
+        if (not os.path.exists(file_path)):
+            self.__log("PC: Document not in the cache")
+            return None
+        try:
+            f = open(file_path, "rb")
+            records = marshal.load(f)
+            f.close()
+            root = self.__build(records)
+        except Exception, e:
+            self.__log("PC: Cache file '%s' cannot be read (%s): ignoring it" % (file_path, e), t="WARNING")
+            self.__remove(file_path)
+            return None
+        # mark as recently used
+        try:
+            os.utime(file_path, None)
+        except OSError:
+            pass
+        self.__log("PC: Document read from the cache (%d elements)" % (len(records)))
+        return root
+
+    # cache the tree rooted at root (as just built by the parser) with the given key
+    def save(self, key, root):
+        records = self.__getRecords(root)
+        if (not os.path.exists(self.dir_path)):
+            os.makedirs(self.dir_path)
+        handle, tmp_file_path = tempfile.mkstemp(dir=self.dir_path, prefix="ink2fxl-")
+        f = os.fdopen(handle, "wb")
+        try:
+            marshal.dump(records, f, marshal.version)
+        except ValueError, e:
+            f.close()
+            os.remove(tmp_file_path)
+            self.__log("PC: Document cannot be cached (%s)" % (e), t="WARNING")
+            return
+        f.close()
+        os.rename(tmp_file_path, self.__getFilePath(key))
+        self.__log("PC: Document cached (%d elements)" % (len(records)))
+        self.__evict()
+
+    # get the path of the cache file with the given key
+    def __getFilePath(self, key):
+        return os.path.join(self.dir_path, key + self.FILE_EXTENSION)
+
+    # get the elements of the tree rooted at root, as built by the parser,
+    # as a flat list of [class name, attributes, parent index, argument] records,
+    # in document order, the argument being the tag of unknown elements
+    # and the content of characters: only plain values are stored
+    # (so that marshal can be used: it is fast, and loading it runs no code)
+    # and the elements are built again by their constructors, as the parser does
+    def __getRecords(self, root):
+        records = []
+        stack = [[root, -1]]
+        while (len(stack) > 0):
+            elem, parent_index = stack.pop()
+            argument = None
+            if (isinstance(elem, svgelements.SVGUnknowElement)):
+                argument = elem.tag
+            elif (isinstance(elem, svgelements.SVGCharacters)):
+                argument = elem.content
+            records.append([elem.__class__.__name__, dict(elem.attrs.items()), parent_index, argument])
+            if (isinstance(elem, svgelements.SVGContainer)):
+                index = len(records) - 1
+                # reversed, so that the first child is popped first
+                for child in reversed(elem):
+                    stack.append([child, index])
+        return records
+
+    # build the tree from the given records (see __getRecords),
+    # returning its root: appending the elements registers their ids
+    def __build(self, records):
+        classes = {}
+        elems = []
+        for name, attrs, parent_index, argument in records:
+            if (name not in classes):
+                element_class = getattr(svgelements, name)
+                if (not issubclass(element_class, svgelements.SVGElement)):
+                    raise TypeError("%s is not an element" % (name))
+                classes[name] = element_class
+            element_class = classes[name]
+            if (element_class is svgelements.SVGUnknowElement):
+                elem = element_class(attrs, tag=tuple(argument))
+            elif (element_class is svgelements.SVGCharacters):
+                elem = element_class(argument)
+            else:
+                elem = element_class(attrs)
+            if (parent_index >= 0):
+                elems[parent_index].append(elem)
+            elems.append(elem)
+        return elems[0]
+
+    # remove the least recently used cache files,
+    # until the cache is not larger than max_size
+    def __evict(self):
+        if (self.max_size <= 0):
+            return
+        files = []
+        total_size = 0
+        for file_name in os.listdir(self.dir_path):
+            if (not file_name.endswith(self.FILE_EXTENSION)):
+                continue
+            file_path = os.path.join(self.dir_path, file_name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            files.append([stat.st_mtime, stat.st_size, file_path])
+            total_size += stat.st_size
+        files.sort()
+        while ((total_size > self.max_size) and (len(files) > 1)):
+            mtime, size, file_path = files.pop(0)
+            self.__remove(file_path)
+            total_size -= size
+            self.__log("PC: Cache file '%s' evicted" % (file_path))
+
+    # remove the given file, if it still exists
+    def __remove(self, file_path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
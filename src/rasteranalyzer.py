@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Analyze and trim exported raster images'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import os
+
+# Pillow is optional: without it, images are not analyzed
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+class RasterAnalyzer():
+
+    # an opaque image whose FLAT_ART_COLORS most frequent colors
+    # cover at least FLAT_ART_COVERAGE of its pixels is flat art (better as PNG)
+    FLAT_ART_COLORS = 16
+    FLAT_ART_COVERAGE = 0.9
+
+    # images are sampled down to this size (in pixels) before computing color statistics
+    SAMPLE_SIZE = 256
+
+    # True if raster images can be analyzed
+    @classmethod
+    def isAvailable(cls):
+        return (Image is not None)
+
+    # analyze the PNG image exported at png_path, whose top-left corner
+    # is at (rx, page_height - ry) (Inkscape coordinates, y going up):
+    # if it is fully transparent, delete it and return [None, None];
+    # otherwise, if trim is True, crop its transparent margins
+    # and return the coordinates of the cropped image
+    @classmethod
+    def process(cls, png_path, rx, ry, trim, page_size, log=None):
+        if (Image is None):
+            return [rx, ry]
+        image = Image.open(png_path)
+        image.load()
+        if (image.mode != "RGBA"):
+            image = image.convert("RGBA")
+        # the bounding box of the non-zero alpha values is computed by Pillow
+        # over the whole pixel array
+        box = image.split()[-1].getbbox()
+        if (box is None):
+            os.remove(png_path)
+            if (log):
+                log("RA: Image '%s' is fully transparent: removed" % (png_path))
+            return [None, None]
+        width, height = image.size
+        if ((trim) and (box != (0, 0, width, height))):
+            # the image covers the whole page
+            page_width, page_height = page_size
+            scale_x = float(width) / page_width
+            scale_y = float(height) / page_height
+            image.crop(box).save(png_path)
+            rx += box[0] / scale_x
+            ry -= box[1] / scale_y
+            if (log):
+                log("RA: Image '%s' trimmed from %dx%d to %dx%d" % (png_path, width, height, box[2] - box[0], box[3] - box[1]))
+        return [rx, ry]
+
+    # choose the format ("png" or "jpg") for the PNG image at png_path:
+    # PNG if it uses transparency or is mostly made of a few flat colors
+    # (line art, text), JPEG otherwise (photos, smooth gradients)
+    @classmethod
+    def chooseFormat(cls, png_path):
+        if (Image is None):
+            return "png"
+        image = Image.open(png_path)
+        image.load()
+        if (image.mode != "RGBA"):
+            image = image.convert("RGBA")
+        if (image.split()[-1].getextrema()[0] < 255):
+            return "png"
+        # the histogram is computed by Pillow, on a sample of the pixels
+        sample = image.convert("RGB")
+        width, height = sample.size
+        if ((width > cls.SAMPLE_SIZE) or (height > cls.SAMPLE_SIZE)):
+            sample = sample.resize((min(width, cls.SAMPLE_SIZE), min(height, cls.SAMPLE_SIZE)), Image.NEAREST)
+            width, height = sample.size
+        colors = sample.getcolors(width * height)
+        if (len(colors) <= 256):
+            # an exact palette is possible
+            return "png"
+        counts = sorted([c[0] for c in colors], reverse=True)
+        if (sum(counts[0:cls.FLAT_ART_COLORS]) >= cls.FLAT_ART_COVERAGE * width * height):
+            return "png"
+        return "jpg"
+
+    # write to dest_path the PNG image at png_path resized by the given factor (< 1)
+    @classmethod
+    def downsample(cls, png_path, dest_path, factor):
+        image = Image.open(png_path)
+        width, height = image.size
+        size = (max(1, int(round(width * factor))), max(1, int(round(height * factor))))
+        image.resize(size, Image.LANCZOS).save(dest_path)
+
+    # convert the PNG image at png_path into a JPEG image at jpg_path
+    # with the given quality (1-100), deleting the PNG image
+    @classmethod
+    def convertToJPEG(cls, png_path, jpg_path, quality):
+        image = Image.open(png_path)
+        image.convert("RGB").save(jpg_path, "JPEG", quality=quality, optimize=True)
+        os.remove(png_path)
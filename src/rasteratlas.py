@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Pack several raster images into atlas images'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import os
+
+# Pillow is optional: without it, images are not packed
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+class RasterAtlas():
+
+    # maximum width and height of an atlas, in pixels
+    # (larger images are decoded slowly, or not at all, by some readers)
+    MAX_SIZE = 2048
+
+    # transparent pixels between two packed images,
+    # so that scaling does not bleed one image into the other
+    PADDING = 2
+
+    # True if raster images can be packed
+    @classmethod
+    def isAvailable(cls):
+        return (Image is not None)
+
+    # compute the placement of rectangles with the given sizes ([width, height])
+    # into atlases of at most max_size x max_size pixels, using shelves
+    # filled by decreasing height;
+    # return [placements, atlas_sizes], where placements[i] is
+    # [atlas_index, x, y] for the i-th rectangle (None if it is too large)
+    # and atlas_sizes[j] is the [width, height] of the j-th atlas
+    @classmethod
+    def pack(cls, sizes, max_size=MAX_SIZE, padding=PADDING):
+        placements = [None] * len(sizes)
+        atlas_sizes = []
+        order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+        shelf_x = shelf_y = shelf_height = 0
+        for i in order:
+            width, height = sizes[i]
+            if ((width > max_size) or (height > max_size)):
+                continue
+            if ((len(atlas_sizes) > 0) and (shelf_x + width > max_size)):
+                # open a new shelf
+                shelf_y += shelf_height + padding
+                shelf_x = shelf_height = 0
+            if ((len(atlas_sizes) == 0) or (shelf_y + height > max_size)):
+                # open a new atlas
+                atlas_sizes.append([0, 0])
+                shelf_x = shelf_y = shelf_height = 0
+            placements[i] = [len(atlas_sizes) - 1, shelf_x, shelf_y]
+            atlas_size = atlas_sizes[-1]
+            atlas_size[0] = max(atlas_size[0], shelf_x + width)
+            atlas_size[1] = max(atlas_size[1], shelf_y + height)
+            shelf_x += width + padding
+            shelf_height = max(shelf_height, height)
+        return [placements, atlas_sizes]
+
+    # pack the images at file_paths into atlases, saved as
+    # atlas_path_pattern % index (e.g., "atlas-%d.png"), deleting the packed images;
+    # return [placements, atlas_paths], where placements[i] is
+    # [atlas_path, x, y, width, height] for the i-th image
+    # (None if it was not packed, e.g. because it is too large or cannot be read)
+    @classmethod
+    def build(cls, file_paths, atlas_path_pattern, log=None):
+        if ((Image is None) or (len(file_paths) < 2)):
+            return [[None] * len(file_paths), []]
+        sizes = [None] * len(file_paths)
+        readable = []
+        for i in range(len(file_paths)):
+            try:
+                image = Image.open(file_paths[i])
+            except IOError, e:
+                if (log):
+                    log("RAt: Image '%s' cannot be read (%s): not packed" % (file_paths[i], e), t="WARNING")
+                continue
+            sizes[i] = list(image.size)
+            readable.append(i)
+        placements = [None] * len(file_paths)
+        readable_placements, atlas_sizes = cls.pack([sizes[i] for i in readable])
+        for k in range(len(readable)):
+            placements[readable[k]] = readable_placements[k]
+        atlases = [Image.new("RGBA", tuple(size), (0, 0, 0, 0)) for size in atlas_sizes]
+        atlas_paths = [atlas_path_pattern % (j + 1) for j in range(len(atlas_sizes))]
+        result = []
+        for i in range(len(file_paths)):
+            if (placements[i] is None):
+                result.append(None)
+                if ((log) and (sizes[i] is not None)):
+                    log("RAt: Image '%s' too large for the atlas" % (file_paths[i]))
+                continue
+            j, x, y = placements[i]
+            image = Image.open(file_paths[i])
+            image.load()
+            if (image.mode != "RGBA"):
+                image = image.convert("RGBA")
+            atlases[j].paste(image, (x, y))
+            result.append([atlas_paths[j], x, y, sizes[i][0], sizes[i][1]])
+        for j in range(len(atlases)):
+            atlases[j].save(atlas_paths[j], optimize=True)
+            if (log):
+                log("RAt: Atlas '%s' (%dx%d) written" % (atlas_paths[j], atlas_sizes[j][0], atlas_sizes[j][1]))
+        for i in range(len(file_paths)):
+            if (placements[i] is not None):
+                os.remove(file_paths[i])
+        return [result, atlas_paths]
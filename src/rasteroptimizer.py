@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Optimize exported PNG images'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import os, threading
+from StringIO import StringIO
+
+# Pillow is optional: without it, images are not optimized
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+class RasterOptimizer():
+
+    # Pillow quantization method supporting RGBA images (fast octree)
+    QUANTIZE_METHOD = 2
+
+    # initialize optimizer:
+    # compress_level is the zlib level (0-9),
+    # colors the size of the palette of the (lossy) quantization (0 = no quantization),
+    # dither True to dither quantized images (opaque images only)
+    def __init__(self, compress_level=9, colors=0, dither=True):
+        self.compress_level = compress_level
+        self.colors = colors
+        self.dither = dither
+        self.__lock = threading.Lock()
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    # True if raster images can be optimized
+    @classmethod
+    def isAvailable(cls):
+        return (Image is not None)
+
+    # get the number of bytes saved so far
+    def getSavedBytes(self):
+        return self.bytes_before - self.bytes_after
+
+    # rewrite the PNG image at png_path with the smallest encoding among
+    # the lossless candidates (RGBA, RGB if opaque, grayscale, exact palette)
+    # and, if colors > 0, the quantized palette;
+    # the image is not rewritten if no candidate is smaller than the original
+    def optimize(self, png_path, log=None):
+        if (Image is None):
+            return
+        bytes_before = os.path.getsize(png_path)
+        image = Image.open(png_path)
+        image.load()
+        if (image.mode != "RGBA"):
+            image = image.convert("RGBA")
+        best = None
+        best_mode = None
+        for mode, candidate in self.__getCandidates(image):
+            data = self.__encode(candidate)
+            if ((best is None) or (len(data) < len(best))):
+                best = data
+                best_mode = mode
+        if (len(best) < bytes_before):
+            f = open(png_path, "wb")
+            f.write(best)
+            f.close()
+        bytes_after = min(len(best), bytes_before)
+        self.__lock.acquire()
+        self.bytes_before += bytes_before
+        self.bytes_after += bytes_after
+        self.__lock.release()
+        if (log):
+            log("RO: Image '%s' optimized from %d to %d bytes (%s)" % (png_path, bytes_before, bytes_after, best_mode))
+
+    # get the [mode, image] candidates for the given RGBA image
+    def __getCandidates(self, image):
+        candidates = [["RGBA", image]]
+        opaque = (image.split()[-1].getextrema()[0] == 255)
+        if (opaque):
+            rgb = image.convert("RGB")
+            candidates.append(["RGB", rgb])
+            gray = rgb.convert("L")
+            if (gray.convert("RGB").tobytes() == rgb.tobytes()):
+                candidates.append(["L", gray])
+        if (image.getcolors(256) is not None):
+            # at most 256 colors: the palette can be exact
+            palette = image.quantize(256, method=self.QUANTIZE_METHOD)
+            if (palette.convert("RGBA").tobytes() == image.tobytes()):
+                candidates.append(["P", palette])
+                return candidates
+        if (self.colors > 0):
+            palette = image.quantize(self.colors, method=self.QUANTIZE_METHOD)
+            if ((opaque) and (self.dither)):
+                # remap with Floyd-Steinberg dithering, using the computed palette
+                palette = image.convert("RGB").quantize(palette=palette)
+            candidates.append(["P%d" % (self.colors), palette])
+        return candidates
+
+    # encode the given image as PNG, returning its bytes
+    def __encode(self, image):
+        output = StringIO()
+        image.save(output, "PNG", compress_level=self.compress_level)
+        return output.getvalue()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Run raster exports in background threads'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import multiprocessing, threading
+import Queue
+
+class RasterJob():
+
+    # initialize job, calling function(*args) once run
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.__done = threading.Event()
+        self.__result = None
+        self.__exception = None
+
+    # get a job already completed with the given result
+    @classmethod
+    def fromResult(cls, result):
+        job = RasterJob(None, None)
+        job.__result = result
+        job.__done.set()
+        return job
+
+    # run the job (in the calling thread)
+    def run(self):
+        try:
+            self.__result = self.function(*self.args)
+        except Exception, e:
+            self.__exception = e
+        self.__done.set()
+
+    # True if the job has completed
+    def isDone(self):
+        return self.__done.is_set()
+
+    # wait for the job to complete and return its result,
+    # raising the exception raised by the job, if any
+    def getResult(self):
+        self.__done.wait()
+        if (self.__exception is not None):
+            raise self.__exception
+        return self.__result
+
+class RasterScheduler():
+
+    # initialize scheduler with the given number of worker threads
+    # (0 = as many as the CPUs, 1 = run each job when submitted)
+    def __init__(self, jobs=0, log=None):
+        self.__log = self.__fake_log
+        if (log):
+            self.__log = log
+        if (jobs <= 0):
+            try:
+                jobs = multiprocessing.cpu_count()
+            except NotImplementedError:
+                jobs = 1
+        self.jobs = jobs
+        self.__queue = None
+        self.__workers = []
+
+    # fake log
+    def __fake_log(self, s, t="INFO"):
+        pass
+
+    # submit function(*args), returning a RasterJob
+    def submit(self, function, *args):
+        job = RasterJob(function, args)
+        if (self.jobs == 1):
+            job.run()
+            return job
+        if (self.__queue is None):
+            # start the workers on first use
+            self.__queue = Queue.Queue()
+            for i in range(self.jobs):
+                worker = threading.Thread(target=self.__work)
+                worker.daemon = True
+                worker.start()
+                self.__workers.append(worker)
+            self.__log("RS: Started %d raster workers" % (self.jobs))
+        self.__queue.put(job)
+        return job
+
+    # wait for all the submitted jobs and stop the workers
+    def shutdown(self):
+        if (self.__queue is not None):
+            for worker in self.__workers:
+                self.__queue.put(None)
+            for worker in self.__workers:
+                worker.join()
+            self.__queue = None
+            self.__workers = []
+
+    # worker thread loop, None stops it
+    def __work(self):
+        while (True):
+            job = self.__queue.get()
+            if (job is None):
+                return
+            job.run()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Content-addressed store of raster images shared by several pages'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import hashlib, json, os, shutil, tempfile, threading
+
+class RasterStore():
+
+    # name of the index file, inside the index directory,
+    # followed by the hash of the path of the store directory
+    INDEX_FILE_PREFIX = "ink2fxl-index-"
+
+    # length of the hash used as file name
+    HASH_LENGTH = 20
+
+    # initialize the store in the given directory (created if needed),
+    # keeping its index in index_dir_path (created if needed; by default,
+    # the system temporary directory), outside the store, since the stored
+    # images are published, while the index must not be
+    def __init__(self, dir_path, log=None, index_dir_path=None):
+        self.__log = self.__fake_log
+        if (log):
+            self.__log = log
+        self.dir_path = os.path.abspath(dir_path)
+        if (not os.path.exists(self.dir_path)):
+            os.makedirs(self.dir_path)
+        if (index_dir_path is None):
+            index_dir_path = tempfile.gettempdir()
+        self.index_dir_path = os.path.abspath(index_dir_path)
+        if (not os.path.exists(self.index_dir_path)):
+            os.makedirs(self.index_dir_path)
+        self.__lock = threading.Lock()
+        self.__index = self.__readIndex()
+        self.hits = 0
+        self.misses = 0
+
+    # fake log
+    def __fake_log(self, s, t="INFO"):
+        pass
+
+    # get a key identifying a rendering from the given strings
+    # (e.g., serialized source subtree and raster options)
+    @classmethod
+    def getKey(cls, strings):
+        h = hashlib.sha1()
+        for s in strings:
+            if (isinstance(s, unicode)):
+                s = s.encode("utf-8")
+            h.update(s)
+            h.update("\0")
+        return h.hexdigest()
+
+    # get [absolute_file_path, rx, ry] of the image rendered from the given source key,
+    # or None if it is not in the store
+    def lookup(self, source_key):
+        self.__lock.acquire()
+        try:
+            entry = self.__index["sources"].get(source_key)
+            if (entry is not None):
+                absolute_file_path = os.path.join(self.dir_path, entry["file"])
+                if (os.path.exists(absolute_file_path)):
+                    self.hits += 1
+                    self.__log("RSt: Found rendering '%s'" % (entry["file"]))
+                    return [absolute_file_path, entry["rx"], entry["ry"]]
+            return None
+        finally:
+            self.__lock.release()
+
+    # move the rendered image at file_path into the store
+    # (deleting it if an identical image is already stored),
+    # remember it for source_key (if not None),
+    # and return the absolute path of the stored image
+    def add(self, file_path, source_key, rx, ry):
+        f = open(file_path, "rb")
+        content_hash = hashlib.sha1(f.read()).hexdigest()[0:self.HASH_LENGTH]
+        f.close()
+        file_name = content_hash + os.path.splitext(file_path)[1]
+        absolute_file_path = os.path.join(self.dir_path, file_name)
+        self.__lock.acquire()
+        try:
+            self.misses += 1
+            if (os.path.exists(absolute_file_path)):
+                os.remove(file_path)
+                self.__log("RSt: Image '%s' already stored as '%s'" % (file_path, file_name))
+            else:
+                shutil.move(file_path, absolute_file_path)
+                self.__log("RSt: Image '%s' stored as '%s'" % (file_path, file_name))
+            if (source_key is not None):
+                self.__index["sources"][source_key] = {"file": file_name, "rx": rx, "ry": ry}
+                self.__writeIndex()
+            return absolute_file_path
+        finally:
+            self.__lock.release()
+
+    # get the path of the index file of the store directory
+    def getIndexFilePath(self):
+        key = hashlib.sha1(self.dir_path.encode("utf-8")).hexdigest()[0:self.HASH_LENGTH]
+        return os.path.join(self.index_dir_path, self.INDEX_FILE_PREFIX + key + ".json")
+
+    # read the index file (an empty index if missing or unreadable)
+    def __readIndex(self):
+        index = {"sources": {}}
+        index_file_path = self.getIndexFilePath()
+        if (os.path.exists(index_file_path)):
+            try:
+                f = open(index_file_path, "r")
+                index = json.load(f)
+                f.close()
+            except ValueError:
+                self.__log("RSt: Index '%s' is not valid, ignoring it" % (index_file_path), t="WARNING")
+        return index
+
+    # write the index file atomically, merging the entries added
+    # meanwhile by other processes sharing the store
+    def __writeIndex(self):
+        index_file_path = self.getIndexFilePath()
+        on_disk = self.__readIndex()
+        on_disk["sources"].update(self.__index["sources"])
+        self.__index = on_disk
+        handle, tmp_file_path = tempfile.mkstemp(dir=self.index_dir_path, prefix="ink2fxl-", suffix=".json")
+        os.write(handle, json.dumps(self.__index, sort_keys=True))
+        os.close(handle)
+        os.rename(tmp_file_path, index_file_path)
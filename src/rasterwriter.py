@@ -16,8 +16,13 @@ __description__ = 'Produce raster output from parsed SVG'
 #
 ### END changelog ###
 
-import os, re, subprocess
+import copy, errno, os, re, subprocess, tempfile, urllib, urlparse
+from idallocator import IDAllocator
+from lxml import etree
 from options import Options
+from rasteranalyzer import RasterAnalyzer
+from rasteroptimizer import RasterOptimizer
+from rasterscheduler import RasterScheduler
 from svgelements import *
 from svghandler import SVGHandler
 
@@ -35,58 +40,78 @@ class RasterWriter(SVGHandler):
     INKSCAPE_EXPORT_ID = "--export-id"
     INKSCAPE_EXPORT_ID_ONLY = "--export-id-only"
     INKSCAPE_EXPORT_AREA_PAGE = "--export-area-page"
+    INKSCAPE_EXPORT_AREA_DRAWING = "--export-area-drawing"
+    INKSCAPE_EXPORT_DPI = "--export-dpi"
+    INKSCAPE_DEFAULT_DPI = 90.0
     INKSCAPE_AREA_PATTERN = re.compile(r"Area ([^:]*):([^:]*):([^:]*):([^ ]*) ")
 
+    # top-level elements kept when exporting a subset of the layers
+    NON_DRAWING_ELEMENTS = ["defs", "desc", "metadata", "namedview", "style", "title"]
+
+    # attributes referencing other files, made absolute when exporting a subset of the layers
+    HREF_ATTRIBUTES = ["{%s}href" % (NS.XLINK), "href"]
+
+    # only the layers (top-level <g> elements) are visited
+    PARSER_NEEDS = set(["svg", "group"])
+    PARSER_NEEDS_LAYER_CONTENTS = False
+
     # initialize writer
     def __init__(self, options, input_svg_path, log):
+        SVGHandler.__init__(self)
         self.__options = options
         self.__input_svg_path = input_svg_path
         self.__log = self.__fake_log
         if (log):
             self.__log = log
-        self.__id = 0
+        self._ids = IDAllocator(self.ELEMENT_ID_PREFIX, self.__options["compactids"])
         self.__zindex = 0
         self.__clipnames = {}
         self.__page_width = 0
         self.__page_height = 0 
         self.__svg_defs = {}
         self._exported_file_names = {}
+        if ((self.__options["rasteranalyze"]) and (not RasterAnalyzer.isAvailable())):
+            self.__log("RW: Pillow not available: raster images will not be analyzed", t="WARNING")
+        self.__scales = self.getScales(self.__options["rasterscales"], self.__log)
+        self.__optimizer = None
+        if ((self.__options["rasterformat"] == "auto") and (not RasterAnalyzer.isAvailable())):
+            self.__log("RW: Pillow not available: raster images will be PNG", t="WARNING")
+        if ((self.__options["pngoptimize"]) and (self.__options["rasterformat"] in ["png", "auto"])):
+            if (RasterOptimizer.isAvailable()):
+                self.__optimizer = RasterOptimizer(
+                        int(self.__options["pngcompresslevel"]),
+                        int(self.__options["pngquantize"]),
+                        self.__options["pngdither"]
+                )
+            else:
+                self.__log("RW: Pillow not available: PNG images will not be optimized", t="WARNING")
         self.__log("RW: initialization completed")
 
     # fake log
-    def __fake_log(self, s):
+    def __fake_log(self, s, t="INFO"):
         pass
 
     # generate a new name for the element
     def _getNewName(self, elem=None, use_label=False):
-        # always increment, so self.__id is surely unique
-        self.__id += 1
-        
-        # first attempt: create an id like "svg-000001"
-        tmp_id = self.ELEMENT_ID_PREFIX + "%06d" % self.__id
-        
+        base = None
         if (not self.__options["renameidattributes"]):
-            # try keeping using the original svg id
-            if ((elem) and (isinstance(elem, SVGElement))):
+            # try keeping using the original svg id (or the layer label)
+            if ((elem is not None) and (isinstance(elem, SVGElement))):
                 if (use_label):
-                    # use layer label
-                    tmp_id = self.ELEMENT_ID_PREFIX + elem.label
-                    # clean id
-                    tmp_id = re.sub(r"[^A-Za-z0-9-_]", "_", tmp_id)
+                    base = elem.label
                 else:
-                    # use element id
-                    tmp_id = self.ELEMENT_ID_PREFIX + elem.id
-                
-                # check that the id is indeed unique
-                i = 1
-                while (tmp_id in self._exported_file_names):
-                    tmp_id += "-%s" % str(i).zfill(6)
-                    i += 1
+                    base = elem.id
+
+        # numeric id (like "svg-000001") if base is None, otherwise derived from base,
+        # and surely unique
+        tmp_id = self._ids.allocate(base)
         
         return tmp_id
 
-    # perform output
+    # perform output, running the exports in parallel
     def getImages(self):
+        scheduler = RasterScheduler(int(self.__options["rasterjobs"]), self.__log)
+        jobs = []
         for k in self._exported_file_names.keys():
             elem_id = self._exported_file_names[k]
             od = self.__options["outputdirectory"]
@@ -95,31 +120,121 @@ class RasterWriter(SVGHandler):
                 relative_file_path = os.path.join(self.__options["rasterimagesubdirectory"], relative_file_path)
             absolute_file_path = os.path.join(od, relative_file_path)
             raster_format = self.__options["rasterformat"]
-            self.__log("RW: Exporting id '%s' to file '%s.%s' ..." % (elem_id, absolute_file_path, raster_format))
-            rx, ry = RasterWriter.exportRaster(
+            self.__log("RW: Exporting id '%s' to file '%s' ..." % (elem_id, absolute_file_path))
+            job = scheduler.submit(
+                    RasterWriter.exportRaster,
                     absolute_file_path,
                     elem_id,
                     self.__input_svg_path,
                     self.__options["rasterlayerboundingbox"],
                     raster_format, 
-                    self.__log
+                    self.__log,
+                    self.__options["rasteranalyze"],
+                    [self.__page_width, self.__page_height],
+                    self.__optimizer,
+                    int(self.__options["jpegquality"]),
+                    self.__scales
             )
-            self.__log("RW: Exporting id '%s' to file '%s.%s' ... completed" % (elem_id, absolute_file_path, raster_format))
+            jobs.append([job, k, elem_id])
+        try:
+            for job, k, elem_id in jobs:
+                try:
+                    coordinates = job.getResult()
+                except Exception, e:
+                    # a failed export does not abort the others
+                    self.__log("RW: Exporting id '%s' ... failed (%s)" % (elem_id, e), t="WARNING")
+                    continue
+                if ((coordinates is not None) and (coordinates[0] is None)):
+                    # empty image, already deleted
+                    del self._exported_file_names[k]
+                    self.__log("RW: Exporting id '%s' ... skipped (empty image)" % (elem_id))
+                    continue
+                if (coordinates is not None):
+                    self.__log("RW: Exporting id '%s' to file '%s' ... completed" % (elem_id, coordinates[2]))
+        finally:
+            scheduler.shutdown()
+        if (self.__optimizer is not None):
+            self.__log("RW: PNG optimization saved %d bytes" % (self.__optimizer.getSavedBytes()))
+
+    # write a temporary SVG file with only the given layers of the original SVG tree,
+    # returning its path (to be passed to exportLayers);
+    # the file is written to the system temporary directory, so the relative
+    # references (e.g., linked images) are made absolute, relative to the
+    # directory of the input SVG file at input_svg_path
+    @classmethod
+    def writeLayersSVG(cls, original_svg, layer_ids, input_svg_path):
+        root = original_svg
+        if (hasattr(root, "getroot")):
+            root = root.getroot()
+        root = copy.deepcopy(root)
+        for child in list(root):
+            if (not isinstance(child.tag, basestring)):
+                continue
+            if ((child.get("id") in layer_ids) or (etree.QName(child).localname in cls.NON_DRAWING_ELEMENTS)):
+                continue
+            root.remove(child)
+        base_dir_path = os.path.dirname(os.path.abspath(input_svg_path))
+        for elem in root.iter():
+            for attribute in cls.HREF_ATTRIBUTES:
+                href = elem.get(attribute)
+                if ((href is not None) and (cls.isRelativeReference(href))):
+                    elem.set(attribute, os.path.join(base_dir_path, urllib.unquote(href)))
+        handle, svg_path = tempfile.mkstemp(prefix="ink2fxl-", suffix=".svg")
+        os.write(handle, etree.tostring(root, xml_declaration=True, encoding="UTF-8"))
+        os.close(handle)
+        return svg_path
+
+    # True if the given reference is a relative path to a file,
+    # and not a fragment (e.g., "#id"), an URI with a scheme or an absolute path
+    @classmethod
+    def isRelativeReference(cls, href):
+        if ((len(href) == 0) or (href.startswith("#")) or (os.path.isabs(href))):
+            return False
+        # a one-letter scheme being a Windows drive
+        return (len(urlparse.urlparse(href).scheme) <= 1)
+
+    # export the whole drawing of the SVG written by writeLayersSVG,
+    # then delete it (see exportRaster)
+    @classmethod
+    def exportLayers(cls, dest, svg_path, crop_to_bounding_box, raster_format, log, analyze=False, page_size=None, optimizer=None, jpeg_quality=90, scales=None):
+        try:
+            return cls.exportRaster(dest, None, svg_path, crop_to_bounding_box, raster_format, log, analyze, page_size, optimizer, jpeg_quality, scales)
+        finally:
+            os.remove(svg_path)
 
     # exports the element with given id in the input SVG to a raster image
+    # (the whole drawing if elem_id is None),
+    # returning the coordinates [rx, ry] of its top-left corner (y going up)
+    # and the path of the image file, [rx, ry, file_path];
+    # if analyze is True, a fully transparent image is deleted
+    # (returning [None, None]), and if the image covers the whole page
+    # (page_size = [width, height]) its transparent margins are trimmed;
+    # if optimizer (a RasterOptimizer) is given, a PNG image is optimized;
+    # the "auto" raster format chooses PNG or JPEG (see RasterAnalyzer.chooseFormat);
+    # if scales (a sorted list of scale factors, including 1) is given,
+    # the image is rendered once at the largest scale and downsampled to the others,
+    # each written to getScaledPath(dest, scale), file_path being the one at scale 1
     @classmethod
-    def exportRaster(cls, dest, elem_id, input_svg_path, crop_to_bounding_box, raster_format, log):
+    def exportRaster(cls, dest, elem_id, input_svg_path, crop_to_bounding_box, raster_format, log, analyze=False, page_size=None, optimizer=None, jpeg_quality=90, scales=None):
         # TODO error handling
         try:
-            # make sure the output directory exists
+            # make sure the output directory exists:
+            # exports run in parallel, so another one might have just created it
             output_dir_path = os.path.dirname(dest)
             if (not os.path.exists(output_dir_path)):
-                os.makedirs(output_dir_path)
-                if (log):
-                    log("RW: Creating directory '%s'" % (str(output_dir_path)))
+                try:
+                    os.makedirs(output_dir_path)
+                    if (log):
+                        log("RW: Creating directory '%s'" % (str(output_dir_path)))
+                except OSError, e:
+                    if (e.errno != errno.EEXIST):
+                        raise
             
-            # we need to export to PNG from Inkscape first 
-            dest_png = dest + ".png"
+            # we need to export to PNG from Inkscape first,
+            # at the largest scale
+            if (scales is None):
+                scales = [1]
+            dest_png = cls.getScaledPath(dest, scales[-1]) + ".png"
 
             # TODO hidden layers are not exported correctly: they still appear as hidden
             # TODO use direct bindings?
@@ -127,13 +242,17 @@ class RasterWriter(SVGHandler):
             parameters = [
                     Options.getInkscapePath(),
                     cls.INKSCAPE_WITHOUT_GUI,
-                    cls.INKSCAPE_EXPORT_PNG, dest_png,
-                    cls.INKSCAPE_EXPORT_ID, elem_id,
-                    cls.INKSCAPE_EXPORT_ID_ONLY
+                    cls.INKSCAPE_EXPORT_PNG, dest_png
             ]
+            if (elem_id is not None):
+                parameters += [cls.INKSCAPE_EXPORT_ID, elem_id, cls.INKSCAPE_EXPORT_ID_ONLY]
             if (not crop_to_bounding_box):
                 # export the whole page, not just the bounding box
                 parameters.append(cls.INKSCAPE_EXPORT_AREA_PAGE)
+            elif (elem_id is None):
+                parameters.append(cls.INKSCAPE_EXPORT_AREA_DRAWING)
+            if (scales[-1] != 1):
+                parameters += [cls.INKSCAPE_EXPORT_DPI, "%.03f" % (cls.INKSCAPE_DEFAULT_DPI * scales[-1])]
             parameters.append(input_svg_path)
             if (log):
                 log("RW: Calling Inkscape with parameters '%s'" % (str(parameters)))
@@ -155,54 +274,129 @@ class RasterWriter(SVGHandler):
                     ry = float(m.group(4).replace(",", "."))
             if (log):
                 log("RW: Coordinates for id '%s' rx: %f ry: %f" % (elem_id, rx, ry))
-            
-            if (raster_format in ["jpg", "jpeg"]):
-                # convert to JPEG
-                dest_jpg = dest + "." + raster_format
-                # TODO use direct bindings?
-                # TODO do we need to pass other parameters?
-                convert_parameters = [
-                        Options.getConvertPath(),
-                        dest_png,
-                        dest_jpg
-                ]
+
+            if (analyze):
+                rx, ry = RasterAnalyzer.process(dest_png, rx, ry, (not crop_to_bounding_box), page_size, log)
+                if (rx is None):
+                    return [None, None]
+
+            automatic = (raster_format == "auto")
+            if (automatic):
+                raster_format = RasterAnalyzer.chooseFormat(dest_png)
                 if (log):
-                    log("RW: Calling convert with parameters '%s'" % (str(convert_parameters)))
-                p = subprocess.Popen(convert_parameters,
-                    stdout=subprocess.PIPE,
-                    stdin=subprocess.PIPE,
-                    stderr=subprocess.PIPE)
-                (stdoutdata, stderrdata) = p.communicate()
-                p.stdout.close()
-                p.stdin.close()
-                p.stderr.close()
-
-                # delete PNG
-                os.remove(dest_png)
-
-            return [rx, ry]
+                    log("RW: Raster format for id '%s': %s" % (elem_id, raster_format))
+
+            # the smaller scales, from the largest one
+            png_paths = [dest_png]
+            for scale in scales[0:-1]:
+                png_path = cls.getScaledPath(dest, scale) + ".png"
+                RasterAnalyzer.downsample(dest_png, png_path, float(scale) / scales[-1])
+                png_paths.append(png_path)
+            if ((len(png_paths) > 1) and (log)):
+                log("RW: Image '%s' downsampled to %d scales" % (dest_png, len(png_paths) - 1))
+
+            for png_path in png_paths:
+                if ((optimizer is not None) and (raster_format == "png")):
+                    optimizer.optimize(png_path, log)
+                if (raster_format in ["jpg", "jpeg"]):
+                    cls.__convertToJPEG(png_path, os.path.splitext(png_path)[0] + "." + raster_format, jpeg_quality, automatic, log)
+
+            return [rx, ry, dest + "." + raster_format]
         except:
             # TODO error handling
             if (log):
                 log("RW: Exception in exportRaster while processing id '%s'" % (elem_id))
             pass
 
-    # process <svg> element
-    def svg(self, elem):
+    # parse the comma-separated scale factors of the rasterscales option,
+    # returning them sorted, 1 included (only 1 if Pillow is not available)
+    @classmethod
+    def getScales(cls, string, log=None):
+        scales = set([1])
+        for token in string.split(","):
+            token = token.strip()
+            if (len(token) == 0):
+                continue
+            try:
+                scale = float(token)
+                if (scale <= 0):
+                    raise ValueError()
+                if (scale == int(scale)):
+                    scale = int(scale)
+                scales.add(scale)
+            except ValueError:
+                if (log):
+                    log("RW: Invalid raster scale '%s' ignored" % (token), t="WARNING")
+        if ((len(scales) > 1) and (not RasterAnalyzer.isAvailable())):
+            if (log):
+                log("RW: Pillow not available: raster images will be rendered at scale 1 only", t="WARNING")
+            scales = set([1])
+        return sorted(scales)
+
+    # get the path (without extension) of the image at the given scale:
+    # dest itself at scale 1, otherwise dest with a suffix (e.g., "svg-la-2x")
+    @classmethod
+    def getScaledPath(cls, dest, scale):
+        if (scale == 1):
+            return dest
+        return "%s-%sx" % (dest, ("%g" % (scale)).replace(".", "_"))
+
+    # convert the PNG image at png_path to JPEG, deleting the PNG image
+    # (with Pillow for the auto raster format, otherwise with convert)
+    @classmethod
+    def __convertToJPEG(cls, png_path, jpg_path, jpeg_quality, automatic, log):
+        if (automatic):
+            RasterAnalyzer.convertToJPEG(png_path, jpg_path, jpeg_quality)
+            return
+        # TODO use direct bindings?
+        # TODO do we need to pass other parameters?
+        convert_parameters = [
+                Options.getConvertPath(),
+                png_path,
+                "-quality", str(jpeg_quality),
+                jpg_path
+        ]
+        if (log):
+            log("RW: Calling convert with parameters '%s'" % (str(convert_parameters)))
+        p = subprocess.Popen(convert_parameters,
+            stdout=subprocess.PIPE,
+            stdin=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        (stdoutdata, stderrdata) = p.communicate()
+        p.stdout.close()
+        p.stdin.close()
+        p.stderr.close()
+
+        # delete PNG
+        os.remove(png_path)
+
+    # process <svg> element, before visiting children
+    def svgEnter(self, elem):
         self.__log("RW: Parsing...")
-        
+        self.__setPage(elem)
+        return True
+
+    # process <svg> element, after visiting children
+    def svgLeave(self, elem):
+        self.__log("RW: Parsing... completed")
+
+    # process the <svg> element and the list of layers found by svgparser.LayerScanner,
+    # without a parsed tree
+    def layers(self, elem, layers):
+        self.__log("RW: Processing %d layers..." % len(layers))
+        self.__setPage(elem)
+        for a in layers:
+            self.group(a)
+        self.__log("RW: Processing %d layers... completed" % len(layers))
+
+    # get page size from the <svg> element
+    def __setPage(self, elem):
         # TODO are multiple <svg> elements allowed? if so, this must go
         self.__page_width = elem.width.px()
         self.__page_height = elem.height.px()
         self.__log("RW: Page width: %fpx" % self.__page_width)
         self.__log("RW: Page height: %fpx" % self.__page_height)
 
-        # visit children 
-        for a in elem:
-            a.callHandler(self)
-        
-        self.__log("RW: Parsing... completed")
-
     # process <defs> element
     def define(self, elem):
         pass
@@ -231,8 +425,8 @@ class RasterWriter(SVGHandler):
     def arc(self, elem):
         pass
 
-    # process <g> element
-    def group(self, elem):
+    # process <g> element (children are not visited)
+    def groupEnter(self, elem):
         
         # is it a layer?
         if ((elem.groupmode) and (elem.groupmode == "layer")):
@@ -241,16 +435,16 @@ class RasterWriter(SVGHandler):
                 (not self.__options["exporthiddenlayers"])):
                 # hidden layer, and the user does not want to export it 
                 self.__log("RW: Skipping hidden layer with id '%s'" % elem.id)
-                return
+                return False
 
             # ok, we need to export this
-            name = self._getNewName(elem)
-            if ((elem.label) and (len(elem.label) > 0) and (self.__options["uselayerlabels"])):
-                name = self._getNewName(elem, True)
+            use_label = ((elem.label) and (len(elem.label) > 0) and (self.__options["uselayerlabels"]))
+            name = self._getNewName(elem, use_label)
         
             # store the layer name and its original id in the SVG document
             self._exported_file_names[name] = elem.id
             self.__log("RW: Exporting layer with id '%s' to '%s'" % (elem.id, name))
+        return False
 
     # process <text> element
     def text(self, elem):
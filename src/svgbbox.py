@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Compute bounding boxes of SVG elements'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import math, re
+from svgelements import *
+
+class SVGBoundingBox():
+
+    # approximate glyph metrics, relative to font-size
+    TEXT_CHAR_WIDTH = 0.6
+    TEXT_ASCENT = 0.8
+    TEXT_DESCENT = 0.2
+    TEXT_DEFAULT_FONT_SIZE = 12.0
+
+    __re_path_token = re.compile(r"([MmLlHhVvCcSsQqTtAaZz])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+
+    # initialize engine, with an empty cache
+    def __init__(self):
+        # id(elem) -> [elem, points], in the coordinates of elem (before its transform)
+        self.__points = {}
+        # id(elem) -> [elem, box], in the coordinates of the page
+        self.__boxes = {}
+
+    # get the bounding box [x0, y0, x1, y1] of the given element,
+    # in the coordinates of the page (stroke included, filters not),
+    # or None if the element has no (known) geometry
+    def getBox(self, elem):
+        key = id(elem)
+        if (key in self.__boxes):
+            return self.__boxes[key][1]
+        # the box of a group is computed after the boxes of its children,
+        # with an explicit stack, since groups might be deeply nested
+        stack = [[elem, False]]
+        while (len(stack) > 0):
+            node, expanded = stack.pop()
+            if (id(node) in self.__boxes):
+                continue
+            if ((not expanded) and ((isinstance(node, SVGGroup)) or (isinstance(node, SVGSVG)))):
+                stack.append([node, True])
+                stack.extend([[child, False] for child in node])
+            else:
+                self.__boxes[id(node)] = [node, self.__computeBox(node)]
+        return self.__boxes[key][1]
+
+    # compute the box of the given element (see getBox),
+    # the boxes of its children being already in the cache
+    def __computeBox(self, elem):
+        box = None
+        try:
+            if ((isinstance(elem, SVGGroup)) or (isinstance(elem, SVGSVG))):
+                for child in elem:
+                    box = self.union(box, self.__boxes[id(child)][1])
+            else:
+                points = self.getPoints(elem)
+                if (points is not None):
+                    xs, ys = self.transformPoints(self.getMatrix(elem), points[0], points[1])
+                    box = [min(xs), min(ys), max(xs), max(ys)]
+                    stroke = self.getStrokeWidth(elem) * 0.5 * self.getScale(self.getMatrix(elem))
+                    box = [box[0] - stroke, box[1] - stroke, box[2] + stroke, box[3] + stroke]
+        except (ValueError, KeyError, TypeError, IndexError, ZeroDivisionError):
+            # unsupported units or malformed (e.g., truncated) data
+            box = None
+        return box
+
+    # get the matrix mapping the coordinates of elem to the coordinates of the page
+    @classmethod
+    def getMatrix(cls, elem):
+        matrix = SVGTransform.SVGMatrix(1, 0, 0, 1, 0, 0)
+        node = elem
+        while (node is not None):
+            if (len(node.transform) > 0):
+                matrix = node.transform.toMatrix() * matrix
+            node = node.getParent()
+        return matrix
+
+    # get the points [xs, ys] whose convex hull contains the geometry of elem,
+    # in the coordinates of elem (None if unknown)
+    def getPoints(self, elem):
+        key = id(elem)
+        if (key in self.__points):
+            return self.__points[key][1]
+        points = None
+        if ((isinstance(elem, SVGRect)) or (isinstance(elem, SVGImage))):
+            points = self.__rectPoints(elem.x.px(), elem.y.px(), elem.width.px(), elem.height.px())
+        elif (isinstance(elem, SVGPathArc)):
+            points = self.__rectPoints(elem.cx.px() - elem.rx.px(), elem.cy.px() - elem.ry.px(), elem.rx.px() * 2, elem.ry.px() * 2)
+        elif (isinstance(elem, SVGText)):
+            points = self.__textPoints(elem)
+        elif (isinstance(elem, SVGNative)):
+            d = elem.attrs.get((None, "d"), None)
+            if (d is not None):
+                points = self.getPathPoints(d)
+            elif ((None, "width") in elem.attrs):
+                # native <rect>
+                points = self.__rectPoints(
+                    SVGLength(elem.attrs.get((None, "x"), "0")).px(),
+                    SVGLength(elem.attrs.get((None, "y"), "0")).px(),
+                    SVGLength(elem.attrs.get((None, "width"), "0")).px(),
+                    SVGLength(elem.attrs.get((None, "height"), "0")).px()
+                )
+        self.__points[key] = [elem, points]
+        return points
+
+    # get the stroke width of elem (0 if it has no stroke)
+    @classmethod
+    def getStrokeWidth(cls, elem):
+        style = getattr(elem, "style", {})
+        if (style.get("stroke", "none") == "none"):
+            return 0.0
+        return SVGLength(style.get("stroke-width", "1")).px()
+
+    # get an upper bound of the scale factor of the given matrix
+    @classmethod
+    def getScale(cls, matrix):
+        return max(math.hypot(matrix.a, matrix.b), math.hypot(matrix.c, matrix.d))
+
+    # apply the matrix to all the points at once
+    @classmethod
+    def transformPoints(cls, matrix, xs, ys):
+        a, b, c, d, e, f = matrix.a, matrix.b, matrix.c, matrix.d, matrix.e, matrix.f
+        txs = [a * x + c * y + e for x, y in zip(xs, ys)]
+        tys = [b * x + d * y + f for x, y in zip(xs, ys)]
+        return txs, tys
+
+    # union of two boxes (each might be None)
+    @classmethod
+    def union(cls, box1, box2):
+        if (box1 is None):
+            return box2
+        if (box2 is None):
+            return box1
+        return [min(box1[0], box2[0]), min(box1[1], box2[1]), max(box1[2], box2[2]), max(box1[3], box2[3])]
+
+    # True if the two boxes overlap
+    @classmethod
+    def intersects(cls, box1, box2):
+        return ((box1[0] < box2[2]) and (box2[0] < box1[2]) and (box1[1] < box2[3]) and (box2[1] < box1[3]))
+
+    # True if box1 contains box2
+    @classmethod
+    def contains(cls, box1, box2):
+        return ((box1[0] <= box2[0]) and (box1[1] <= box2[1]) and (box1[2] >= box2[2]) and (box1[3] >= box2[3]))
+
+    # corners of a rectangle
+    @classmethod
+    def __rectPoints(cls, x, y, width, height):
+        return [[x, x + width, x + width, x], [y, y, y + height, y + height]]
+
+    # approximate the text extent from the font size and the number of characters
+    @classmethod
+    def __textPoints(cls, elem):
+        font_size = SVGLength(elem.style.get("font-size", cls.TEXT_DEFAULT_FONT_SIZE)).px()
+        lines = []
+        x = elem.x.px()
+        y = elem.y.px()
+        for child in elem:
+            if (isinstance(child, SVGTSpan)):
+                if (child.x is not None):
+                    x = child.x.px()
+                if (child.y is not None):
+                    y = child.y.px()
+                size = SVGLength(child.style.get("font-size", font_size)).px()
+                length = sum([len(a.content) for a in child if isinstance(a, SVGCharacters)])
+                lines.append([x, y, size, length])
+            elif (isinstance(child, SVGCharacters)):
+                lines.append([x, y, font_size, len(child.content)])
+        if (len(lines) == 0):
+            return None
+        xs = []
+        ys = []
+        for x, y, size, length in lines:
+            width = length * size * cls.TEXT_CHAR_WIDTH
+            xs += [x, x + width]
+            ys += [y - size * cls.TEXT_ASCENT, y + size * cls.TEXT_DESCENT]
+        return [xs, ys]
+
+    # get the points [xs, ys] whose convex hull contains the given path data:
+    # end points and control points of lines and curves,
+    # and the parallelogram around the ellipse of each elliptical arc
+    @classmethod
+    def getPathPoints(cls, d):
+        tokens = []
+        for m in cls.__re_path_token.finditer(d):
+            if (m.group(1)):
+                tokens.append(m.group(1))
+            else:
+                tokens.append(float(m.group(2)))
+        xs = []
+        ys = []
+        x = y = 0.0
+        start_x = start_y = 0.0
+        command = None
+        i = 0
+        n = len(tokens)
+        while (i < n):
+            if (isinstance(tokens[i], basestring)):
+                command = tokens[i]
+                i += 1
+                if (command in "Zz"):
+                    x, y = start_x, start_y
+                    continue
+            if (command is None):
+                # malformed data, numbers before any command
+                raise ValueError("Bad path data")
+            relative = command.islower()
+            c = command.upper()
+            dx = x if relative else 0.0
+            dy = y if relative else 0.0
+            if (c in "MLT"):
+                x, y = tokens[i] + dx, tokens[i + 1] + dy
+                i += 2
+                xs.append(x)
+                ys.append(y)
+                if (c == "M"):
+                    start_x, start_y = x, y
+                    # subsequent pairs are lineto
+                    command = "l" if relative else "L"
+            elif (c == "H"):
+                x = tokens[i] + dx
+                i += 1
+                xs.append(x)
+                ys.append(y)
+            elif (c == "V"):
+                y = tokens[i] + dy
+                i += 1
+                xs.append(x)
+                ys.append(y)
+            elif (c in "CSQ"):
+                count = {"C": 3, "S": 2, "Q": 2}[c]
+                for k in range(count):
+                    xs.append(tokens[i + 2 * k] + dx)
+                    ys.append(tokens[i + 2 * k + 1] + dy)
+                x, y = xs[-1], ys[-1]
+                i += 2 * count
+            elif (c == "A"):
+                rx, ry, phi = abs(tokens[i]), abs(tokens[i + 1]), tokens[i + 2]
+                large_arc, sweep = tokens[i + 3], tokens[i + 4]
+                x1, y1 = tokens[i + 5] + dx, tokens[i + 6] + dy
+                i += 7
+                axs, ays = cls.__arcPoints(x, y, rx, ry, phi, large_arc, sweep, x1, y1)
+                xs += axs
+                ys += ays
+                x, y = x1, y1
+            else:
+                raise ValueError("Bad path command '%s'" % (command))
+        if (len(xs) == 0):
+            return None
+        return [xs, ys]
+
+    # corners of the parallelogram containing the ellipse of an arc segment
+    # (see SVG 1.1, appendix F.6.5)
+    @classmethod
+    def __arcPoints(cls, x0, y0, rx, ry, phi, large_arc, sweep, x1, y1):
+        if ((rx == 0) or (ry == 0)):
+            return [x0, x1], [y0, y1]
+        cos_phi = math.cos(math.radians(phi))
+        sin_phi = math.sin(math.radians(phi))
+        hx = (x0 - x1) / 2.0
+        hy = (y0 - y1) / 2.0
+        px = cos_phi * hx + sin_phi * hy
+        py = -sin_phi * hx + cos_phi * hy
+        # scale radii up if needed
+        lam = (px * px) / (rx * rx) + (py * py) / (ry * ry)
+        if (lam > 1):
+            rx *= math.sqrt(lam)
+            ry *= math.sqrt(lam)
+        num = rx * rx * ry * ry - rx * rx * py * py - ry * ry * px * px
+        den = rx * rx * py * py + ry * ry * px * px
+        coef = 0.0
+        if ((den > 0) and (num > 0)):
+            coef = math.sqrt(num / den)
+        if (bool(large_arc) == bool(sweep)):
+            coef = -coef
+        cpx = coef * rx * py / ry
+        cpy = -coef * ry * px / rx
+        cx = cos_phi * cpx - sin_phi * cpy + (x0 + x1) / 2.0
+        cy = sin_phi * cpx + cos_phi * cpy + (y0 + y1) / 2.0
+        ux, uy = rx * cos_phi, rx * sin_phi
+        vx, vy = -ry * sin_phi, ry * cos_phi
+        xs = [x0, x1, cx + ux + vx, cx + ux - vx, cx - ux + vx, cx - ux - vx]
+        ys = [y0, y1, cy + uy + vy, cy + uy - vy, cy - uy + vy, cy - uy - vy]
+        return xs, ys
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Remove invisible elements from a parsed SVG tree'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+from csscolor import CSSColor
+from svgbbox import SVGBoundingBox
+from svgelements import *
+
+class SVGCuller():
+
+    # initialize culler
+    def __init__(self, log=None):
+        self.__log = self.__fake_log
+        if (log):
+            self.__log = log
+        self.__bbox = SVGBoundingBox()
+        self.culled_off_page = []
+        self.culled_occluded = []
+
+    # fake log
+    def __fake_log(self, s, t="INFO"):
+        pass
+
+    # remove from the tree rooted at root (an SVGSVG) the elements
+    # lying completely outside the page, and the elements completely covered
+    # by an opaque rect drawn after them
+    def cull(self, root):
+        try:
+            page = [0.0, 0.0, root.width.px(), root.height.px()]
+        except KeyError:
+            # relative page size (e.g., "100%"): do not cull off page elements
+            page = None
+
+        # drawable elements, in document (i.e., painting) order
+        elements = []
+        self.__collect(root, True, elements)
+
+        # off page
+        visible = []
+        for elem, opaque_chain in elements:
+            box = self.__bbox.getBox(elem)
+            if ((page is not None) and (box is not None) and (not SVGBoundingBox.intersects(box, page))):
+                self.culled_off_page.append(elem)
+            else:
+                visible.append([elem, opaque_chain, box])
+
+        # occluded, checking from the topmost element down
+        occluders = []
+        for elem, opaque_chain, box in reversed(visible):
+            if ((box is not None) and (self.__isCovered(box, occluders))):
+                self.culled_occluded.append(elem)
+                continue
+            if ((opaque_chain) and (self.isOpaqueRect(elem))):
+                fill_box = self.__getFillBox(elem)
+                if (fill_box is not None):
+                    occluders.append(fill_box)
+
+        for elem in self.culled_off_page:
+            self.__log("SC: Culled element with id '%s': off page" % (elem.id))
+            self.__remove(elem)
+        for elem in self.culled_occluded:
+            self.__log("SC: Culled element with id '%s': occluded" % (elem.id))
+            self.__remove(elem)
+        self.__log("SC: Culled %d elements (%d off page, %d occluded) out of %d" % (
+            len(self.culled_off_page) + len(self.culled_occluded),
+            len(self.culled_off_page),
+            len(self.culled_occluded),
+            len(elements)))
+        return root
+
+    # collect the drawable elements below container, in document order,
+    # each paired with a flag telling whether all its ancestors
+    # are painted as they are (no opacity, clip, filter or hiding)
+    # (explicit stack, pushing the children reversed to keep the order)
+    def __collect(self, container, opaque_chain, elements):
+        stack = [[child, opaque_chain] for child in reversed(container)]
+        while (len(stack) > 0):
+            child, opaque_chain = stack.pop()
+            if (isinstance(child, SVGGroup)):
+                child_chain = ((opaque_chain) and (self.__isPlain(child)))
+                stack.extend([[a, child_chain] for a in reversed(child)])
+            elif ((isinstance(child, SVGRect)) or
+                    (isinstance(child, SVGPathArc)) or
+                    (isinstance(child, SVGImage)) or
+                    (isinstance(child, SVGNative))):
+                # text is never culled, since its box is only estimated
+                if ("filter" not in getattr(child, "style", {})):
+                    elements.append([child, opaque_chain])
+
+    # True if the box is contained in one of the occluders
+    @classmethod
+    def __isCovered(cls, box, occluders):
+        for occluder in occluders:
+            if (SVGBoundingBox.contains(occluder, box)):
+                return True
+        return False
+
+    # True if the given group does not alter the painting of its children
+    @classmethod
+    def __isPlain(cls, group):
+        if (group.clip_path):
+            return False
+        if (group.style.get("display", "inline") == "none"):
+            return False
+        if (group.style.get("visibility", "visible") != "visible"):
+            return False
+        if (group.style.get("filter", "none") != "none"):
+            return False
+        try:
+            return (float(group.style.get("opacity", "1")) >= 1)
+        except ValueError:
+            return False
+
+    # True if elem is a rect filled with a solid, fully opaque color,
+    # unclipped, with square corners and an axis-aligned transform
+    @classmethod
+    def isOpaqueRect(cls, elem):
+        if (not isinstance(elem, SVGRect)):
+            return False
+        if ((elem.clip_path) or (elem.rx is not None) or (elem.ry is not None)):
+            return False
+        if (not cls.__isPlain(elem)):
+            return False
+        try:
+            CSSColor(elem.style.get("fill", "#000000"))
+            if (float(elem.style.get("fill-opacity", "1")) < 1):
+                return False
+        except (TypeError, ValueError):
+            # none, url(#...), or unsupported color syntax
+            return False
+        matrix = SVGBoundingBox.getMatrix(elem)
+        return ((matrix.b == 0) and (matrix.c == 0))
+
+    # box of the filled area of a rect (stroke excluded), in page coordinates,
+    # or None if it cannot be computed
+    def __getFillBox(self, elem):
+        try:
+            xs, ys = self.__bbox.getPoints(elem)
+            xs, ys = SVGBoundingBox.transformPoints(SVGBoundingBox.getMatrix(elem), xs, ys)
+        except (ValueError, KeyError, TypeError, IndexError, ZeroDivisionError):
+            # unsupported units or malformed data
+            return None
+        return [min(xs), min(ys), max(xs), max(ys)]
+
+    # remove elem from its parent
+    @classmethod
+    def __remove(cls, elem):
+        parent = elem.getParent()
+        for i in range(len(parent)):
+            if (parent[i] is elem):
+                parent.pop(i)
+                return
@@ -20,20 +20,40 @@ from namespaces import NS
 
 # generic SVG element
 class SVGElement:
+    # name of the SVGHandler method processing this element (None if there is none),
+    # used by the handler to dispatch it (see SVGHandler.handle)
+    HANDLER = None
+
     def __init__(self, attrs, parent=None, default={}):
         self.__parent = parent
         self.__default = default
+        # cached root (see getRoot): this element or one of its ancestors,
+        # None meaning this element
         self.__root = None
         self.id = attrs.get((None,"id"), "")
         self.attrs = attrs.copy()
         self.transform = SVGTransform(attrs.get((None, "transform"), ""))
+        # transform of the ancestor groups removed by flattening (None if there are none)
+        self.inherited_transform = None
         if (attrs.has_key((NS.XLINK, "href"))):
             self.href = attrs.get((NS.XLINK, "href"))
         else:
             self.href = None
 
     def callHandler(self, handler):
-        pass
+        handler.handle(self)
+
+    # used by the streaming parser:
+    # process the element before its children are read,
+    # returning True if they must be streamed to the handler;
+    # elements which need their children are processed as a whole
+    def callEnter(self, handler):
+        return handler.enter(self)
+
+    # used by the streaming parser:
+    # process the element after its children
+    def callLeave(self, handler):
+        handler.leave(self)
     
     def getParent(self):
         return self.__parent
@@ -42,11 +62,18 @@ class SVGElement:
         self.__parent = p
         self.__root = None
 
+    # forget the cached root, when an ancestor is detached from its parent
+    def resetRoot(self):
+        self.__root = None
+
     def getRoot(self):
-        if (self.__parent):
-            self.__root = self.__parent.getRoot()
-        else:
-            self.__root = self
+        # walk up without recursion (documents might be deeply nested),
+        # jumping to the cached roots of the ancestors
+        node = self.__root or self
+        while (node.__parent is not None):
+            node = node.__parent
+            node = node.__root or node
+        self.__root = node
         return self.__root
     
     def getElementById(self, id):
@@ -59,6 +86,8 @@ class SVGContainer(SVGElement, list):
     def __init__(self, attrs, parent=None):
         SVGElement.__init__(self, attrs, parent)
         list.__init__(self)
+        # ids of the descendants, only kept by the root of the tree
+        # (so that appending an element does not update all its ancestors)
         self.__childids = {}
         
     def append(self, x):
@@ -97,58 +126,76 @@ class SVGContainer(SVGElement, list):
         x.setParent(self)
         self.__appendId(x)
     
+    # move the ids of x (just detached) and of its descendants
+    # from the root of this tree to x, which is now the root of its own tree
+    # (explicit stack, since documents might be deeply nested)
     def __removeId(self, x):
+        ids = self.getRoot().__childids
         if (x.id):
-            del self.__childids[x.id]
-        if (isinstance(x, SVGContainer)):
-            for id, child in x.__childids.iteritems():
-                del self.__childids[id]
-        if (self.getParent()):
-            self.getParent().__removeId(x)
+            ids.pop(x.id, None)
+        if (not isinstance(x, SVGContainer)):
+            return
+        stack = list(x)
+        while (len(stack) > 0):
+            node = stack.pop()
+            node.resetRoot()
+            if (node.id):
+                ids.pop(node.id, None)
+                x.__childids[node.id] = node
+            if (isinstance(node, SVGContainer)):
+                stack.extend(node)
     
+    # move the ids of x (just appended) and of its descendants
+    # to the root of this tree
     def __appendId(self, x):
-        id = x.id
-        if (id):
-            self.__childids[id] = x
-        if (isinstance(x, SVGContainer)):
-            for id, child in x.__childids.iteritems():
-                self.__childids[id] = child
-        if (self.getParent()):
-            self.getParent().__appendId(x)
+        ids = self.getRoot().__childids
+        if (x.id):
+            ids[x.id] = x
+        if ((isinstance(x, SVGContainer)) and (len(x.__childids) > 0)):
+            ids.update(x.__childids)
+            x.__childids = {}
     
+    # get the element with the given id, if it is this container
+    # or one of its descendants (None otherwise)
     def getElementById(self, id):
         if (self.id == id):
             return self
-        return self.__childids.get(id, None)
+        root = self.getRoot()
+        elem = root.__childids.get(id, None)
+        if ((elem is None) or (root is self)):
+            return elem
+        node = elem.getParent()
+        while (node is not None):
+            if (node is self):
+                return elem
+            node = node.getParent()
+        return None
 
 # <svg> element
 class SVGSVG(SVGContainer):
+    HANDLER = "svg"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
         self.x = SVGLength(attrs.get((None, "x"), "0"))
         self.y = SVGLength(attrs.get((None, "y"), "0"))
         self.width = SVGLength(attrs.get((None, "width"), "0"))
         self.height = SVGLength(attrs.get((None, "height"), "0"))
-        
-    def callHandler(self, handler):
-        handler.svg(self)
 
 # synthetic: a generic unknown element
 class SVGUnknowElement(SVGContainer):
+    HANDLER = "unknown"
+
     def __init__(self, attrs, parent=None, tag=None):
         SVGContainer.__init__(self, attrs, parent)
         self.tag = tag
-        
-    def callHandler(self, handler):
-        handler.unknown(self)
 
 # <title> element
 class SVGTitle(SVGContainer):
+    HANDLER = "title"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
-        
-    def callHandler(self, handler):
-        handler.title(self)
     
     def getTitle(self):
         title = ""
@@ -159,6 +206,8 @@ class SVGTitle(SVGContainer):
 
 # <metadata> element
 class SVGMetadata(SVGContainer):
+    HANDLER = "metadata"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
         self.__author = ""
@@ -166,9 +215,6 @@ class SVGMetadata(SVGContainer):
         self.__language = ""
         self.__license = ""
         self.__keywords = []
-        
-    def callHandler(self, handler):
-        handler.metadata(self)
     
     def __getContent(self, node):
         content = ""
@@ -232,6 +278,8 @@ class SVGMetadata(SVGContainer):
 
 # <rect> element
 class SVGRect(SVGElement):
+    HANDLER = "rect"
+
     def __init__(self, attrs, parent=None):
         SVGElement.__init__(self, attrs, parent)
         self.x = SVGLength(attrs.get((None, "x"), "0"))
@@ -248,9 +296,6 @@ class SVGRect(SVGElement):
             self.ry = None
         self.style = SVGStyle(attrs.get((None, "style"), ""))
         self.clip_path = attrs.get((None, "clip-path"), "")
-        
-    def callHandler(self, handler):
-        handler.rect(self)
 
 # no longer used
 ## <path> element
@@ -267,16 +312,17 @@ class SVGRect(SVGElement):
 
 # synthetic: simply embed a native SVG element
 class SVGNative(SVGElement):
+    HANDLER = "native"
+
     def __init__(self, attrs, parent=None):
         SVGElement.__init__(self, attrs, parent)
         self.style = SVGStyle(attrs.get((None, "style"), ""))
         self.style_raw = attrs.get((None, "style"), "")
-        
-    def callHandler(self, handler):
-        handler.native(self)
 
 # synthetic: a <path sodipodi:type="arc" ...> element
 class SVGPathArc(SVGElement):
+    HANDLER = "arc"
+
     def __init__(self, attrs, parent=None):
         SVGElement.__init__(self, attrs, parent)
         self.cx = SVGLength(attrs.get((NS.SODIPODI, "cx"), "0"))
@@ -286,12 +332,11 @@ class SVGPathArc(SVGElement):
         self.style = SVGStyle(attrs.get((None, "style"), ""))
         self.clip_path = attrs.get((None, "clip-path"), "")
         self.d = attrs.get((None, "d"), "")
-        
-    def callHandler(self, handler):
-        handler.arc(self)
 
 # <g> element
 class SVGGroup(SVGContainer):
+    HANDLER = "group"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
         self.clip_path = attrs.get((None, "clip-path"), "")
@@ -299,31 +344,28 @@ class SVGGroup(SVGContainer):
         self.label = attrs.get((NS.INKSCAPE, "label"), "")
         self.style = SVGStyle(attrs.get((None, "style"), ""))
 
-    def callHandler(self, handler):
-        handler.group(self)
-
 # <defs> element
 class SVGDefine(SVGContainer):
+    HANDLER = "define"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
-        
-    def callHandler(self, handler):
-        handler.define(self)
 
 # <text> element
 class SVGText(SVGContainer):
+    HANDLER = "text"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
         self.x = SVGLength(attrs.get((None, "x"), "0"))
         self.y = SVGLength(attrs.get((None, "y"), "0"))
         self.style = SVGStyle(attrs.get((None, "style"), ""))
         self.clip_path = attrs.get((None, "clip-path"), "")
-        
-    def callHandler(self, handler):
-        handler.text(self)
 
 # <tspan> element
 class SVGTSpan(SVGContainer):
+    HANDLER = "tspan"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
         if ((None, "x") in attrs):
@@ -336,21 +378,19 @@ class SVGTSpan(SVGContainer):
             self.y = None
         self.style = SVGStyle(attrs.get((None, "style"), ""))
         self.role = attrs.get((NS.SODIPODI, "role"))
-        
-    def callHandler(self, handler):
-        handler.tspan(self)
 
 # synthetic: a sequence of SVG characters (like text inside a <tspan>)
 class SVGCharacters(SVGElement):
+    HANDLER = "characters"
+
     def __init__(self, content, parent = None):
         SVGElement.__init__(self, {}, parent)
         self.content = content
-    
-    def callHandler(self, handler):
-        handler.characters(self)
 
 # <linearGradient> element
 class SVGLinearGradient(SVGContainer):
+    HANDLER = "linearGradient"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
         self.x1 = SVGLength(attrs.get((None, "x1"), "0"))
@@ -359,12 +399,11 @@ class SVGLinearGradient(SVGContainer):
         self.y2 = SVGLength(attrs.get((None, "y2"), "0"))
         self.gradientUnits = attrs.get((None, "gradientUnits"), "objectBoundingBox")
         self.gradientTransform = SVGTransform(attrs.get((None, "gradientTransform"), ""))
-        
-    def callHandler(self, handler):
-        handler.linearGradient(self)
 
 # <radialGradient> element
 class SVGRadialGradient(SVGContainer):
+    HANDLER = "radialGradient"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
         self.cx = SVGLength(attrs.get((None, "cx"), "0"))
@@ -374,32 +413,29 @@ class SVGRadialGradient(SVGContainer):
         self.r = SVGLength(attrs.get((None, "r"), "0"))
         self.gradientUnits = attrs.get((None, "gradientUnits"), "objectBoundingBox")
         self.gradientTransform = SVGTransform(attrs.get((None, "gradientTransform"), ""))
-        
-    def callHandler(self, handler):
-        handler.radialGradient(self)
 
 # <stop> element
 class SVGStop(SVGElement):
+    HANDLER = "stop"
+
     def __init__(self, attrs, parent=None):
         SVGElement.__init__(self, attrs, parent)
         self.offset = float(attrs.get((None, "offset"), "0"))
         self.style_raw = attrs.get((None, "style"), "")
         self.style = SVGStyle(attrs.get((None, "style"), ""))
 
-    def callHandler(self, handler):
-        handler.stop(self)
-
 # <clipPath> element
 class SVGClipPath(SVGContainer):
+    HANDLER = "clipPath"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
         self.gradientUnits = attrs.get((None, "clipPathUnits"), "objectBoundingBox")
-        
-    def callHandler(self, handler):
-        handler.clipPath(self)
 
 # <image> element
 class SVGImage(SVGElement):
+    HANDLER = "image"
+
     def __init__(self, attrs, parent=None):
         SVGElement.__init__(self, attrs, parent)
         self.x = SVGLength(attrs.get((None, "x"), "0"))
@@ -407,17 +443,15 @@ class SVGImage(SVGElement):
         self.width = SVGLength(attrs.get((None, "width"), "0"))
         self.height = SVGLength(attrs.get((None, "height"), "0"))
         self.clip_path = attrs.get((None, "clip-path"), "")
-
-    def callHandler(self, handler):
-        handler.image(self)
+        # absolute path of the image file, if extracted from a data: URI (see ImageExtractor)
+        self.file_path = None
 
 # <filter> element
 class SVGFilter(SVGContainer):
+    HANDLER = "filter"
+
     def __init__(self, attrs, parent=None):
         SVGContainer.__init__(self, attrs, parent)
-        
-    def callHandler(self, handler):
-        handler.filter(self)
 
 # <filterEffect> element
 class SVGFilterEffect(SVGElement):
@@ -570,6 +604,9 @@ class SVGTransform(list):
             return SVGTransform.SVGTranslate(-self.x, -self.y)
 
     class SVGMatrix(SVGBaseTransform):
+        # tolerance when comparing coefficients
+        EPSILON = 1e-9
+        
         def __init__(self, a, b, c, d, e, f):
             self.a = float(a)
             self.b = float(b)
@@ -602,6 +639,14 @@ class SVGTransform(list):
         def toMatrix(self):
             return self
         
+        # True if this matrix is a translation (or the identity)
+        def isTranslation(self):
+            return ((abs(self.a - 1) < self.EPSILON) and (abs(self.b) < self.EPSILON) and (abs(self.c) < self.EPSILON) and (abs(self.d - 1) < self.EPSILON))
+        
+        # True if this matrix is the identity
+        def isIdentity(self):
+            return ((self.isTranslation()) and (abs(self.e) < self.EPSILON) and (abs(self.f) < self.EPSILON))
+        
         def inverse(self):
             det = self.a * self.d - self.b * self.c
             return SVGTransform.SVGMatrix(
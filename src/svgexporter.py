@@ -14,10 +14,17 @@ __description__ = 'Converts a SVG file into XHTML+CSS'
 #
 ### END changelog ###
 
-import codecs, os, re, sys, tempfile
+import os, re, shutil, sys, tempfile, threading
 import svgparser
+from exportresult import ExportResult
+from imageextractor import ImageExtractor
+from imagelinker import ImageLinker
+from io import BytesIO
 from lxml import etree
 from options import Options
+from parsecache import ParseCache
+from svgculler import SVGCuller
+from svgflattener import SVGGroupFlattener
 from optparse import OptionParser
 from xhtmlcsswriter import XHTMLCSSWriter
 from rasterwriter import RasterWriter
@@ -26,40 +33,307 @@ from xml.sax.saxutils import quoteattr
 
 class SVGExporter():
      
-    def __init__(self, svg_file_path, options):
+    # svg_file_path is the path of the input SVG file;
+    # alternatively, pass the SVG document as svg_data (bytes)
+    # or svg_tree (lxml tree), see fromData() and fromTree(),
+    # and (optionally) its file path, used only for naming
+    def __init__(self, svg_file_path, options, svg_data=None, svg_tree=None):
         self.__svg_file_path = svg_file_path
+        self.__svg_data = svg_data
+        self.__svg_tree = svg_tree
+        self.__svg_on_disk = ((svg_data is None) and (svg_tree is None))
+        self.__temp_svg_file_path = None
+        # while rendering in a staging directory (see convert),
+        # the directory the output is written to, and whether
+        # the linked images are put there directly
+        self.__output_dir_path = None
+        self.__link_to_output = False
         self.__options = options
         self._replace_options()
         self.writer = None
         self.log_string = ""
-        self._log("Input SVG: %s" % (self.__svg_file_path))
+        self.__log_lock = threading.Lock()
+        if (self.__svg_on_disk):
+            self._log("Input SVG: %s" % (self.__svg_file_path))
+        else:
+            self._log("Input SVG: in-memory document (%s)" % (self.__svg_file_path))
         self._log("Options:")
         for k in sorted(self.__options.keys()):
             self._log(" %s: '%s'" % (k, self.__options[k]))
 
+    # create an exporter for a SVG document held in memory as bytes
+    @classmethod
+    def fromData(cls, svg_data, options, svg_file_path=None):
+        return cls(svg_file_path, options, svg_data=svg_data)
+
+    # create an exporter for a SVG document held in memory as lxml tree
+    @classmethod
+    def fromTree(cls, svg_tree, options, svg_file_path=None):
+        return cls(svg_file_path, options, svg_tree=svg_tree)
+
+    # get the input SVG document as bytes, reading the input file only once
+    def __getData(self):
+        if (self.__svg_data is None):
+            if (self.__svg_tree is not None):
+                self.__svg_data = etree.tostring(self.__svg_tree)
+            else:
+                f = open(self.__svg_file_path, "rb")
+                self.__svg_data = f.read()
+                f.close()
+        return self.__svg_data
+
+    # get the input SVG document as lxml tree
+    # (huge_tree lifts the libxml2 limit of 256 nested elements,
+    # since the SAX parsers have none and documents might be deeply nested)
+    def __getTree(self):
+        if (self.__svg_tree is None):
+            self.__svg_tree = etree.parse(BytesIO(self.__getData()), etree.XMLParser(huge_tree=True))
+        return self.__svg_tree
+
+    # get the path of a file containing the input SVG document,
+    # needed by Inkscape to export rasters:
+    # if the document is held in memory, it is written to a temporary file
+    def __getInputSVGPath(self):
+        if (self.__svg_on_disk):
+            return self.__svg_file_path
+        if (self.__temp_svg_file_path is None):
+            handle, self.__temp_svg_file_path = tempfile.mkstemp(prefix="svgexporter-", suffix=".svg")
+            f = os.fdopen(handle, "wb")
+            f.write(self.__getData())
+            f.close()
+            self._log("Input SVG written to temporary file: %s" % (self.__temp_svg_file_path))
+        return self.__temp_svg_file_path
+
+    # remove the temporary copy of the input SVG document, if any
+    def __removeTempSVG(self):
+        if (self.__temp_svg_file_path is not None):
+            try:
+                os.remove(self.__temp_svg_file_path)
+            except:
+                pass
+            self.__temp_svg_file_path = None
+
     def parse(self):
-        # get the custom representation of the input SVG document
-        f = open(self.__svg_file_path, 'r')
-        original_svg = etree.parse(f)
-        f.close()
-        parser = svgparser.Parser()
-    	parsed_svg_root = parser.parse(self.__svg_file_path)
-        
         # set the appropriate writer
         of = self.__options["outputformat"]
         self._log("Output format: %s" % of)
+        image_extractor = None
         if (of in ["vector", "mixed"]):
             self._log("Writer: XHTMLCSSWriter")
-            self.writer = XHTMLCSSWriter(self.__options, original_svg, self.__svg_file_path, self._log)
+            input_svg_path = None
+            if (of == "mixed"):
+                input_svg_path = self.__getInputSVGPath()
+            image_extractor = self.__getImageExtractor()
+            self.writer = XHTMLCSSWriter(
+                    self.__options,
+                    self.__getTree(),
+                    input_svg_path,
+                    self._log,
+                    self.__getImageLinker(),
+                    self.__output_dir_path,
+                    image_extractor
+            )
         elif (of == "raster"):
             self._log("Writer: RasterWriter")
-            self.writer = RasterWriter(self.__options, self.__svg_file_path, self._log)
+            self.writer = RasterWriter(self.__options, self.__getInputSVGPath(), self._log)
 
         # do the parsing
-        if (self.writer is not None):
+        if (of == "raster"):
+            # fast path: only the layers are needed, no element tree
+            self._log("Scanning layers...")
+            scanner = svgparser.LayerScanner()
+            svg_root, layers = scanner.scan(BytesIO(self.__getData()))
+            self.writer.layers(svg_root, layers)
+            self._log("Scanning layers... completed")
+        elif ((self.writer is not None) and (self.__options["streamingparser"])):
+            # pass the elements to the writer while parsing
+            if (self.__options["flattengroups"]):
+                self._log("Group flattening needs the whole element tree: ignored while streaming", t="WARNING")
+            if (self.__options["cullelements"]):
+                self._log("Culling needs the whole element tree: ignored while streaming", t="WARNING")
+            if ((self.__options["mergebackgroundlayers"]) and (self.__options["outputformat"] == "mixed")):
+                self._log("Merging background layers needs the whole element tree: ignored while streaming", t="WARNING")
+            if (len(self.__options["parsecachedirectory"]) > 0):
+                self._log("The parse cache needs the whole element tree: ignored while streaming", t="WARNING")
+            self._log("Parsing (streaming)...")
+            parser = svgparser.Parser(
+                    self.writer.PARSER_NEEDS,
+                    self.writer.PARSER_NEEDS_LAYER_CONTENTS,
+                    self.writer
+            )
+            parser.parse(BytesIO(self.__getData()))
+            self.__logImageExtractor(image_extractor)
+            self._log("Parsing (streaming)... completed")
+            self._log("Dispatched elements: %s" % (self.writer.getDispatchSummary()))
+        elif (self.writer is not None):
+            # get the custom representation of the input SVG document,
+            # building only the elements the writer needs
+            parsed_svg_root = self.__parseTree()
+            if (self.__options["flattengroups"]):
+                SVGGroupFlattener(self._log).flatten(parsed_svg_root)
+            if (self.__options["cullelements"]):
+                SVGCuller(self._log).cull(parsed_svg_root)
             self._log("Parsing...")
             parsed_svg_root.callHandler(self.writer)
+            self.__logImageExtractor(image_extractor)
             self._log("Parsing... completed")
+            self._log("Dispatched elements: %s" % (self.writer.getDispatchSummary()))
+
+    # get the tree of the input SVG document (the SVGSVG root),
+    # read from the parse cache, if any and if there, otherwise parsed
+    # (and then cached)
+    def __parseTree(self):
+        needs = self.writer.PARSER_NEEDS
+        needs_layer_contents = self.writer.PARSER_NEEDS_LAYER_CONTENTS
+        if (len(self.__options["parsecachedirectory"]) == 0):
+            parser = svgparser.Parser(needs, needs_layer_contents)
+            return parser.parse(BytesIO(self.__getData()))
+        parse_cache = ParseCache(
+                self.__options["parsecachedirectory"],
+                int(self.__options["parsecachesize"]) * 1048576,
+                self._log
+        )
+        key = parse_cache.getKey(self.__getData(), needs, needs_layer_contents)
+        parsed_svg_root = parse_cache.load(key)
+        if (parsed_svg_root is None):
+            parser = svgparser.Parser(needs, needs_layer_contents)
+            parsed_svg_root = parser.parse(BytesIO(self.__getData()))
+            parse_cache.save(key, parsed_svg_root)
+        return parsed_svg_root
+
+    # get the extractor of the images embedded as data: URIs
+    # (None if they are not extracted), writing the ones the writer outputs
+    # in the shared directory, if any, otherwise in the image subdirectory
+    def __getImageExtractor(self):
+        if (not self.__options["extractimages"]):
+            return None
+        return ImageExtractor(self.__getImageDirectory(), self._log)
+
+    # get the linker putting the linked images in the output
+    # (None if they are not put there), resolving their paths
+    # against the directory of the input SVG file;
+    # its index is kept in the cache directory (see Options.getCacheDirectory),
+    # unless the images are put in a staging directory (see convert)
+    def __getImageLinker(self):
+        if (self.__options["linkedimages"] == "none"):
+            return None
+        base_dir_path = os.getcwd()
+        if (self.__svg_file_path):
+            base_dir_path = os.path.dirname(os.path.abspath(self.__svg_file_path))
+        output_dir_path = None
+        if (self.__link_to_output):
+            output_dir_path = self.__output_dir_path
+        index_dir_path = None
+        staging = ((self.__output_dir_path is not None) and (not self.__link_to_output))
+        if (not staging):
+            index_dir_path = Options.getCacheDirectory(self.__options)
+        return ImageLinker(
+                self.__getImageDirectory(output_dir_path),
+                base_dir_path,
+                self.__options["linkedimages"],
+                self._log,
+                index_dir_path
+        )
+
+    # get the directory of extracted and linked images:
+    # the shared directory, if any, otherwise the image subdirectory
+    # of output_dir_path (by default, the output directory)
+    def __getImageDirectory(self, output_dir_path=None):
+        dir_path = self.__options["rastershareddirectory"]
+        if (len(dir_path) == 0):
+            if (output_dir_path is None):
+                output_dir_path = self.__options["outputdirectory"]
+            dir_path = os.path.join(output_dir_path, self.__options["rasterimagesubdirectory"])
+        return dir_path
+
+    # log the statistics of the given extractor (if not None)
+    def __logImageExtractor(self, image_extractor):
+        if ((image_extractor is not None) and (image_extractor.extracted > 0)):
+            self._log("Extracted %d embedded images (%d duplicates), %d bytes written" % (
+                image_extractor.extracted,
+                image_extractor.duplicates,
+                image_extractor.bytes_written))
+
+    # get the XHTML/CSS output of the current writer as ExportResult,
+    # with the given images
+    def getResult(self, images=None):
+        result = ExportResult(images=images, log=self.log_string)
+        of = self.__options["outputformat"]
+        if ((self.writer is not None) and (of in ["vector", "mixed"])):
+            result.xhtml_file_name = self.__options["outputxhtmlfile"]
+            if (Options.isTrue(self.__options["outputcss"])):
+                # separate CSS
+                result.xhtml = self.writer.getXHTML(cssfile=self.__options["outputcssfile"])
+                result.css = self.writer.getCSS()
+                result.css_file_name = self.__options["outputcssfile"]
+            else:
+                # CSS embedded in the XHTML
+                result.xhtml = self.writer.getXHTML()
+            result.xhtml_tree = self.writer.getXHTMLTree()
+        return result
+
+    # convert the input SVG document and return an ExportResult
+    # holding XHTML, CSS, raster images and log in memory;
+    # the output directory (and the shared directory) is written only if write is True,
+    # while raster images are rendered in a temporary directory
+    # which is removed before returning;
+    # if write is True, linked images (see ImageLinker) are put directly
+    # in the shared directory, if any, otherwise in the output directory,
+    # honouring all the linkedimages modes and keeping the index of the linked files,
+    # and they are not in the images of the result;
+    # otherwise they are put in the temporary directory and returned,
+    # as copies whatever the mode, in the images of the result
+    # (the index of the linked files is not kept)
+    def convert(self, write=False):
+        of = self.__options["outputformat"]
+        output_dir_path = self.__options["outputdirectory"]
+        shared_dir_path = self.__options["rastershareddirectory"]
+        staging_dir_path = None
+        try:
+            if ((not write) and (len(shared_dir_path) > 0)):
+                # the images go to the temporary directory, and then in the result
+                self.__options["rastershareddirectory"] = ""
+                self._log("Shared directory not used, since the output is not written: %s" % (shared_dir_path))
+            if ((of in ["mixed", "raster"]) or (self.__options["extractimages"]) or (self.__options["linkedimages"] != "none")):
+                # (embedded and linked images are put in files, too)
+                staging_dir_path = tempfile.mkdtemp(prefix="svgexporter-")
+                self.__options["outputdirectory"] = staging_dir_path
+                self.__output_dir_path = output_dir_path
+                self.__link_to_output = write
+                self._log("Rendering images in temporary directory: %s" % (staging_dir_path))
+            self.parse()
+            if ((self.writer is not None) and (of == "raster")):
+                self.writer.getImages()
+            self.__options["outputdirectory"] = output_dir_path
+            # (in mixed mode, getResult waits for the raster exports)
+            result = self.getResult()
+            if (staging_dir_path is not None):
+                result.images = self.__readImages(staging_dir_path)
+            if (write):
+                result.write(output_dir_path)
+                self._log("Output written to directory: %s" % (output_dir_path))
+            result.log = self.log_string
+            return result
+        finally:
+            self.__options["outputdirectory"] = output_dir_path
+            self.__options["rastershareddirectory"] = shared_dir_path
+            self.__output_dir_path = None
+            self.__link_to_output = False
+            if (staging_dir_path is not None):
+                shutil.rmtree(staging_dir_path, ignore_errors=True)
+            self.__removeTempSVG()
+
+    # read all the files in the given directory,
+    # returning a dict mapping their relative paths to their contents
+    def __readImages(self, dir_path):
+        images = {}
+        for root, dirs, files in os.walk(dir_path):
+            for file_name in files:
+                absolute_file_path = os.path.join(root, file_name)
+                f = open(absolute_file_path, "rb")
+                images[os.path.relpath(absolute_file_path, dir_path)] = f.read()
+                f.close()
+        return images
 
     def output(self):
         if (self.writer is not None):
@@ -67,33 +341,17 @@ class SVGExporter():
             if (not os.path.exists(output_dir_path)):
                 os.makedirs(output_dir_path) 
             # vector or mixed
+            # (in mixed mode, images are output immediately)
             of = self.__options["outputformat"]
             if (of in ["vector", "mixed"]):
-                output_xhtml_file = os.path.join(output_dir_path, self.__options["outputxhtmlfile"])
-                output_css_file = os.path.join(output_dir_path, self.__options["outputcssfile"])
-                if (Options.isTrue(self.__options["outputcss"])):
-                    # separate CSS
-                    html_data = self.writer.getXHTML(cssfile=self.__options["outputcssfile"])
-                    html = codecs.open(output_xhtml_file, "w", "utf-8")
-                    html.write(html_data)
-                    css = codecs.open(output_css_file, "w", "utf-8")
-                    css.write(self.writer.getCSS())
-                else:
-                    # CSS embedded in the XHTML
-                    html_data = self.writer.getXHTML()
-                    html = codecs.open(output_xhtml_file, "w", "utf-8")
-                    html.write(html_data)
-                
-                # in mixed mode, images are output immediately
-                #if (of == "mixed"):
-                #    # output images
-                #    self.writer.getImages()
+                self.getResult().write(output_dir_path)
 
             # raster
             if (of == "raster"):
                 # output images
                 self.writer.getImages()
             
+            self.__removeTempSVG()
             return True
         else:
             self._log("No writer selected.", t="ERROR")
@@ -114,12 +372,25 @@ class SVGExporter():
             pass
 
     # log the given string
+    # (raster exports might log from background threads)
     def _log(self, s, t="INFO"):
-        self.log_string += ("[%s] %s\n" % (t, s))
+        self.__log_lock.acquire()
+        try:
+            self.log_string += ("[%s] %s\n" % (t, s))
+        finally:
+            self.__log_lock.release()
 
     # TODO generalize this
     def _replace_options(self):
-        self.__options["pagetitle"] = self.__options["pagetitle"].replace("%f", os.path.basename(os.path.splitext(self.__svg_file_path)[0]))
+        file_name = ""
+        if (self.__svg_file_path):
+            file_name = os.path.basename(os.path.splitext(self.__svg_file_path)[0])
+        self.__options["pagetitle"] = self.__options["pagetitle"].replace("%f", file_name)
+        # the shared raster directory is relative to the current directory
+        # (not to the output directory, so that it is not published with the output)
+        shared_dir_path = self.__options.get("rastershareddirectory", "")
+        if ((shared_dir_path) and (not os.path.isabs(shared_dir_path))):
+            self.__options["rastershareddirectory"] = os.path.abspath(shared_dir_path)
 
 
 
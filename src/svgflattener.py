@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Flatten nested groups of a parsed SVG tree'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+from svgelements import *
+
+class SVGGroupFlattener():
+
+    # elements whose transform the writers apply around the element itself,
+    # compensating the transform origin of CSS: any transform of a group
+    # can be composed into them; the transform of the other elements
+    # (texts, groups, ...) is applied around a different origin,
+    # so only translations can be composed into them
+    COMPENSATED_ELEMENTS = (SVGRect, SVGPathArc, SVGImage, SVGNative)
+
+    # initialize flattener
+    def __init__(self, log=None):
+        self.__log = self.__fake_log
+        if (log):
+            self.__log = log
+        self.flattened = 0
+
+    # fake log
+    def __fake_log(self, s, t="INFO"):
+        pass
+
+    # remove the groups with no visible effect from the tree rooted at root,
+    # moving their children up and composing the group transform into them
+    def flatten(self, root):
+        depth_before = self.getDepth(root)
+        self.__flattenContainer(root)
+        depth_after = self.getDepth(root)
+        self.__log("Flattened %d groups, maximum group depth %d -> %d" % (self.flattened, depth_before, depth_after))
+        return root
+
+    # maximum nesting depth of groups below the given element
+    # (explicit stack, since this is run on deeply nested documents)
+    @classmethod
+    def getDepth(cls, elem):
+        depth = 0
+        stack = [[elem, 0]]
+        while (len(stack) > 0):
+            node, node_depth = stack.pop()
+            depth = max(depth, node_depth)
+            if (isinstance(node, SVGContainer)):
+                for child in node:
+                    if (isinstance(child, SVGGroup)):
+                        stack.append([child, node_depth + 1])
+                    else:
+                        stack.append([child, node_depth])
+        return depth
+
+    # flatten the children of the given container:
+    # the groups below it are collected with an explicit stack,
+    # then flattened deepest first, so that the children of a group
+    # are already flattened when it is hoisted
+    def __flattenContainer(self, container):
+        containers = []
+        stack = [container]
+        while (len(stack) > 0):
+            node = stack.pop()
+            containers.append(node)
+            for child in node:
+                if (isinstance(child, SVGGroup)):
+                    stack.append(child)
+        for node in reversed(containers):
+            i = 0
+            while (i < len(node)):
+                child = node[i]
+                if ((isinstance(child, SVGGroup)) and (self.isFlattenable(child))):
+                    i += self.__hoist(node, i, child)
+                else:
+                    i += 1
+
+    # move the children of the group at position index of container
+    # into container, returning the number of children moved
+    def __hoist(self, container, index, group):
+        container.pop(index)
+        children = list(group)
+        while (len(group) > 0):
+            group.pop(0)
+        matrix = group.transform.toMatrix()
+        for k, child in enumerate(children):
+            if (not matrix.isIdentity()):
+                # the engine multiplies the transforms in reverse order,
+                # so appending yields group * child
+                child.transform.extend(group.transform)
+                if (child.inherited_transform is None):
+                    child.inherited_transform = matrix
+                else:
+                    child.inherited_transform = matrix * child.inherited_transform
+                # transforms cancelling each other out are dropped,
+                # so that no identity matrix ends up in the CSS
+                if (child.transform.toMatrix().isIdentity()):
+                    del child.transform[:]
+                if (child.inherited_transform.isIdentity()):
+                    child.inherited_transform = None
+            container.insert(index + k, child)
+        self.flattened += 1
+        return len(children)
+
+    # True if the given group can be removed without visible effect
+    @classmethod
+    def isFlattenable(cls, group):
+        if (group.groupmode == "layer"):
+            return False
+        if (group.clip_path):
+            return False
+        try:
+            if (float(group.style.get("opacity", "1")) < 1):
+                return False
+        except ValueError:
+            return False
+        if (group.style.get("display", "inline") != "inline"):
+            return False
+        if (group.style.get("visibility", "visible") != "visible"):
+            return False
+        if (group.style.get("filter", "none") != "none"):
+            return False
+        try:
+            translation = group.transform.toMatrix().isTranslation()
+        except Exception:
+            return False
+        for child in group:
+            if ((not translation) and (not isinstance(child, cls.COMPENSATED_ELEMENTS))):
+                return False
+            # clip paths are expressed in the user space of the child,
+            # which would change
+            if (child.attrs.get((None, "clip-path"), "")):
+                return False
+            if ((isinstance(child, SVGGroup)) and (child.clip_path)):
+                return False
+        return True
@@ -15,18 +15,116 @@ __description__ = 'Generic abstract SVG handler (calling actual SAX handlers)'
 ### END changelog ###
 
 class SVGHandler:
+
+    # element types processed in two steps (see walk),
+    # with the names of their enter and leave methods
+    ENTER_LEAVE = {
+        "svg": ["svgEnter", "svgLeave"],
+        "group": ["groupEnter", "groupLeave"],
+    }
+
+    # element types (named after the handler methods below, e.g. "rect")
+    # the parser must build for this handler: None means all of them
+    # (the contents of <defs> are always built, as they are referenced by id)
+    PARSER_NEEDS = None
+
+    # if False, the parser does not build the contents of layers
+    PARSER_NEEDS_LAYER_CONTENTS = True
+
+    # initialize handler, with empty dispatch table and counters
+    def __init__(self):
+        # element type -> method (None if there is none), filled on first use
+        self.__methods = {}
+        # element type -> number of elements dispatched (or skipped)
+        self.dispatched = {}
+        self.skipped = {}
+
+    # True if the elements of the given type (see SVGElement.HANDLER)
+    # are processed by this handler, according to PARSER_NEEDS
+    def isNeeded(self, name):
+        return ((self.PARSER_NEEDS is None) or (name is None) or (name in self.PARSER_NEEDS))
+
+    # process x with the method named after its type (see SVGElement.HANDLER);
+    # elements not needed (see isNeeded) are skipped, with their children
+    def handle(self, x):
+        name = x.HANDLER
+        if (self.__count(name)):
+            method = self.__getMethod(name)
+            if (method is not None):
+                method(x)
+
+    # process x before its children (see walk),
+    # returning True if they must be visited:
+    # the elements with no enter step are processed as a whole
+    def enter(self, x):
+        name = x.HANDLER
+        if (not self.__count(name)):
+            return False
+        if (name in self.ENTER_LEAVE):
+            return self.__getMethod(self.ENTER_LEAVE[name][0])(x)
+        method = self.__getMethod(name)
+        if (method is not None):
+            method(x)
+        return False
+
+    # process x after its children (see walk)
+    def leave(self, x):
+        name = x.HANDLER
+        if ((name in self.ENTER_LEAVE) and (self.isNeeded(name))):
+            self.__getMethod(self.ENTER_LEAVE[name][1])(x)
+
+    # get the number of dispatched elements, by type, as string
+    # (e.g., "group 3, rect 12"), followed by the skipped ones, if any
+    def getDispatchSummary(self):
+        summary = ", ".join(["%s %d" % (name, self.dispatched[name]) for name in sorted(self.dispatched)])
+        if (len(self.skipped) > 0):
+            summary += "; skipped: " + ", ".join(["%s %d" % (name, self.skipped[name]) for name in sorted(self.skipped)])
+        return summary
+
+    # count an element of the given type as dispatched (returning True)
+    # or as skipped (returning False)
+    def __count(self, name):
+        if (self.isNeeded(name)):
+            self.dispatched[name] = self.dispatched.get(name, 0) + 1
+            return True
+        self.skipped[name] = self.skipped.get(name, 0) + 1
+        return False
+
+    # get the method processing the elements of the given type,
+    # looked up once per type
+    def __getMethod(self, name):
+        if (name not in self.__methods):
+            method = None
+            if (name is not None):
+                method = getattr(self, name, None)
+            self.__methods[name] = method
+        return self.__methods[name]
+
+    # <svg> and <g> are processed in two steps,
+    # before (enter) and after (leave) their children,
+    # so that the streaming parser can call them while reading the document
     def svg(self, x):
+        self.walk(x)
+
+    # return True if the children must be visited
+    def svgEnter(self, x):
+        return True
+
+    def svgLeave(self, x):
         pass
-        #for a in x:
-        #    a.callHandler(self)
     
     def title(self, x):
         pass
     
     def group(self, x):
+        self.walk(x)
+
+    # return True if the children must be visited
+    def groupEnter(self, x):
+        return True
+
+    def groupLeave(self, x):
         pass
-        #for a in x:
-        #    a.callHandler(self)
     
     def define(self, x):
         pass
@@ -81,3 +179,24 @@ class SVGHandler:
     def unknown(self, x):
         pass
 
+    # visit the subtree rooted at x (a <svg> or <g>, already dispatched)
+    # in document order, with an explicit stack instead of recursion,
+    # so that deeply nested groups do not hit the recursion limit:
+    # each element is entered (see enter), its children are visited
+    # if enter returns True, then it is left (see leave)
+    def walk(self, x):
+        if (not self.__getMethod(self.ENTER_LEAVE[x.HANDLER][0])(x)):
+            self.leave(x)
+            return
+        stack = [[x, iter(x)]]
+        while (len(stack) > 0):
+            elem, children = stack[-1]
+            child = next(children, None)
+            if (child is None):
+                stack.pop()
+                self.leave(elem)
+            elif (self.enter(child)):
+                stack.append([child, iter(child)])
+            else:
+                self.leave(child)
+
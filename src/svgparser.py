@@ -20,24 +20,101 @@ from svgelements import *
 
 class Parser:
     # initialize everything!
-    def __init__(self):
+    # needs and needs_layer_contents describe which elements
+    # the handler (writer) will visit, see SVGHandler.PARSER_NEEDS;
+    # if stream_handler is given, elements are passed to it
+    # while the document is read, see SVGContentHandler
+    def __init__(self, needs=None, needs_layer_contents=True, stream_handler=None):
         self.__parser = xml.sax.make_parser()
-        self.__handler = SVGContentHandler()
+        self.__handler = SVGContentHandler(needs, needs_layer_contents, stream_handler)
         self.__parser.setContentHandler(self.__handler)
         self.__parser.setFeature(xml.sax.handler.feature_external_ges, False)
         self.__parser.setFeature(xml.sax.handler.feature_namespaces, True)
         
     # parse the SVG document and
     # return a pointer to the <svg> root element
+    # (in streaming mode, only <svg>, <g> and <defs> are kept in the tree)
     def parse(self, data):
         self.__parser.parse(data)
         return self.__handler.getSVGRoot()
     
 
-class SVGContentHandler(xml.sax.handler.ContentHandler):
+# stream a SVG document to find its (top-level) layers,
+# without building the element tree:
+# used in raster mode, which only needs id, label and display state of the layers
+class LayerScanner:
     def __init__(self):
+        self.__parser = xml.sax.make_parser()
+        self.__handler = LayerContentHandler()
+        self.__parser.setContentHandler(self.__handler)
+        self.__parser.setFeature(xml.sax.handler.feature_external_ges, False)
+        self.__parser.setFeature(xml.sax.handler.feature_namespaces, True)
+
+    # scan the SVG document and
+    # return the <svg> root element and the list of layers,
+    # both without children
+    def scan(self, data):
+        self.__parser.parse(data)
+        return [self.__handler.getSVGRoot(), self.__handler.getLayers()]
+
+
+class LayerContentHandler(xml.sax.handler.ContentHandler):
+    def __init__(self):
+        self.__depth = 0
+        self.__svg_root = None
+        self.__layers = []
+
+    def startElementNS(self, name, qname, attrs):
+        self.__depth += 1
+        if (self.__depth == 1):
+            if (name == (NS.SVG, "svg")):
+                self.__svg_root = SVGSVG(attrs)
+        elif ((self.__depth == 2) and
+                (name == (NS.SVG, "g")) and
+                (attrs.get((NS.INKSCAPE, "groupmode"), "") == "layer")):
+            # the layer contents (deeper elements) are ignored
+            self.__layers.append(SVGGroup(attrs))
+
+    def endElementNS(self, name, qname):
+        self.__depth -= 1
+
+    def getSVGRoot(self):
+        return self.__svg_root
+
+    def getLayers(self):
+        return self.__layers
+
+
+# In streaming mode, elements are passed to the handler while they are read,
+# instead of building the whole tree first:
+# * <svg> and <g> are entered at their start tag (see SVGElement.callEnter),
+#   and their children are streamed one by one;
+# * other elements with no children (rect, arc, native, image)
+#   are handled at their start tag, and not kept in the tree;
+# * other containers (text, defs, ...) are built and handled at their end tag;
+#   <defs> stay in the tree, so that their contents can be found by id.
+# If an element references (url(#...)) an id which has not been read yet,
+# handling is deferred until the end of the document for it
+# and for all the following elements, so that the output order does not change.
+class SVGContentHandler(xml.sax.handler.ContentHandler):
+    __url_re = re.compile(r"url\(#([^)]*)\)")
+
+    def __init__(self, needs=None, needs_layer_contents=True, stream_handler=None):
         self.__container = None
         self.__svg_root = None
+        self.__needs = needs
+        self.__needs_layer_contents = needs_layer_contents
+        # depth inside a subtree which is not built
+        self.__skip_depth = 0
+        # depth inside <defs>, whose contents are always built
+        self.__defs_depth = 0
+        # streaming mode
+        self.__stream = stream_handler
+        self.__live = set()
+        self.__buffer_root = None
+        self.__buffer_parent = None
+        self.__deferred = False
+        self.__pending = []
         self.__elements = {
             "rect": SVGRect,
             "g": SVGGroup,
@@ -57,53 +134,191 @@ class SVGContentHandler(xml.sax.handler.ContentHandler):
         }
         
     def startElementNS(self, name, qname, attrs):
+        if (self.__skip_depth > 0):
+            # inside a subtree which is not built
+            self.__skip_depth += 1
+            return
+
+        element = self.__getElementClass(name, attrs)
+        if (not self.__isNeeded(element)):
+            # the handler will never visit this subtree: skip it
+            self.__skip_depth = 1
+            return
+
+        if (element == SVGSVG):
+            self.__container = SVGSVG(attrs)
+            self.__svg_root = self.__container
+            if (self.__stream is not None):
+                self.__enter(self.__container)
+            return
+
+        if (element == SVGUnknowElement):
+            e = SVGUnknowElement(attrs, tag=name)
+        else:
+            e = element(attrs)
+        is_container = isinstance(e, SVGContainer)
+
+        if ((self.__stream is not None) and (self.__isLive(self.__container))):
+            # streaming, and the parent has already been passed to the handler
+            parent = self.__container
+            if (self.__deferred):
+                parent.append(e)
+                self.__pending.append(["handle", e])
+            elif (isinstance(e, SVGGroup)):
+                parent.append(e)
+                if (not self.__enter(e)):
+                    return
+            elif (not is_container):
+                e.setParent(parent)
+                self.__handle(e)
+                return
+            else:
+                if (isinstance(e, SVGText)):
+                    # built detached from the tree, handled at its end tag
+                    self.__buffer_parent = parent
+                else:
+                    parent.append(e)
+                    self.__buffer_parent = None
+                self.__buffer_root = e
+        else:
+            self.__container.append(e)
+
+        if (is_container):
+            self.__container = e
+            if (element == SVGDefine):
+                self.__defs_depth += 1
+
+    # get the class of the element to be built for the given tag
+    def __getElementClass(self, name, attrs):
         s =  attrs.get((None, "style"), "")
         if ((s) and ("filter:url" in s)):
             # we have a filter: export as native SVG
             if ((name[0] == NS.SVG) and (name[1] in ["rect", "path"])):
-                self.__container.append(SVGNative(attrs))
-            else:
-                # unknown
-                e = SVGUnknowElement(attrs, tag=name)
-                self.__container.append(e)
-                self.__container = e
-        elif (name == (NS.SVG, "path")):
+                return SVGNative
+            # unknown
+            return SVGUnknowElement
+        if (name == (NS.SVG, "path")):
             type = attrs.get((NS.SODIPODI, "type"), "")
             if (type == "arc"):
                 # <path sodipodi:type="arc" ...> element
-                self.__container.append(SVGPathArc(attrs))
-            else:
-                # native path
-                self.__container.append(SVGNative(attrs))
-        else:
-            # no filter here
-            if (name == (NS.SVG, "svg")):
-                self.__container = SVGSVG(attrs)
-                self.__svg_root = self.__container
-            elif ((name[0] == NS.SVG) and (name[1] in self.__elements)):
-                element = self.__elements[name[1]]
-                e = element(attrs)
-                self.__container.append(e)
-                if issubclass(element, SVGContainer):
-                    self.__container = e
-            else:
-                e = SVGUnknowElement(attrs, tag=name)
-                self.__container.append(e)
-                self.__container = e
+                return SVGPathArc
+            # native path
+            return SVGNative
+        # no filter here
+        if (name == (NS.SVG, "svg")):
+            return SVGSVG
+        if ((name[0] == NS.SVG) and (name[1] in self.__elements)):
+            return self.__elements[name[1]]
+        return SVGUnknowElement
+
+    # check whether an element of the given class must be built
+    def __isNeeded(self, element):
+        if ((element == SVGSVG) or (self.__defs_depth > 0)):
+            # the root, and the contents of <defs>, referenced by id
+            return True
+        if ((not self.__needs_layer_contents) and
+                (isinstance(self.__container, SVGGroup)) and
+                (self.__container.groupmode == "layer")):
+            return False
+        if ((self.__needs is None) or (element.HANDLER is None)):
+            return True
+        return (element.HANDLER in self.__needs)
 
     def endElementNS(self, name, qname):
+        if (self.__skip_depth > 0):
+            self.__skip_depth -= 1
+            return
         if ((name[0] == NS.SVG) and 
                 (name[1] in self.__elements) and
                 (issubclass(self.__elements[name[1]], SVGContainer))):
-            self.__container = self.__container.getParent()
+            self.__pop()
         elif (isinstance(self.__container, SVGUnknowElement) and
                 (self.__container.tag == name)):
-            self.__container = self.__container.getParent()
+            self.__pop()
+        elif ((name == (NS.SVG, "svg")) and
+                (self.__container is self.__svg_root)):
+            self.__pop()
+
+    # close the current container
+    def __pop(self):
+        e = self.__container
+        if (isinstance(e, SVGDefine)):
+            self.__defs_depth -= 1
+        if ((self.__stream is not None) and (e is self.__buffer_root)):
+            # a buffered container is complete: handle it
+            self.__buffer_root = None
+            if (self.__buffer_parent is not None):
+                e.setParent(self.__buffer_parent)
+            self.__container = e.getParent()
+            self.__handle(e)
+        elif ((self.__stream is not None) and (self.__isLive(e))):
+            # an entered container is complete: leave it
+            self.__live.discard(id(e))
+            self.__container = e.getParent()
+            if (self.__deferred):
+                self.__pending.append(["leave", e])
+            else:
+                e.callLeave(self.__stream)
+        else:
+            self.__container = e.getParent()
+        if ((self.__stream is not None) and (e is self.__svg_root)):
+            self.__flush()
+
+    # streaming: is the given container passed to the handler,
+    # with its children being streamed?
+    def __isLive(self, e):
+        return ((e is not None) and (id(e) in self.__live))
+
+    # streaming: pass a <svg> or <g> to the handler before its children
+    # returning True if its children must be streamed
+    def __enter(self, e):
+        if (self.__deferred or self.__hasForwardReferences(e)):
+            # will be handled (as a whole) at the end of the document
+            self.__deferred = True
+            self.__pending.append(["handle", e])
+            self.__container = e
+            return False
+        if (e.callEnter(self.__stream)):
+            self.__live.add(id(e))
+            self.__container = e
+            return True
+        e.callLeave(self.__stream)
+        # the handler does not need the children
+        self.__skip_depth = 1
+        return False
+
+    # streaming: pass a complete element to the handler
+    def __handle(self, e):
+        if ((not self.__deferred) and (self.__hasForwardReferences(e))):
+            self.__deferred = True
+        if (self.__deferred):
+            self.__pending.append(["handle", e])
+        else:
+            e.callHandler(self.__stream)
+
+    # streaming: handle the deferred elements, in document order
+    def __flush(self):
+        for action, e in self.__pending:
+            if (action == "handle"):
+                e.callHandler(self.__stream)
+            else:
+                e.callLeave(self.__stream)
+        self.__pending = []
+
+    # streaming: does the element reference an id not read yet?
+    def __hasForwardReferences(self, e):
+        references = e.attrs.get((None, "style"), "") + e.attrs.get((None, "clip-path"), "")
+        for m in SVGContentHandler.__url_re.finditer(references):
+            if (self.__svg_root.getElementById(m.group(1)) is None):
+                return True
+        return False
     
     def characters(self, content):
+        if ((self.__skip_depth > 0) or
+                ((self.__needs is not None) and ("characters" not in self.__needs))):
+            return
         if isinstance(self.__container, (SVGTSpan, SVGTitle, SVGUnknowElement)):
             self.__container.append(SVGCharacters(content))
     
     def getSVGRoot(self):
         return self.__svg_root
-
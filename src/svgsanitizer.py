@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__license__     = 'MIT'
+__author__      = 'Alberto Pettarin (alberto@albertopettarin.it)'
+__copyright__   = '2014-2015 Alberto Pettarin (alberto@albertopettarin.it)'
+__version__     = 'v0.0.3'
+__date__        = '2015-01-31'
+__description__ = 'Strip editor-only data from native SVG nodes'
+
+### BEGIN changelog ###
+#
+# 0.0.4 unreleased Initial release
+#
+### END changelog ###
+
+import re
+from lxml import etree
+from namespaces import NS
+
+class SVGSanitizer():
+
+    # namespaces used only by the editor
+    EDITOR_NAMESPACES = [NS.INKSCAPE, NS.SODIPODI]
+
+    # attributes whose numbers get rounded
+    ROUNDED_ATTRIBUTES = [
+        "d",
+        "x1",
+        "y1",
+        "x2",
+        "y2",
+        "cx",
+        "cy",
+        "fx",
+        "fy",
+        "r"
+    ]
+
+    # attributes holding transforms, whose linear part (scale, rotation, skew)
+    # keeps LINEAR_EXTRA_DIGITS more digits than the translation part,
+    # since its rounding error is multiplied by the coordinates
+    TRANSFORM_ATTRIBUTES = [
+        "transform",
+        "gradientTransform",
+        "patternTransform"
+    ]
+    LINEAR_EXTRA_DIGITS = 3
+
+    # positions of the translation parameters of each transform function
+    TRANSFORM_TRANSLATIONS = {
+        "matrix": [4, 5],
+        "translate": [0, 1],
+        "rotate": [1, 2],
+        "scale": [],
+        "skewX": [],
+        "skewY": []
+    }
+
+    # style properties set to their initial value
+    DEFAULT_STYLE = {
+        "display": "inline",
+        "enable-background": "accumulate",
+        "fill-opacity": "1",
+        "fill-rule": "nonzero",
+        "font-stretch": "normal",
+        "font-style": "normal",
+        "font-variant": "normal",
+        "font-weight": "normal",
+        "letter-spacing": "normal",
+        "marker": "none",
+        "opacity": "1",
+        "stop-opacity": "1",
+        "stroke": "none",
+        "stroke-dasharray": "none",
+        "stroke-dashoffset": "0",
+        "stroke-linecap": "butt",
+        "stroke-linejoin": "miter",
+        "stroke-miterlimit": "4",
+        "stroke-opacity": "1",
+        "stroke-width": "1",
+        "visibility": "visible",
+        "word-spacing": "normal"
+    }
+
+    __re_number = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+    __re_transform = re.compile(r"([A-Za-z]+)(\s*\()([^)]*)")
+
+    # path data tokens: a command, a number, or a single-digit arc flag
+    __re_path_command = re.compile(r"[\s,]*([MmZzLlHhVvCcSsQqTtAa])")
+    __re_path_number = re.compile(r"[\s,]*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+    __re_path_flag = re.compile(r"[\s,]*([01])")
+
+    # number of parameters of each path command
+    # and the positions of the flags among them (arcs only)
+    PATH_PARAMETERS = {"m": 2, "z": 0, "l": 2, "h": 1, "v": 1, "c": 6, "s": 4, "q": 4, "t": 2, "a": 7}
+    PATH_FLAGS = {"a": [3, 4]}
+
+    # initialize sanitizer
+    # precision is the number of decimal digits kept (negative = do not round)
+    def __init__(self, precision=3):
+        self.precision = precision
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    # sanitize the given (copied) node in place, and return it
+    def sanitize(self, node):
+        self.bytes_before += len(etree.tostring(node))
+        self.__sanitizeNode(node, set())
+        etree.cleanup_namespaces(node)
+        self.bytes_after += len(etree.tostring(node))
+        return node
+
+    # number of bytes saved so far
+    def getSavedBytes(self):
+        return self.bytes_before - self.bytes_after
+
+    # sanitize node and its descendants;
+    # inherited contains the style properties set by the ancestors (inside the copy),
+    # which must be kept on descendants even if they have their initial value;
+    # the tree is visited with an explicit stack, so deep trees do not hit the recursion limit
+    def __sanitizeNode(self, node, inherited):
+        stack = [(node, inherited)]
+        while (len(stack) > 0):
+            node, inherited = stack.pop()
+            for child in list(node):
+                if ((not isinstance(child.tag, basestring)) or (self.__isEditorName(child.tag))):
+                    # comments, processing instructions, editor elements
+                    self.__removeNode(child)
+            for name in list(node.attrib.keys()):
+                if (self.__isEditorName(name)):
+                    del node.attrib[name]
+                elif ((name == "d") and (self.precision >= 0)):
+                    node.attrib[name] = self.roundPathData(node.attrib[name], self.precision)
+                elif ((name in self.TRANSFORM_ATTRIBUTES) and (self.precision >= 0)):
+                    node.attrib[name] = self.roundTransform(node.attrib[name], self.precision)
+                elif ((name in self.ROUNDED_ATTRIBUTES) and (self.precision >= 0)):
+                    node.attrib[name] = self.roundNumbers(node.attrib[name], self.precision)
+            inherited_children = inherited
+            if ("style" in node.attrib):
+                style, properties = self.__cleanStyle(node.attrib["style"], inherited)
+                if (len(style) > 0):
+                    node.attrib["style"] = style
+                else:
+                    del node.attrib["style"]
+                inherited_children = inherited | properties
+            for child in node:
+                stack.append((child, inherited_children))
+
+    # remove the given node, preserving its tail text
+    @classmethod
+    def __removeNode(cls, node):
+        parent = node.getparent()
+        if (node.tail):
+            previous = node.getprevious()
+            if (previous is not None):
+                previous.tail = (previous.tail or "") + node.tail
+            else:
+                parent.text = (parent.text or "") + node.tail
+        parent.remove(node)
+
+    # return True if the given (Clark notation) name belongs to an editor namespace
+    @classmethod
+    def __isEditorName(cls, name):
+        if (name.startswith("{")):
+            return name[1:].split("}", 1)[0] in cls.EDITOR_NAMESPACES
+        return False
+
+    # drop editor properties and properties at their initial value,
+    # returning the new style string and the set of properties set
+    @classmethod
+    def __cleanStyle(cls, style, inherited):
+        kept = []
+        properties = set()
+        for declaration in style.split(";"):
+            if (":" not in declaration):
+                continue
+            name, value = declaration.split(":", 1)
+            name = name.strip()
+            value = value.strip()
+            if (name.startswith("-inkscape-")):
+                continue
+            properties.add(name)
+            if ((cls.DEFAULT_STYLE.get(name) == value) and (name not in inherited)):
+                continue
+            kept.append("%s:%s" % (name, value))
+        return ";".join(kept), properties
+
+    # round all the numbers in the given string to precision decimal digits
+    @classmethod
+    def roundNumbers(cls, string, precision):
+        return cls.__roundNumbers(string, lambda index: precision)
+
+    # round the numbers of the given transform list to precision decimal digits
+    # (translation parameters) or to precision + LINEAR_EXTRA_DIGITS (the others);
+    # unknown transform functions are not changed
+    @classmethod
+    def roundTransform(cls, string, precision):
+        def replace(match):
+            translations = cls.TRANSFORM_TRANSLATIONS.get(match.group(1))
+            if (translations is None):
+                return match.group(0)
+            def getPrecision(index):
+                if (index in translations):
+                    return precision
+                return precision + cls.LINEAR_EXTRA_DIGITS
+            return match.group(1) + match.group(2) + cls.__roundNumbers(match.group(3), getPrecision)
+        return cls.__re_transform.sub(replace, string)
+
+    # round the numbers in the given string,
+    # the i-th one to get_precision(i) decimal digits
+    @classmethod
+    def __roundNumbers(cls, string, get_precision):
+        # numbers adjacent in the input (e.g., "1.5.5") need a separator
+        # if rounding drops their decimal point
+        state = {"end": -1, "index": 0}
+        def replace(match):
+            s = cls.formatNumber(float(match.group(0)), get_precision(state["index"]))
+            state["index"] += 1
+            if ((match.start() == state["end"]) and (not s.startswith("-"))):
+                s = " " + s
+            state["end"] = match.end()
+            return s
+        return cls.__re_number.sub(replace, string)
+
+    # round the numbers of the given path data to precision decimal digits,
+    # reading it command by command, so that arc flags
+    # (which can be written without separators, e.g. "a5 5 0 0110 10")
+    # are kept as they are; separators are kept as well,
+    # and path data which cannot be read is not changed
+    @classmethod
+    def roundPathData(cls, string, precision):
+        output = []
+        position = 0
+        command = None
+        index = 0
+        previous_is_number = False
+        while (True):
+            match = cls.__re_path_command.match(string, position)
+            if (match):
+                command = match.group(1).lower()
+                index = 0
+                output.append(string[position:match.end()])
+                position = match.end()
+                previous_is_number = False
+                continue
+            if ((command is None) or (cls.PATH_PARAMETERS[command] == 0)):
+                break
+            if (index in cls.PATH_FLAGS.get(command, [])):
+                match = cls.__re_path_flag.match(string, position)
+                if (match):
+                    token = match.group(1)
+            else:
+                match = cls.__re_path_number.match(string, position)
+                if (match):
+                    token = cls.formatNumber(float(match.group(1)), precision)
+            if (not match):
+                break
+            separator = string[position:match.start(1)]
+            # two adjacent numbers must be separated,
+            # unless the second one starts with a sign
+            if ((separator == "") and (previous_is_number) and (token[0] != "-")):
+                separator = " "
+            output.append(separator + token)
+            position = match.end()
+            previous_is_number = True
+            # the parameters of the command can be repeated
+            index = (index + 1) % cls.PATH_PARAMETERS[command]
+        if (string[position:].strip() != ""):
+            return string
+        output.append(string[position:])
+        return "".join(output)
+
+    # format a number with at most precision decimal digits,
+    # without trailing zeros
+    @classmethod
+    def formatNumber(cls, value, precision):
+        s = "%.*f" % (precision, value)
+        if ("." in s):
+            s = s.rstrip("0").rstrip(".")
+        if (s in ["-0", ""]):
+            s = "0"
+        return s
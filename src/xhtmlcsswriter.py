@@ -15,16 +15,23 @@ __description__ = 'Produce HTML+CSS output from parsed SVG'
 #
 ### END changelog ###
 
-import math, os, re
+import copy, math, os, re
 from csscolor import CSSColor
 from cssstyle import CSSStyle
+from idallocator import IDAllocator
 from lxml import etree
 from namespaces import NS
+from options import Options
+from rasteranalyzer import RasterAnalyzer
+from rasteratlas import RasterAtlas
+from rasteroptimizer import RasterOptimizer
+from rasterscheduler import RasterJob, RasterScheduler
+from rasterstore import RasterStore
 from rasterwriter import RasterWriter
 from svgelements import *
 from svghandler import SVGHandler
+from svgsanitizer import SVGSanitizer
 from xml.sax.saxutils import escape
-from xml.sax.saxutils import quoteattr
 
 class XHTMLCSSWriter(SVGHandler):
 
@@ -80,15 +87,33 @@ class XHTMLCSSWriter(SVGHandler):
     PLACEHOLDER_IN_PAGE_LAST  = PLACEHOLDER_PREFIX + "in_page_last"
     PLACEHOLDER_POST_PAGE     = PLACEHOLDER_PREFIX + "post_page"
 
+    # elements visited by this writer (title, metadata and unknown elements are not)
+    PARSER_NEEDS = set([
+        "svg", "group", "define", "linearGradient", "radialGradient", "stop",
+        "clipPath", "rect", "arc", "native", "text", "tspan", "image",
+        "characters", "filter"
+    ])
+
     # initialize writer
-    def __init__(self, options, original_svg, input_svg_path, log):
+    # (image_linker, if given, puts the linked images in the output, see ImageLinker;
+    # output_dir_path, if given, is the directory the output is finally written to,
+    # the images being rendered in the output directory of the options,
+    # used as a staging directory, see SVGExporter.convert;
+    # image_extractor, if given, writes the images embedded as data: URIs
+    # to files, when they are output, see ImageExtractor)
+    def __init__(self, options, original_svg, input_svg_path, log, image_linker=None, output_dir_path=None, image_extractor=None):
+        SVGHandler.__init__(self)
         self.__options = options
+        self.__render_dir_path = os.path.abspath(self.__options["outputdirectory"])
+        self.__output_dir_path = self.__render_dir_path
+        if (output_dir_path is not None):
+            self.__output_dir_path = os.path.abspath(output_dir_path)
         self.__original_svg = original_svg
         self.__input_svg_path = input_svg_path
         self.__log = self.__fake_log
         if (log):
             self.__log = log
-        self.__id = 0
+        self._ids = IDAllocator(self.ELEMENT_ID_PREFIX, self.__options["compactids"])
         self.__zindex = 0
         self.__clipnames = {}
         self.__html = None
@@ -98,6 +123,63 @@ class XHTMLCSSWriter(SVGHandler):
         self.__page_width = 0
         self.__page_height = 0 
         self.__svg_defs = {}
+        self.__original_ids = None
+        self.__shared_defs_id = None
+        self.__shared_defs_svg = None
+        self.__injected_defs = set()
+        self.__last_island = None
+        self.__scheduler = None
+        self.__pending_rasters = []
+        self.__image_linker = image_linker
+        self.__image_extractor = image_extractor
+        self.__linked_images = {}
+        self.__pending_images = []
+        self.__background_checked = False
+        self.__merged_layers = set()
+        self.__scales = [1]
+        if (self.__options["outputformat"] == "mixed"):
+            self.__scales = RasterWriter.getScales(self.__options["rasterscales"], self.__log)
+        self.__store = None
+        if ((self.__options["outputformat"] == "mixed") and (len(self.__options["rastershareddirectory"]) > 0)):
+            if (len(self.__scales) > 1):
+                self.__log("XW: Raster images at several scales are not stored in the shared directory", t="WARNING")
+            else:
+                self.__store = RasterStore(self.__options["rastershareddirectory"], self.__log, Options.getCacheDirectory(self.__options))
+        if ((self.__options["outputformat"] == "mixed") and (self.__options["rasteranalyze"]) and (not RasterAnalyzer.isAvailable())):
+            self.__log("XW: Pillow not available: raster images will not be analyzed", t="WARNING")
+        self.__optimizer = None
+        if ((self.__options["outputformat"] == "mixed") and (self.__options["rasterformat"] == "auto") and (not RasterAnalyzer.isAvailable())):
+            self.__log("XW: Pillow not available: raster images will be PNG", t="WARNING")
+        if ((self.__options["outputformat"] == "mixed") and (self.__options["pngoptimize"]) and (self.__options["rasterformat"] in ["png", "auto"])):
+            if (RasterOptimizer.isAvailable()):
+                self.__optimizer = RasterOptimizer(
+                        int(self.__options["pngcompresslevel"]),
+                        int(self.__options["pngquantize"]),
+                        self.__options["pngdither"]
+                )
+            else:
+                self.__log("XW: Pillow not available: PNG images will not be optimized", t="WARNING")
+        self.__atlas = False
+        if ((self.__options["outputformat"] == "mixed") and (self.__options["rasteratlas"])):
+            if (not RasterAtlas.isAvailable()):
+                self.__log("XW: Pillow not available: raster images will not be packed", t="WARNING")
+            elif (self.__options["rasterformat"] not in ["png", "auto"]):
+                self.__log("XW: Raster images are packed only in PNG format", t="WARNING")
+            elif (self.__store is not None):
+                self.__log("XW: Raster images in the shared directory are not packed", t="WARNING")
+            elif (len(self.__scales) > 1):
+                self.__log("XW: Raster images at several scales are not packed", t="WARNING")
+            else:
+                self.__atlas = True
+        self.__compact = (self.__options["outputprofile"] == "compact")
+        self.__css_prefixes = None
+        if (self.__compact):
+            self.__css_prefixes, unknown = CSSStyle.getVendorPrefixes(self.__options["csstargets"])
+            for target in unknown:
+                self.__log("XW: Unknown CSS target '%s' ignored" % (target), t="WARNING")
+        self.__sanitizer = None
+        if (self.__options["sanitizenative"]):
+            self.__sanitizer = SVGSanitizer(int(self.__options["nativeprecision"]))
         self._css_data = []
         self._html_elements = {}
         self._svg_to_html = {}
@@ -107,7 +189,7 @@ class XHTMLCSSWriter(SVGHandler):
         self.__log("XW: initialization completed")
 
     # fake log
-    def __fake_log(self, s):
+    def __fake_log(self, s, t="INFO"):
         pass
 
     # initialize XHTML DOM
@@ -120,6 +202,7 @@ class XHTMLCSSWriter(SVGHandler):
         head = etree.SubElement(html, "head")
         head_id = self.ELEMENT_ID_PREFIX + "head"
         head.attrib["id"] = head_id
+        self._ids.reserve(head_id)
         self._html_elements[head_id] = head 
         self._append_placeholder(head, self.PLACEHOLDER_IN_HEAD_FIRST)
         self._append_placeholder(html, self.PLACEHOLDER_POST_HEAD)
@@ -173,6 +256,7 @@ class XHTMLCSSWriter(SVGHandler):
         # store in _html_elements dictionary
         body_id = self.ELEMENT_ID_PREFIX + "body"
         body.attrib["id"] = body_id
+        self._ids.reserve(body_id)
         self._html_elements[body_id] = body
 
         # store nodes
@@ -191,40 +275,30 @@ class XHTMLCSSWriter(SVGHandler):
         
 
     # generate a new name for the element
-    def _getNewName(self, elem=None, use_label=False):
-        # always increment, so self.__id is surely unique
-        self.__id += 1
-        
-        # first attempt: create an id like "svg-000001"
-        tmp_id = self.ELEMENT_ID_PREFIX + "%06d" % self.__id
-        
+    # (suffixes are appended to it to get the ids of the auxiliary elements)
+    def _getNewName(self, elem=None, use_label=False, suffixes=()):
+        base = None
         if (not self.__options["renameidattributes"]):
-            # try keeping using the original svg id
-            if ((elem) and (isinstance(elem, SVGElement))):
+            # try keeping using the original svg id (or the layer label)
+            if ((elem is not None) and (isinstance(elem, SVGElement))):
                 if (use_label):
-                    # use layer label
-                    tmp_id = self.ELEMENT_ID_PREFIX + elem.label
-                    # clean id
-                    tmp_id = re.sub(r"[^A-Za-z0-9-_]", "_", tmp_id)
+                    base = elem.label
                 else:
-                    # use element id
-                    tmp_id = self.ELEMENT_ID_PREFIX + elem.id
-                
-                # check that the id is indeed unique
-                i = 1
-                while (tmp_id in self._html_elements):
-                    tmp_id += "-%s" % str(i).zfill(6)
-                    i += 1
+                    base = elem.id
+
+        # numeric id (like "svg-000001") if base is None, otherwise derived from base,
+        # and surely unique
+        tmp_id = self._ids.allocate(base, suffixes)
         
         # if it was an element, add to svg_id to html_id dictionary
-        if ((elem) and (isinstance(elem, SVGElement))):
+        if ((elem is not None) and (isinstance(elem, SVGElement))):
             self._svg_to_html[elem.id] = tmp_id
         return tmp_id
 
     # get the (XHTML/CSS) id of the parent of the given SVGElement
     def _get_parent_id(self, element):
         parent_id = None
-        if (element):
+        if (element is not None):
             svg_id = element.getParent().id
             if (svg_id in self._svg_to_html):
                 parent_id = self._svg_to_html[svg_id]
@@ -235,6 +309,8 @@ class XHTMLCSSWriter(SVGHandler):
     
     # accumulates CSS directives 
     def _css(self, s=None, tag=None, cls=None, id=None, style=None):
+        if (isinstance(style, CSSStyle)):
+            style = style.toString(self.__css_prefixes)
         if (s):
             self._css_data.append(s)
         if ((tag) and (style)):
@@ -295,28 +371,175 @@ class XHTMLCSSWriter(SVGHandler):
         if (self.__options["insertplaceholders"]):
             parent.append(etree.Comment(" %s " % placeholder))
 
+    # wait for the raster exports submitted in mixed mode,
+    # and output the CSS of their <div> elements
+    def completePendingJobs(self):
+        self.__completeLinkedImages()
+        if (len(self.__pending_rasters) == 0):
+            return
+        count = len(self.__pending_rasters)
+        self.__log("XW: Waiting for %d raster exports..." % (count))
+        completed = []
+        for job, elem_id, name, css, absolute_file_path in self.__pending_rasters:
+            try:
+                coordinates = job.getResult()
+            except Exception, e:
+                # e.g., the image could not be moved into the shared store
+                self.__log("XW: Cannot export id '%s': %s" % (elem_id, e), t="WARNING")
+                coordinates = None
+            if (coordinates is None):
+                # the export failed (see the log): there is no image to pack
+                css["top"] = "%.03fpx" % (self.__page_height)
+                css["left"] = "0.000px"
+                self._css(id=name, style=css)
+                self.__log("XW: Exporting id '%s' ... failed" % (elem_id), t="WARNING")
+                continue
+            rx, ry = coordinates[0:2]
+            if (rx is None):
+                # empty image, already deleted: remove its <div>
+                div = self._html_elements.pop(name)
+                self._html_elements.pop(name + "-img", None)
+                div.getparent().remove(div)
+                del self._exported_file_names[name]
+                self.__log("XW: Exporting id '%s' ... skipped (empty image)" % (elem_id))
+                continue
+            css["top"] = "%.03fpx" % (self.__page_height - ry)
+            css["left"] = "%.03fpx" % (rx)
+            if (len(coordinates) > 2):
+                # the actual image file (in the shared store, or in the chosen format)
+                absolute_file_path = coordinates[2]
+                self.__setImageSource(name, absolute_file_path)
+                if (len(self.__scales) > 1):
+                    self.__setImageSourceSet(name, absolute_file_path)
+            completed.append([name, css, absolute_file_path])
+            self.__log("XW: Exporting id '%s' ... completed" % (elem_id))
+        self.__pending_rasters = []
+        if ((self.__atlas) and (len(completed) > 1)):
+            self.__packImages(completed)
+        for name, css, absolute_file_path in completed:
+            self._css(id=name, style=css)
+        if (self.__scheduler is not None):
+            self.__scheduler.shutdown()
+        if (self.__optimizer is not None):
+            self.__log("XW: PNG optimization saved %d bytes" % (self.__optimizer.getSavedBytes()))
+        if (self.__store is not None):
+            self.__log("XW: Shared raster store: %d images reused, %d rendered" % (self.__store.hits, self.__store.misses))
+        self.__log("XW: Waiting for %d raster exports... completed" % (count))
+
+    # get the scheduler running raster exports and image links
+    def __getScheduler(self):
+        if (self.__scheduler is None):
+            self.__scheduler = RasterScheduler(int(self.__options["rasterjobs"]), self.__log)
+        return self.__scheduler
+
+    # wait for the linked images to be put in the output,
+    # and point their <img> elements to them
+    def __completeLinkedImages(self):
+        if (len(self.__pending_images) == 0):
+            return
+        for job, name in self.__pending_images:
+            try:
+                file_path = job.getResult()
+            except (IOError, OSError), e:
+                self.__log("XW: Cannot put image of id '%s' in the output: %s" % (name, e), t="WARNING")
+                continue
+            self._html_elements[name].attrib["src"] = self.__getSource(file_path)
+        self.__pending_images = []
+        self.__image_linker.save()
+        self.__log("XW: Linked images: %d put in the output, %d duplicates, %d unchanged" % (
+            self.__image_linker.linked,
+            self.__image_linker.duplicates,
+            self.__image_linker.skipped))
+        if (len(self.__pending_rasters) == 0):
+            self.__scheduler.shutdown()
+
+    # get the src pointing to the given image file from the XHTML file:
+    # the files rendered in a staging directory are moved to the output directory
+    def __getSource(self, absolute_file_path):
+        absolute_file_path = os.path.abspath(absolute_file_path)
+        if (absolute_file_path.startswith(self.__render_dir_path + os.sep)):
+            src = os.path.relpath(absolute_file_path, self.__render_dir_path)
+        else:
+            src = os.path.relpath(absolute_file_path, self.__output_dir_path)
+        return src.replace(os.sep, "/")
+
+    # point the <img> of the raster with the given name to the given file
+    def __setImageSource(self, name, absolute_file_path):
+        self._html_elements[name + "-img"].attrib["src"] = self.__getSource(absolute_file_path)
+
+    # let the <img> of the raster with the given name choose among the images
+    # at the different scales, the one at scale 1 being at absolute_file_path
+    def __setImageSourceSet(self, name, absolute_file_path):
+        path, extension = os.path.splitext(absolute_file_path)
+        sources = []
+        for scale in self.__scales:
+            src = self.__getSource(RasterWriter.getScaledPath(path, scale) + extension)
+            sources.append("%s %sx" % (src, scale))
+        self._html_elements[name + "-img"].attrib["srcset"] = ", ".join(sources)
+
+    # pack the completed raster images ([name, css, absolute_file_path]) into atlases:
+    # each <div> becomes a window on its part of the atlas,
+    # showing the <img> of the atlas shifted by the position of the image
+    def __packImages(self, completed):
+        # (next to the rendered images, possibly in a staging directory)
+        od = self.__render_dir_path
+        relative_atlas_path = self._ids.allocate("atlas")
+        if (len(self.__options["rasterimagesubdirectory"]) > 0):
+            relative_atlas_path = os.path.join(self.__options["rasterimagesubdirectory"], relative_atlas_path)
+        # JPEG images (chosen by the auto raster format) are not packed
+        completed = [c for c in completed if c[2].endswith(".png")]
+        placements, atlas_paths = RasterAtlas.build(
+                [c[2] for c in completed],
+                os.path.join(od, relative_atlas_path) + "-%d.png",
+                self.__log
+        )
+        packed = 0
+        for i in range(len(completed)):
+            if (placements[i] is None):
+                continue
+            name, css, absolute_file_path = completed[i]
+            atlas_path, x, y, width, height = placements[i]
+            css["width"] = "%dpx" % (width)
+            css["height"] = "%dpx" % (height)
+            css["overflow"] = "hidden"
+            self.__setImageSource(name, atlas_path)
+            img_css = CSSStyle()
+            img_css["position"] = "absolute"
+            img_css["left"] = "%dpx" % (-x)
+            img_css["top"] = "%dpx" % (-y)
+            self._css(id=name + "-img", style=img_css)
+            packed += 1
+        self.__log("XW: Packed %d raster images into %d atlases" % (packed, len(atlas_paths)))
+
     # get XHTML as string
     def getXHTML(self, title=None, cssfile=None):
+        self.completePendingJobs()
         
         # if we have to output CSS inside the XHTML
         if (not self.__options["outputcss"]):
             css = etree.SubElement(self.__head, "style")
             css.attrib["type"] = "text/css"
             css.attrib["rel"] = "stylesheet"
-            css.text = "\n" + self.getCSS()
+            css.text = self.getCSS()
+            if (not self.__compact):
+                css.text = "\n" + css.text
 
-        # return a pretty print of the XHTML
-        return self.XML_PREAMBLE + "\n" + etree.tostring(self.__html, pretty_print=True)
+        # return a pretty print of the XHTML (or a minified one, in compact mode)
+        return self.XML_PREAMBLE + "\n" + etree.tostring(self.__html, pretty_print=(not self.__compact))
+
+    # get XHTML as lxml tree (the <html> element)
+    def getXHTMLTree(self):
+        return self.__html
        
     # get CSS as string
     def getCSS(self):
-        ret = ""
-        for c in sorted(self._css_data):
-            ret += c + "\n"
-        return ret
+        self.completePendingJobs()
+        if (self.__compact):
+            return "".join(sorted(self._css_data))
+        return "".join([c + "\n" for c in sorted(self._css_data)])
    
-    # process <svg> element
-    def svg(self, elem):
+    # process <svg> element, before visiting children
+    def svgEnter(self, elem):
         self.__log("XW: Parsing...")
 
         # TODO are multiple <svg> elements allowed? if so, this must go
@@ -334,6 +557,7 @@ class XHTMLCSSWriter(SVGHandler):
         # add page element
         svg_id = self.ELEMENT_ID_PREFIX + "page"
         self.__page_div_id = svg_id
+        self._ids.reserve(svg_id)
         
         # add style
         svg_style = ""
@@ -361,15 +585,19 @@ class XHTMLCSSWriter(SVGHandler):
         self._html({"tag": "comment", "placeholder": " %s " % self.PLACEHOLDER_PRE_PAGE, "parent": self.__body.attrib["id"]})
         self._html({"tag": "div", "id": svg_id, "parent": self.__body.attrib["id"]})
         self._html({"tag": "comment", "placeholder": " %s " % self.PLACEHOLDER_IN_PAGE_FIRST, "parent": svg_id})
+        return True
+
+    # process <svg> element, after visiting children
+    def svgLeave(self, elem):
+        svg_id = self.__page_div_id
 
-        # visit children 
-        for a in elem:
-            a.callHandler(self)
-        
         # append to DOM
         self._html({"tag": "comment", "placeholder": " %s " % self.PLACEHOLDER_IN_PAGE_LAST, "parent": svg_id})
         self._html({"tag": "comment", "placeholder": " %s " % self.PLACEHOLDER_POST_PAGE, "parent": self.__body.attrib["id"]})
         self._html({"tag": "comment", "placeholder": " %s " % self.PLACEHOLDER_IN_BODY_LAST, "parent": self.__body.attrib["id"]})
+
+        if (self.__sanitizer is not None):
+            self.__log("XW: Native SVG sanitized: %d bytes saved (%d -> %d)" % (self.__sanitizer.getSavedBytes(), self.__sanitizer.bytes_before, self.__sanitizer.bytes_after))
         
         self.__log("XW: Parsing... completed")
 
@@ -399,10 +627,17 @@ class XHTMLCSSWriter(SVGHandler):
     # export as SVG island
     def native(self, elem):
         self.__log("XW: Native object with id '%s'" % (elem.id))
+        parent_id = self._get_parent_id(elem)
+
+        # is the previous output sibling an island? if so, add to it
+        svg_id = self.__getLastIsland(parent_id)
+        if (svg_id is not None):
+            self.__log("XW: Coalescing native object with id '%s' into <svg> with id '%s'" % (elem.id, svg_id))
+            self.__addNativeToIsland(elem, svg_id)
+            return
         
         # div container
-        div_id = self._getNewName(elem)
-        parent_id = self._get_parent_id(elem)
+        div_id = self._getNewName(elem, suffixes=("-svg",))
         self._html({"tag": "div", "id": div_id, "parent": parent_id})
         div_style = ""
         div_style += "top:0px;"
@@ -418,53 +653,124 @@ class XHTMLCSSWriter(SVGHandler):
         svg_style = "overflow:visible;"
         self._html({"tag": "svg", "id": svg_id, "parent": parent_id, "width": str(self.__page_width), "height": str(self.__page_height), "style": svg_style})
         self.__log("XW: Added <svg> with id '%s'" % (svg_id))
-        # defs element
-        defs_id = self._getNewName()
-        self._html({"tag": "defs", "id": defs_id, "parent": svg_id})
-        self.__log("XW: Added <defs> with id '%s'" % (defs_id))
-        
+        self.__last_island = [self._html_elements[div_id], svg_id]
+        self.__addNativeToIsland(elem, svg_id)
+
+    # get the id of the <svg> island which is the last child of the given parent,
+    # or None if there is no such island (or coalescing is disabled)
+    def __getLastIsland(self, parent_id):
+        if ((not self.__options["coalescenativepaths"]) or (self.__last_island is None)):
+            return None
+        div, svg_id = self.__last_island
+        parent = self._html_elements.get(parent_id)
+        if (parent is None):
+            return None
+        # the hidden <svg> holding the shared <defs> is not an output sibling
+        children = [c for c in parent[-2:] if (c is not self.__shared_defs_svg)]
+        if ((len(children) > 0) and (children[-1] is div)):
+            return svg_id
+        return None
+
+    # add the given native element (with the needed defs) to the <svg> island
+    def __addNativeToIsland(self, elem, svg_id):
         # import needed fill
         self.__log("XW: Processing fill...")
         #path_style = re.sub(r"fill:url\([^)]*\)", "fill:#00ff00", path_style)
-        self.__injectSVGDefs(elem.style.get("fill", ""), defs_id)
+        self.__injectSVGDefs(elem.style.get("fill", ""))
        
         # import needed filter 
         self.__log("XW: Processing filter...")
         #path_style = re.sub(r"filter:url\([^)]*\)[;]*", "", path_style)
-        self.__injectSVGDefs(elem.style.get("filter", ""), defs_id)
+        self.__injectSVGDefs(elem.style.get("filter", ""))
       
         # add element 
         self.__log("XW: Processing native object with id '%s' ..." % (elem.id))
-        self.__addNativeElementFromID(elem.id, svg_id)
+        self.__addNativeElementFromID(elem.id, svg_id, elem.inherited_transform)
         self.__log("XW: Processing native object with id '%s' ... done" % (elem.id))
 
-    # gets an SVG element from its id, adds it to the DOM, and returns it as an etree node
-    def __addNativeElementFromID(self, element_id, parent_id):
+    # gets an SVG element from its id, adds a copy of it to the DOM, and returns the copy as an etree node
+    # (the original SVG document is never modified);
+    # if given, transform is prepended to the transform of the copy
+    def __addNativeElementFromID(self, element_id, parent_id, transform=None):
         # get the original SVG node with the given id
-        elem = self.__original_svg.xpath("//*[@id='%s']" % (element_id))
-        if (len(elem) > 0):
+        node = self.__getOriginalNode(element_id)
+        if (node is not None):
             # element found
-            self._html({"tag": "xml", "parent": parent_id, "node": elem[0]})
+            elem = copy.deepcopy(node)
+            elem.tail = None
+            if (transform is not None):
+                elem.attrib["transform"] = ("%s %s" % (str(transform), elem.get("transform", ""))).strip()
+            if (self.__sanitizer is not None):
+                self.__sanitizer.sanitize(elem)
+            self._html({"tag": "xml", "parent": parent_id, "node": elem})
             self.__log("XW: Added native object to parent_id '%s'" % (parent_id))
-            return elem[0]
+            return elem
         return None
 
+    # get the node of the original SVG document with the given id (None if there is none)
+    def __getOriginalNode(self, element_id):
+        if (self.__original_ids is None):
+            self.__original_ids = {}
+            for node in self.__original_svg.iter(tag=etree.Element):
+                node_id = node.get("id")
+                if ((node_id is not None) and (node_id not in self.__original_ids)):
+                    self.__original_ids[node_id] = node
+        return self.__original_ids.get(element_id)
+
+    # get the id of the <defs> element shared by all the SVG islands of the page,
+    # creating it (inside a hidden <svg>) the first time
+    def __getSharedDefsID(self):
+        if (self.__shared_defs_id is None):
+            svg_id = self._getNewName()
+            svg_style = "position:absolute;overflow:hidden;"
+            self._html({"tag": "svg", "id": svg_id, "parent": self.__page_div_id, "width": "0", "height": "0", "style": svg_style})
+            del self._html_elements[svg_id].attrib["viewBox"]
+            # first child of the page, wherever it is first needed,
+            # so that it is not between layers, nor after an <svg> island
+            # (which could not be coalesced with the next native elements)
+            svg = self._html_elements[svg_id]
+            page = svg.getparent()
+            page.remove(svg)
+            page.insert(0, svg)
+            self.__shared_defs_svg = svg
+            defs_id = self._getNewName()
+            self._html({"tag": "defs", "id": defs_id, "parent": svg_id})
+            self.__shared_defs_id = defs_id
+            self.__log("XW: Added shared <defs> with id '%s'" % (defs_id))
+        return self.__shared_defs_id
+
     # if the passed attribute (fill or filter) has an url(#...),
     # then gets the corresponding SVG element using the referenced id,
-    # adds it to the DOM (inside the <defs> of the <svg> island),
-    # and checks if it has an href: if so, include also the referenced filter/effect
-    def __injectSVGDefs(self, attribute_string, parent_id):
+    # adds a copy of it to the DOM (inside the <defs> shared by the <svg> islands),
+    # and checks if it has an href: if so, include also the referenced filter/effect;
+    # each element is added only once per page
+    def __injectSVGDefs(self, attribute_string):
         referenced_id = self.getURL(attribute_string)
         if ((referenced_id) and (referenced_id in self.__svg_defs)):
-            elem = self.__addNativeElementFromID(referenced_id, parent_id)
-            if (elem is not None):
+            while ((referenced_id) and (referenced_id not in self.__injected_defs)):
+                self.__injected_defs.add(referenced_id)
+                elem = self.__addNativeElementFromID(referenced_id, self.__getSharedDefsID())
+                if (elem is None):
+                    return
                 # is referencing something else? (e.g., radialGradient referencing linearGradient)
-                xlink_id = elem.get("{%s}href" % NS.XLINK)
-                if (xlink_id):
-                    xlink_id = xlink_id[1:] # remove initial #
-                    self.__log("XW: Adding referenced object to xlink_id '%s'" % (xlink_id))
-                    self.__addNativeElementFromID(xlink_id, parent_id)
-
+                referenced_id = elem.get("{%s}href" % NS.XLINK)
+                if (referenced_id):
+                    referenced_id = referenced_id[1:] # remove initial #
+                    self.__log("XW: Adding referenced object to xlink_id '%s'" % (referenced_id))
+
+
+    # set the CSS transform of an element to the given matrix:
+    # a translation is added to the position (top and left) instead,
+    # and the identity is dropped, so that no CSS transform
+    # (written with all its vendor prefixes) is output for them
+    def __setTransform(self, css, matrix):
+        if (not matrix.isTranslation()):
+            css["transform"] = matrix
+            return
+        if (abs(matrix.e) >= SVGTransform.SVGMatrix.EPSILON):
+            css["left"] = SVGLength(css.get("left", 0)) + matrix.e
+        if (abs(matrix.f) >= SVGTransform.SVGMatrix.EPSILON):
+            css["top"] = SVGLength(css.get("top", 0)) + matrix.f
 
     # process <rect> element
     def rect(self, elem):
@@ -557,7 +863,7 @@ class XHTMLCSSWriter(SVGHandler):
                 css["top"] += transform.f
                 transform.e = 0
                 transform.f = 0
-                css["transform"] = transform
+                self.__setTransform(css, transform)
             if ("opacity" in element.style):
                 css["opacity"] = element.style["opacity"]
             self._css(id=name, style=css)
@@ -574,7 +880,7 @@ class XHTMLCSSWriter(SVGHandler):
 
     # TODO merge/refactor with the above
     def __blured_round_rect(self, element, x, y, width, height, rx=0, ry=0, blur=0):
-        name = self._getNewName(element)
+        name = self._getNewName(element, suffixes=("-fill", "-stroke"))
         namefill = name + "-fill"
         namestroke = name + "-stroke"
         hasfill = ("fill" in element.style) and (element.style["fill"] != "none")
@@ -608,7 +914,7 @@ class XHTMLCSSWriter(SVGHandler):
                     css["top"] += transform.f
                     transform.e = 0
                     transform.f = 0
-                    css["transform"] = transform
+                    self.__setTransform(css, transform)
                 if ("opacity" in element.style):
                     css["opacity"] = element.style["opacity"]
                 self._css(id=namefill, style=css)
@@ -653,7 +959,7 @@ class XHTMLCSSWriter(SVGHandler):
                     css["top"] += transform.f
                     transform.e = 0
                     transform.f = 0
-                    css["transform"] = transform
+                    self.__setTransform(css, transform)
                 if ("opacity" in element.style):
                     css["opacity"] = element.style["opacity"]
                 self._css(id=namestroke, style=css)
@@ -669,8 +975,9 @@ class XHTMLCSSWriter(SVGHandler):
             self._html({"tag": "div", "id": namestroke, "parent": parent_id})
 
 
-    # process <g> element
-    def group(self, elem):
+    # process <g> element, before visiting children
+    # (children are visited only in vector mode, or if it is not a layer)
+    def groupEnter(self, elem):
         
         is_inkscape_layer = ((elem.groupmode) and (elem.groupmode == "layer"))
         
@@ -679,14 +986,21 @@ class XHTMLCSSWriter(SVGHandler):
                 (not self.__options["exporthiddenlayers"])):
             # hidden layer, and the user does not want to export it 
             self.__log("XW: Skipping hidden layer with id '%s'" % elem.id)
-            return
+            return False
+
+        if (elem.id in self.__merged_layers):
+            # already rasterized together with the layers below it
+            self.__log("XW: Layer with id '%s' merged into the background raster" % elem.id)
+            return False
 
         # ok, we need to export this
-        name = self._getNewName(elem)
-        if ((is_inkscape_layer) and (elem.label) and (len(elem.label) > 0)):
-            # it is a layer
-            if (self.__options["uselayerlabels"]):
-                name = self._getNewName(elem, True)
+        # (layers might be named after their label)
+        use_label = ((is_inkscape_layer) and (elem.label) and (len(elem.label) > 0) and (self.__options["uselayerlabels"]))
+        suffixes = ()
+        if ((is_inkscape_layer) and (self.__options["outputformat"] == "mixed")):
+            # the raster layer has an <img> child
+            suffixes = ("-img",)
+        name = self._getNewName(elem, use_label, suffixes)
 
         self.__log("XW: Exporting layer with id '%s' to '%s'" % (elem.id, name))
         if ((is_inkscape_layer) and (self.__options["outputformat"] == "mixed")):
@@ -700,27 +1014,72 @@ class XHTMLCSSWriter(SVGHandler):
                 relative_file_path = os.path.join(self.__options["rasterimagesubdirectory"], relative_file_path)
             absolute_file_path = os.path.join(od, relative_file_path)
             raster_format = self.__options["rasterformat"]
-            rx, ry = RasterWriter.exportRaster(
-                    absolute_file_path,
-                    elem_id,
-                    self.__input_svg_path, 
-                    self.__options["rasterlayerboundingbox"],
-                    raster_format,
-                    self.__log
-            )
+            layer_ids = [elem_id]
+            if ((self.__options["mergebackgroundlayers"]) and (not self.__background_checked)):
+                # first (i.e., bottom) layer
+                self.__background_checked = True
+                layer_ids = self.__getBackgroundLayers(elem)
+            if (len(layer_ids) > 1):
+                self.__log("XW: Merging layers with ids '%s' into one raster" % ("', '".join(layer_ids)))
+                self.__merged_layers.update(layer_ids[1:])
+            source_key = None
+            stored = None
+            if (self.__store is not None):
+                # was this rendering already stored (e.g., by another page)?
+                source_key = self.__getSourceKey(layer_ids)
+                if (source_key is not None):
+                    stored = self.__store.lookup(source_key)
+            if (stored is not None):
+                stored_file_path, rx, ry = stored
+                job = RasterJob.fromResult([rx, ry, stored_file_path])
+            elif (len(layer_ids) > 1):
+                # rasterize the layers together
+                job = self.__getScheduler().submit(
+                        self.__exportToStore,
+                        source_key,
+                        RasterWriter.exportLayers,
+                        absolute_file_path,
+                        RasterWriter.writeLayersSVG(self.__original_svg, layer_ids, self.__input_svg_path),
+                        self.__options["rasterlayerboundingbox"],
+                        raster_format,
+                        self.__log,
+                        self.__options["rasteranalyze"],
+                        [self.__page_width, self.__page_height],
+                        self.__optimizer,
+                        int(self.__options["jpegquality"]),
+                        self.__scales
+                )
+            else:
+                job = self.__getScheduler().submit(
+                        self.__exportToStore,
+                        source_key,
+                        RasterWriter.exportRaster,
+                        absolute_file_path,
+                        elem_id,
+                        self.__input_svg_path, 
+                        self.__options["rasterlayerboundingbox"],
+                        raster_format,
+                        self.__log,
+                        self.__options["rasteranalyze"],
+                        [self.__page_width, self.__page_height],
+                        self.__optimizer,
+                        int(self.__options["jpegquality"]),
+                        self.__scales
+                )
             relative_file_path += "." + raster_format 
             absolute_file_path += "." + raster_format 
-            self.__log("XW: Exporting id '%s' to file '%s' ... completed" % (elem_id, absolute_file_path))
+            self.__log("XW: Exporting id '%s' to file '%s' ... submitted" % (elem_id, absolute_file_path))
              
             # create XHTML <div> structure
+            # (top and left are known only when the export completes,
+            # see completePendingJobs)
             css = CSSStyle()
             #css["position"] = "absolute"
             #css["margin"] = "0px"
             #css["padding"] = "0px"
-            css["top"] = "%.03fpx" % (self.__page_height - ry)
-            css["left"] = "%.03fpx" % (rx)
             # no transform
-            if ("opacity" in elem.style):
+            # (the opacity of merged layers is already in the raster)
+            if (("opacity" in elem.style) and (len(layer_ids) == 1)):
                 css["opacity"] = elem.style["opacity"]
             if (elem.style.get("display", "inline") == "none"):
                 css["display"] = "none"
@@ -728,11 +1087,12 @@ class XHTMLCSSWriter(SVGHandler):
             self.__zindex += self.Z_INDEX_OFFSET
             if (self.__options["explicitzindex"]):
                 css["z-index"] = self.__zindex
-            self._css(id=name, style=css)
+            self.__pending_rasters.append([job, elem_id, name, css, absolute_file_path])
             parent_id = self._get_parent_id(elem)
             self._html({"tag": "div", "id": name, "parent": parent_id})
             # TODO set alt text
             self._html({"tag": "img", "id": name + "-img", "src": relative_file_path, "alt": "", "parent": name})
+            return False
         else:
             # either not a layer or we are in vector mode
             # do normal processing
@@ -744,8 +1104,7 @@ class XHTMLCSSWriter(SVGHandler):
                 #css["margin"] = "0px"
                 #css["padding"] = "0px"
                 if (elem.transform):
-                    transform = elem.transform.toMatrix()
-                    css["transform"] = transform
+                    self.__setTransform(css, elem.transform.toMatrix())
                 if ("opacity" in elem.style):
                     css["opacity"] = elem.style["opacity"]
                 if (elem.style.get("display", "inline") == "none"):
@@ -766,13 +1125,88 @@ class XHTMLCSSWriter(SVGHandler):
             self._html({"tag": "div", "id": name, "parent": parent_id}) 
             
             # visit children
-            for a in elem:
-                a.callHandler(self)
-
+            return True
+
+
+    # run export_function(dest, ...) (see RasterWriter.exportRaster),
+    # then, if the shared store is used, move the image into it,
+    # returning [rx, ry, stored_file_path]
+    def __exportToStore(self, source_key, export_function, dest, *args):
+        coordinates = export_function(dest, *args)
+        if ((self.__store is None) or (coordinates is None) or (coordinates[0] is None)):
+            return coordinates
+        rx, ry, file_path = coordinates
+        return [rx, ry, self.__store.add(file_path, source_key, rx, ry)]
+
+    # get the key of the rendering of the given layers for the shared store:
+    # it depends on their source, on the <defs>, on the page and on the raster options;
+    # None if the rendering depends on external files (linked images)
+    def __getSourceKey(self, layer_ids):
+        root = self.__original_svg
+        if (hasattr(root, "getroot")):
+            root = root.getroot()
+        strings = [__version__]
+        for a in ["width", "height", "viewBox"]:
+            strings.append(root.get(a, ""))
+        for a in ["rasterformat", "rasterlayerboundingbox", "rasteranalyze", "pngoptimize", "pngcompresslevel", "pngquantize", "pngdither", "jpegquality"]:
+            strings.append(str(self.__options[a]))
+        for node in root.iterchildren(tag="{%s}defs" % NS.SVG):
+            strings.append(etree.tostring(node))
+        for layer_id in layer_ids:
+            node = self.__getOriginalNode(layer_id)
+            if (node is None):
+                return None
+            for image in node.iter(tag="{%s}image" % NS.SVG):
+                if (not image.get("{%s}href" % NS.XLINK, "").startswith("data:")):
+                    return None
+            strings.append(etree.tostring(node))
+        return RasterStore.getKey(strings)
+
+    # get the ids of the consecutive layers starting from the given one
+    # which can be rasterized together: the run stops at the first layer
+    # containing text, at the first exported hidden layer,
+    # and at the first top-level element which is not a layer
+    def __getBackgroundLayers(self, elem):
+        layer_ids = []
+        started = False
+        for sibling in elem.getParent():
+            if (sibling is elem):
+                started = True
+            if (not started):
+                continue
+            if ((isinstance(sibling, SVGGroup)) and (sibling.groupmode == "layer")):
+                if (sibling.style.get("display", "inline") == "none"):
+                    if (not self.__options["exporthiddenlayers"]):
+                        # not exported
+                        continue
+                    break
+                if (self.__containsText(sibling)):
+                    break
+                layer_ids.append(sibling.id)
+            elif ((isinstance(sibling, SVGDefine)) or (isinstance(sibling, SVGTitle)) or (isinstance(sibling, SVGMetadata))):
+                continue
+            else:
+                break
+        if (len(layer_ids) == 0):
+            layer_ids = [elem.id]
+        return layer_ids
+
+    # True if the given element contains a <text> element
+    # (explicit stack, since groups might be deeply nested)
+    @classmethod
+    def __containsText(cls, elem):
+        stack = [elem]
+        while (len(stack) > 0):
+            node = stack.pop()
+            if (isinstance(node, SVGText)):
+                return True
+            if (isinstance(node, SVGContainer)):
+                stack.extend(node)
+        return False
 
     # process <text> element
     def text(self, elem):
-        name = self._getNewName(elem)
+        name = self._getNewName(elem, suffixes=("-sep",))
 
         # get parent_id
         parent_id = self._get_parent_id(elem)
@@ -822,8 +1256,7 @@ class XHTMLCSSWriter(SVGHandler):
             css["top"] = elem.y - SVGLength(self.TEXT_VERTICAL_OFFSET)
             css["left"] = elem.x
             if (elem.transform):
-                transform = elem.transform.toMatrix()
-                css["transform"] = transform
+                self.__setTransform(css, elem.transform.toMatrix())
             css["white-space"] = "pre"
             self._css(id=name, style=css)
            
@@ -833,9 +1266,21 @@ class XHTMLCSSWriter(SVGHandler):
             css_style = "position:relative;font-size:0px;vertical-align:%s;" % (self.TEXT_VERTICAL_OFFSET)
             self._css(cls="svg-text-adj", style=css_style)
 
-    # used in text()
+    # used in text(): process the given <tspan> and the ones it contains,
+    # in document order, with an explicit stack instead of recursion
     def __text_contents(self, elem, x=0, y=0, blur=0, parent_id=None):
-        name = self._getNewName(elem)
+        stack = [[elem, x, y, parent_id]]
+        while (len(stack) > 0):
+            elem, x, y, parent_id = stack.pop()
+            name = self.__text_content(elem, x, y, blur, parent_id)
+            # reversed, so that the first <tspan> is popped first
+            for a in reversed([a for a in elem if isinstance(a, SVGTSpan)]):
+                stack.append([a, elem.x, elem.y, name])
+
+    # used in __text_contents(): process the given <tspan>,
+    # but not the <tspan> elements it contains, returning its name
+    def __text_content(self, elem, x, y, blur, parent_id):
+        name = self._getNewName(elem, suffixes=("-sep",))
         if (name not in self._css_classes):
             self._css_classes.add(name)
             css = CSSStyle()
@@ -866,12 +1311,11 @@ class XHTMLCSSWriter(SVGHandler):
             # TODO can we remove this?
             self._html({"tag": "span", "id": name + "-sep", "class": "svg-text-adj", "parent": parent_id, "content": self.NBSP})
         for a in elem:
-            if isinstance(a, SVGTSpan):
-                self.__text_contents(a, elem.x, elem.y, blur, parent_id)
-            elif isinstance(a, SVGCharacters):
+            if isinstance(a, SVGCharacters):
                 # TODO can we wrap this into a <span> ?
                 #self._html({"tag": "span", "id": name + "-text", "parent": parent_id, "content": escape(a.content)})
                 self._html_elements[parent_id].text = escape(a.content)
+        return name
 
 
     # TODO check this
@@ -892,18 +1336,38 @@ class XHTMLCSSWriter(SVGHandler):
                 transform = elem.transform.toMatrix()
                 transform = transform * SVGTransform.SVGTranslate(elem.x + elem.width/2, elem.y + elem.height/2)
                 transform = SVGTransform.SVGTranslate(-elem.x - elem.width/2, -elem.y - elem.height/2) * transform
-                css["transform"] = transform
+                self.__setTransform(css, transform)
             self._css(id=name, style=css)
 
+        # the image extracted from a data: URI, or the linked file
+        # (put in the output by the image linker, if any,
+        # otherwise expected next to the XHTML file);
+        # images are extracted only here, so that the ones
+        # in rasterized layers are not written to the output
+        if ((self.__image_extractor is not None) and (elem.file_path is None)):
+            self.__image_extractor.extract(elem)
+        source_path = None
+        if (elem.file_path is not None):
+            src = self.__getSource(elem.file_path)
+        else:
+            src = os.path.basename(elem.href or "")
+            if (self.__image_linker is not None):
+                source_path = self.__image_linker.resolve(elem.href)
+        if (source_path is not None):
+            # (each file is linked once, even if referenced several times)
+            if (source_path not in self.__linked_images):
+                self.__linked_images[source_path] = self.__getScheduler().submit(self.__image_linker.link, source_path)
+            self.__pending_images.append([self.__linked_images[source_path], name])
+
         # get parent_id
         parent_id = self._get_parent_id(elem)
         if (name in self.__clipnames):
             clipname = self.__clipnames[name]
             self._html({"tag": "div", "id": clipname, "parent": parent_id})
             self._html({"tag": "div", "id": clipname + "inverse", "parent": clipname})
-            self._html({"tag": "img", "id": name, "src": quoteattr(os.path.basename(elem.href)), "parent": clipname + "inverse"})
+            self._html({"tag": "img", "id": name, "src": src, "parent": clipname + "inverse"})
             return
-        self._html({"tag": "img", "id": name, "src": quoteattr(os.path.basename(elem.href)), "parent": parent_id})
+        self._html({"tag": "img", "id": name, "src": src, "parent": parent_id})
 
 
 
@@ -921,7 +1385,7 @@ class XHTMLCSSWriter(SVGHandler):
         
         # get the clip path
         target = element.getRoot().getElementById(m.group(1))[0]
-        name = self._getNewName()
+        name = self._getNewName(suffixes=("inverse",))
         css = CSSStyle()
         invtransform = SVGTransform("")
         
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from idallocator import IDAllocator
+
+class TestIDAllocator(unittest.TestCase):
+
+    def testDerivedIds(self):
+        ids = IDAllocator("svg-")
+        self.assertEqual(ids.allocate("foo-sep"), "svg-foo-sep")
+        # "svg-foo-sep" is taken, so "foo" is renumbered
+        self.assertEqual(ids.allocate("foo", ("-sep",)), "svg-foo-000001")
+        self.assertTrue(ids.isUsed("svg-foo-000001-sep"))
+        # the derived id of "bar" is reserved with it
+        self.assertEqual(ids.allocate("bar", ("-sep",)), "svg-bar")
+        self.assertEqual(ids.allocate("bar-sep"), "svg-bar-sep-000001")
+
+    def testReserve(self):
+        ids = IDAllocator("svg-")
+        ids.reserve("svg-page")
+        self.assertRaises(ValueError, ids.reserve, "svg-page")
+        self.assertEqual(ids.allocate("page"), "svg-page-000001")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, shutil, sys, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from lxml import etree
+from options import Options
+from rasterwriter import RasterWriter
+from svgexporter import SVGExporter
+
+# 1x1 PNG images, with different contents
+PNG_LAYER = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=="
+PNG_PAGE = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M/wHwAEBgIApD5fRAAAAABJRU5ErkJggg=="
+
+SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" width="100" height="100">
+  <g inkscape:groupmode="layer" id="layer1">
+    <image id="i1" x="0" y="0" width="10" height="10" xlink:href="data:image/png;base64,%s"/>
+  </g>
+  <image id="i2" x="20" y="20" width="10" height="10" xlink:href="data:image/png;base64,%s"/>
+</svg>
+""" % (PNG_LAYER, PNG_PAGE)
+
+# stand-in for the Inkscape export
+def exportRaster(cls, dest, elem_id, input_svg_path, crop_to_bounding_box, raster_format, log, *args):
+    if (not os.path.exists(os.path.dirname(dest))):
+        os.makedirs(os.path.dirname(dest))
+    f = open(dest + "." + raster_format, "wb")
+    f.write(PNG_LAYER.decode("base64"))
+    f.close()
+    return [0, 100, dest + "." + raster_format]
+
+class TestExtractedImages(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.svg_file_path = os.path.join(self.dir_path, "input.svg")
+        f = open(self.svg_file_path, "wb")
+        f.write(SVG)
+        f.close()
+        self.export_raster = RasterWriter.__dict__["exportRaster"]
+        RasterWriter.exportRaster = classmethod(exportRaster)
+
+    def tearDown(self):
+        RasterWriter.exportRaster = self.export_raster
+        shutil.rmtree(self.dir_path)
+
+    def convert(self, output_format, streaming=False):
+        options = Options.getDefaultOptions()
+        options["outputformat"] = output_format
+        options["streamingparser"] = streaming
+        options["outputdirectory"] = os.path.join(self.dir_path, "out")
+        SVGExporter(self.svg_file_path, options).convert(write=True)
+        return options["outputdirectory"]
+
+    # the files in the output, but the XHTML and CSS files,
+    # and the ones referenced by the XHTML file
+    def getFiles(self, output_dir_path):
+        files = set()
+        for root, dirs, file_names in os.walk(output_dir_path):
+            for file_name in file_names:
+                files.add(os.path.relpath(os.path.join(root, file_name), output_dir_path).replace(os.sep, "/"))
+        files -= set(["index.xhtml", "style.css"])
+        tree = etree.parse(os.path.join(output_dir_path, "index.xhtml"))
+        referenced = set([img.get("src") for img in tree.iter("{http://www.w3.org/1999/xhtml}img")])
+        return [files, referenced]
+
+    def testMixedNoUnreferencedFiles(self):
+        for streaming in [False, True]:
+            files, referenced = self.getFiles(self.convert("mixed", streaming))
+            self.assertEqual(files, referenced)
+            # the layer image and the page image
+            self.assertEqual(len(files), 2)
+            shutil.rmtree(os.path.join(self.dir_path, "out"))
+
+    def testVectorExtractsAll(self):
+        files, referenced = self.getFiles(self.convert("vector"))
+        self.assertEqual(files, referenced)
+        self.assertEqual(len(files), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, shutil, sys, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from imagelinker import ImageLinker
+
+class TestImageLinker(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.source_path = os.path.join(self.dir_path, "a.png")
+        f = open(self.source_path, "wb")
+        f.write("not really a PNG")
+        f.close()
+        self.image_dir_path = os.path.join(self.dir_path, "out", "img")
+        self.index_dir_path = os.path.join(self.dir_path, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def link(self, index_dir_path):
+        linker = ImageLinker(self.image_dir_path, self.dir_path, "copy", None, index_dir_path)
+        file_path = linker.link(linker.resolve("a.png"))
+        linker.save()
+        return [linker, file_path]
+
+    def testIndexOutsideOutput(self):
+        linker, file_path = self.link(self.index_dir_path)
+        self.assertEqual(os.listdir(self.image_dir_path), [os.path.basename(file_path)])
+        self.assertTrue(os.path.exists(linker.getIndexFilePath()))
+        self.assertEqual(os.path.dirname(linker.getIndexFilePath()), self.index_dir_path)
+        # the next run skips the unchanged image
+        linker, file_path = self.link(self.index_dir_path)
+        self.assertEqual(linker.skipped, 1)
+
+    def testNoIndex(self):
+        linker, file_path = self.link(None)
+        self.assertEqual(linker.getIndexFilePath(), None)
+        self.assertEqual(os.listdir(self.image_dir_path), [os.path.basename(file_path)])
+        self.assertFalse(os.path.exists(self.index_dir_path))
+
+if __name__ == "__main__":
+    unittest.main()
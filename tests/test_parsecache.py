@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, shutil, sys, tempfile, unittest
+from io import BytesIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import svgparser
+from parsecache import ParseCache
+
+SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" width="100" height="100">
+  <defs id="d1"><linearGradient id="lg1"><stop id="s1" offset="0" style="stop-color:#ff0000"/></linearGradient></defs>
+  <g inkscape:groupmode="layer" inkscape:label="A" id="la">
+    <rect id="r1" x="1" y="1" width="2" height="2" style="fill:url(#lg1)"/>
+    <path id="p1" d="M 0,0 L 10,10 Z"/>
+    <foo id="u1"/>
+  </g>
+  <text id="t1" x="5" y="5"><tspan id="ts1">Hi</tspan></text>
+</svg>
+"""
+
+# get the [class name, attributes, characters] of the elements
+# of the tree rooted at elem, in document order
+def getRecords(elem):
+    records = []
+    stack = [elem]
+    while (len(stack) > 0):
+        e = stack.pop()
+        records.append([e.__class__.__name__, dict(e.attrs.items()), getattr(e, "content", None)])
+        if (isinstance(e, list)):
+            stack.extend(reversed(e))
+    return records
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.dir_path, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def testRoundTrip(self):
+        key = self.cache.getKey(SVG)
+        self.assertEqual(self.cache.load(key), None)
+        root = svgparser.Parser().parse(BytesIO(SVG))
+        self.cache.save(key, root)
+        cached_root = self.cache.load(key)
+        self.assertEqual(getRecords(cached_root), getRecords(root))
+        # the ids are registered again
+        self.assertEqual(cached_root.getElementById("r1").id, "r1")
+
+    def testKey(self):
+        # the tree depends on the needs of the parser
+        key = self.cache.getKey(SVG)
+        self.assertNotEqual(self.cache.getKey(SVG, set(["svg", "group"])), key)
+        self.assertNotEqual(self.cache.getKey(SVG, None, False), key)
+        self.assertNotEqual(self.cache.getKey(SVG + " "), key)
+
+    def testCorrupted(self):
+        key = self.cache.getKey(SVG)
+        self.cache.save(key, svgparser.Parser().parse(BytesIO(SVG)))
+        file_path = os.path.join(self.cache.dir_path, key + ParseCache.FILE_EXTENSION)
+        f = open(file_path, "wb")
+        f.write("not a tree")
+        f.close()
+        self.assertEqual(self.cache.load(key), None)
+        self.assertFalse(os.path.exists(file_path))
+
+    def testEviction(self):
+        cache = ParseCache(self.cache.dir_path, 1)
+        for data in [SVG, SVG + " "]:
+            key = cache.getKey(data)
+            cache.save(key, svgparser.Parser().parse(BytesIO(data)))
+        # the last one is always kept
+        self.assertEqual(os.listdir(cache.dir_path), [key + ParseCache.FILE_EXTENSION])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, shutil, sys, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from rasterstore import RasterStore
+
+class TestRasterStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.store_dir_path = os.path.join(self.dir_path, "images")
+        self.index_dir_path = os.path.join(self.dir_path, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def render(self, name):
+        file_path = os.path.join(self.dir_path, name)
+        f = open(file_path, "wb")
+        f.write("rendering")
+        f.close()
+        return file_path
+
+    def testIndexOutsideStore(self):
+        store = RasterStore(self.store_dir_path, None, self.index_dir_path)
+        stored = store.add(self.render("a.png"), "key", 1, 2)
+        self.assertEqual(os.listdir(self.store_dir_path), [os.path.basename(stored)])
+        self.assertEqual(os.listdir(self.index_dir_path), [os.path.basename(store.getIndexFilePath())])
+        # another store on the same directory finds the rendering
+        store = RasterStore(self.store_dir_path, None, self.index_dir_path)
+        self.assertEqual(store.lookup("key"), [stored, 1, 2])
+        self.assertEqual(store.lookup("other"), None)
+
+if __name__ == "__main__":
+    unittest.main()
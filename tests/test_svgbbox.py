@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from svgbbox import SVGBoundingBox
+from svgelements import SVGNative
+
+class TestPathBox(unittest.TestCase):
+
+    def testPath(self):
+        elem = SVGNative({(None, "d"): "M 10,20 l 30,40"})
+        self.assertEqual(SVGBoundingBox().getBox(elem), [10.0, 20.0, 40.0, 60.0])
+
+    def testTruncatedPath(self):
+        for d in ["M 10", "M 10,20 L 30", "M 10,20 C 1,2 3,4"]:
+            elem = SVGNative({(None, "d"): d})
+            self.assertEqual(SVGBoundingBox().getBox(elem), None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, re, shutil, sys, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from lxml import etree
+from options import Options
+from rasterwriter import RasterWriter
+from svgexporter import SVGExporter
+
+# 1x1 PNG image
+PNG = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=="
+
+SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="100" height="100">
+  <rect id="r1" x="10" y="10" width="20" height="20" style="fill:#ff0000"/>
+  <image id="i1" x="0" y="0" width="10" height="10" xlink:href="data:image/png;base64,%s"/>
+</svg>
+""" % (PNG)
+
+class TestConvert(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.options = Options.getDefaultOptions()
+        self.options["outputdirectory"] = os.path.join(self.dir_path, "out")
+        self.options["rastershareddirectory"] = os.path.join(self.dir_path, "shared")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def testInMemory(self):
+        result = SVGExporter.fromData(SVG, self.options).convert()
+        # the extracted image is in the result, and nothing is written
+        self.assertEqual(len(result.images), 1)
+        self.assertTrue(result.images.keys()[0] in result.xhtml)
+        self.assertEqual(os.listdir(self.dir_path), [])
+
+    def testWrite(self):
+        result = SVGExporter.fromData(SVG, self.options).convert(write=True)
+        # the extracted image is in the shared directory
+        self.assertEqual(len(result.images), 0)
+        self.assertEqual(sorted(os.listdir(self.dir_path)), ["out", "shared"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir_path, "out"))), ["index.xhtml", "style.css"])
+        self.assertEqual(len(os.listdir(os.path.join(self.dir_path, "shared"))), 1)
+
+# two native paths directly under the page, using a shared gradient
+NATIVE_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100">
+  <defs>
+    <linearGradient id="lg1">
+      <stop offset="0" style="stop-color:#ff0000"/>
+      <stop offset="1" style="stop-color:#0000ff"/>
+    </linearGradient>
+  </defs>
+  <path id="p1" d="M 10,10 L 50,10 50,50 Z" style="fill:url(#lg1)"/>
+  <path id="p2" d="M 60,60 L 90,60 90,90 Z" style="fill:url(#lg1)"/>
+</svg>
+"""
+
+class TestIslands(unittest.TestCase):
+
+    def testSharedDefs(self):
+        options = Options.getDefaultOptions()
+        options["outputformat"] = "vector"
+        xhtml = SVGExporter.fromData(NATIVE_SVG, options).convert().xhtml
+        # the shared <defs> come first, and both paths are in a single island
+        self.assertTrue(xhtml.index("<defs") < xhtml.index('id="p1"'))
+        self.assertEqual(xhtml.count("-svg\""), 1)
+
+# a text whose auxiliary <span> would take the id of another element
+TEXT_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" width="100" height="100">
+  <rect id="t1-sep" x="10" y="10" width="20" height="20" style="fill:#ff0000"/>
+  <text id="t1" x="10" y="50"><tspan id="ts1" x="10" y="50">Hello</tspan></text>
+</svg>
+"""
+
+class TestIds(unittest.TestCase):
+
+    def testDerivedIds(self):
+        options = Options.getDefaultOptions()
+        options["outputformat"] = "vector"
+        xhtml = SVGExporter.fromData(TEXT_SVG, options).convert().xhtml
+        ids = re.findall(r'id="([^"]*)"', xhtml)
+        self.assertEqual(len(ids), len(set(ids)))
+
+# two layers, rendered by a fake exporter
+LAYERS_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" width="100" height="100">
+  <g inkscape:label="A" inkscape:groupmode="layer" id="la"><rect id="r1" x="10" y="10" width="20" height="20" style="fill:#ff0000"/></g>
+  <g inkscape:label="B" inkscape:groupmode="layer" id="lb"><rect id="r2" x="50" y="50" width="20" height="20" style="fill:#00ff00"/></g>
+</svg>
+"""
+
+# the ids exported by exportRaster (for merged layers, the list of their ids),
+# and the ids whose export fails
+EXPORTED = []
+FAILING = set()
+
+# fake RasterWriter.exportRaster, writing a 1x1 PNG image
+def exportRaster(cls, dest, elem_id, input_svg_path, *args):
+    if (elem_id in FAILING):
+        raise IOError("cannot export %s" % (elem_id))
+    if (elem_id is None):
+        # the layers written by writeLayersSVG
+        root = etree.parse(input_svg_path).getroot()
+        EXPORTED.append([child.get("id") for child in root if (child.get("id") is not None)])
+    else:
+        EXPORTED.append(elem_id)
+    file_path = dest + ".png"
+    if (not os.path.exists(os.path.dirname(file_path))):
+        os.makedirs(os.path.dirname(file_path))
+    f = open(file_path, "wb")
+    f.write(PNG.decode("base64"))
+    f.close()
+    return [0, 100, file_path]
+
+class TestFakeExport(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.options = Options.getDefaultOptions()
+        self.options["outputdirectory"] = os.path.join(self.dir_path, "out")
+        self.export_raster = RasterWriter.exportRaster
+        RasterWriter.exportRaster = classmethod(exportRaster)
+        del EXPORTED[:]
+        FAILING.clear()
+
+    def tearDown(self):
+        RasterWriter.exportRaster = self.export_raster
+        shutil.rmtree(self.dir_path)
+
+class TestFailedExport(TestFakeExport):
+
+    def setUp(self):
+        TestFakeExport.setUp(self)
+        FAILING.add("lb")
+
+    def testMixed(self):
+        # the failed layer does not abort the page
+        self.options["outputformat"] = "mixed"
+        result = SVGExporter.fromData(LAYERS_SVG, self.options).convert()
+        self.assertEqual(len(result.images), 1)
+        self.assertTrue('id="svg-lb"' in result.xhtml)
+
+    def testRaster(self):
+        self.options["outputformat"] = "raster"
+        self.options["rasterjobs"] = "2"
+        result = SVGExporter.fromData(LAYERS_SVG, self.options).convert()
+        self.assertEqual(len(result.images), 1)
+
+# background layers, a layer with text, and a layer above it
+MERGE_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" width="100" height="100">
+  <defs id="defs"/>
+  <g inkscape:label="A" inkscape:groupmode="layer" id="la"><rect id="r1" x="10" y="10" width="20" height="20" style="fill:#ff0000"/></g>
+  <g inkscape:label="B" inkscape:groupmode="layer" id="lb" style="opacity:0.5"><rect id="r2" x="50" y="50" width="20" height="20" style="fill:#00ff00"/></g>
+  <g inkscape:label="C" inkscape:groupmode="layer" id="lc"><text id="t1" x="5" y="50">Hi</text></g>
+  <g inkscape:label="D" inkscape:groupmode="layer" id="ld"><rect id="r3" x="10" y="10" width="20" height="20" style="fill:#0000ff"/></g>
+</svg>
+"""
+
+class TestMergeLayers(TestFakeExport):
+
+    def setUp(self):
+        TestFakeExport.setUp(self)
+        self.options["outputformat"] = "mixed"
+        self.options["rasterjobs"] = "1"
+
+    def testMerge(self):
+        self.options["mergebackgroundlayers"] = True
+        result = SVGExporter.fromData(MERGE_SVG, self.options).convert()
+        # the layers up to the one with text are rendered together (with the <defs>)
+        self.assertEqual(EXPORTED, [["defs", "la", "lb"], "lc", "ld"])
+        self.assertEqual(len(result.images), 3)
+        self.assertFalse('id="svg-lb"' in result.xhtml)
+        # the opacity of the merged layer is in the raster
+        self.assertFalse("opacity" in result.css)
+
+    def testNoMerge(self):
+        self.options["mergebackgroundlayers"] = False
+        result = SVGExporter.fromData(MERGE_SVG, self.options).convert()
+        self.assertEqual(EXPORTED, ["la", "lb", "lc", "ld"])
+        self.assertEqual(len(result.images), 4)
+
+# a drawing whose first path references a gradient defined after it,
+# so that its handling is deferred while streaming
+DRAWING_SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" width="200" height="200">
+  <g inkscape:label="A" inkscape:groupmode="layer" id="la">
+    <path id="p1" d="M 10,10 L 50,10 50,50 Z" style="fill:url(#lg1)"/>
+    <rect id="r1" x="10" y="10" width="20" height="20" style="fill:#ff0000"/>
+  </g>
+  <defs id="d1">
+    <linearGradient id="lg1">
+      <stop id="s1" offset="0" style="stop-color:#ff0000"/>
+      <stop id="s2" offset="1" style="stop-color:#0000ff"/>
+    </linearGradient>
+  </defs>
+  <g inkscape:label="B" inkscape:groupmode="layer" id="lb">
+    <g id="g1" transform="translate(10,20)">
+      <rect id="r2" x="50" y="50" width="20" height="20" rx="5" style="fill:#00ff00;opacity:0.5"/>
+      <circle id="c1" cx="100" cy="100" r="10" style="fill:#0000ff"/>
+    </g>
+    <text id="t1" x="5" y="150"><tspan id="ts1" x="5" y="150">Hi</tspan></text>
+    <path id="p2" d="M 60,60 L 90,60 90,90 Z" style="fill:url(#lg1)"/>
+  </g>
+</svg>
+"""
+
+class TestParsing(TestFakeExport):
+
+    def convert(self, **options):
+        self.options.update(options)
+        result = SVGExporter.fromData(DRAWING_SVG, self.options).convert()
+        return result.xhtml, result.css, result.log
+
+    def testStreaming(self):
+        # the output is the same, byte by byte
+        for output_format in ["vector", "mixed"]:
+            xhtml, css, log = self.convert(outputformat=output_format, streamingparser=False)
+            self.assertFalse("Parsing (streaming)..." in log)
+            streamed_xhtml, streamed_css, log = self.convert(outputformat=output_format, streamingparser=True)
+            self.assertTrue("Parsing (streaming)..." in log)
+            self.assertEqual(streamed_xhtml, xhtml)
+            self.assertEqual(streamed_css, css)
+
+    def testParseCache(self):
+        xhtml, css, log = self.convert(outputformat="vector")
+        cache_dir_path = os.path.join(self.dir_path, "cache")
+        for message in ["PC: Document cached", "PC: Document read from the cache"]:
+            cached_xhtml, cached_css, log = self.convert(parsecachedirectory=cache_dir_path)
+            self.assertTrue(message in log)
+            self.assertEqual(cached_xhtml, xhtml)
+            self.assertEqual(cached_css, css)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from io import BytesIO
+from options import Options
+from svgelements import SVGGroup
+from svgexporter import SVGExporter
+from svgflattener import SVGGroupFlattener
+import svgparser
+
+SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" width="500" height="500">
+  <g inkscape:groupmode="layer" id="layer1">
+    <g id="scaled-text" transform="scale(2)"><text id="t1" x="10" y="20">Hello</text></g>
+    <g id="moved-text" transform="translate(5,5)"><text id="t2" x="10" y="40">World</text></g>
+    <g id="scaled-rect" transform="scale(2)"><rect id="r1" x="1" y="1" width="10" height="10" style="fill:#ff0000"/></g>
+    <g id="cancelled" transform="translate(10,0)"><rect id="r2" x="1" y="1" width="10" height="10" transform="translate(-10,0)" style="fill:#00ff00"/></g>
+    <g id="identity" transform="matrix(1,0,0,1,0,0)"><rect id="r3" x="1" y="1" width="10" height="10" style="fill:#0000ff"/></g>
+    <g id="half" style="opacity:0.5"><rect id="r4" x="1" y="1" width="10" height="10" style="fill:#0000ff"/></g>
+  </g>
+</svg>
+"""
+
+class TestGroupFlattener(unittest.TestCase):
+
+    def getGroupIds(self, root):
+        ids = []
+        stack = [root]
+        while (len(stack) > 0):
+            elem = stack.pop()
+            if (isinstance(elem, SVGGroup)):
+                ids.append(elem.id)
+            if (hasattr(elem, "__iter__")):
+                stack.extend(elem)
+        return sorted(ids)
+
+    def testFlattenable(self):
+        root = svgparser.Parser().parse(BytesIO(SVG))
+        flattener = SVGGroupFlattener()
+        flattener.flatten(root)
+        # a text must not be scaled around a different origin,
+        # and opacity applies to the whole group
+        self.assertEqual(self.getGroupIds(root), ["half", "layer1", "scaled-text"])
+        self.assertEqual(flattener.flattened, 4)
+        # transforms cancelling each other out are dropped
+        # (the transform inherited from the group is kept for native copies)
+        r2 = root.getElementById("r2")
+        self.assertEqual(len(r2.transform), 0)
+        self.assertEqual([r2.inherited_transform.e, r2.inherited_transform.f], [10, 0])
+        # the identity is not composed
+        self.assertEqual(root.getElementById("r3").inherited_transform, None)
+
+    def testNoIdentityTransform(self):
+        options = Options.getDefaultOptions()
+        options["flattengroups"] = True
+        result = SVGExporter.fromData(SVG, options).convert()
+        self.assertFalse("matrix(1.000000,0.000000,0.000000,1.000000," in result.css)
+        # the translation is applied to the position of the text
+        self.assertTrue("#svg-t2{top:-9955.00px;left:15.00px;" in result.css)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, sys, unittest
+from io import BytesIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import svgparser
+
+SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" width="100" height="100">
+  <defs id="d1"><linearGradient id="lg1"><stop id="s1" offset="0"/></linearGradient></defs>
+  <g inkscape:groupmode="layer" id="la">
+    <rect id="r1" x="1" y="1" width="2" height="2"/>
+    <g id="g1"><rect id="r2" x="1" y="1" width="2" height="2"/></g>
+  </g>
+  <text id="t1" x="5" y="5">Hi</text>
+</svg>
+"""
+
+# get the ids of the elements of the tree rooted at elem, in document order
+def getIds(elem):
+    ids = []
+    stack = [elem]
+    while (len(stack) > 0):
+        e = stack.pop()
+        if (e.id):
+            ids.append(e.id)
+        if (isinstance(e, list)):
+            stack.extend(reversed(e))
+    return ids
+
+class TestNeeds(unittest.TestCase):
+
+    def parse(self, needs=None, needs_layer_contents=True):
+        return svgparser.Parser(needs, needs_layer_contents).parse(BytesIO(SVG))
+
+    def testAll(self):
+        self.assertEqual(getIds(self.parse()), ["d1", "lg1", "s1", "la", "r1", "g1", "r2", "t1"])
+
+    def testGroups(self):
+        # the groups are built, with their descendants which are groups
+        self.assertEqual(getIds(self.parse(set(["svg", "group"]))), ["la", "g1"])
+
+    def testDefs(self):
+        # the contents of <defs> are always built
+        self.assertEqual(getIds(self.parse(set(["svg", "define"]))), ["d1", "lg1", "s1"])
+
+    def testNoLayerContents(self):
+        self.assertEqual(getIds(self.parse(set(["svg", "group"]), False)), ["la"])
+
+class TestLayerScanner(unittest.TestCase):
+
+    def testLayers(self):
+        svg_root, layers = svgparser.LayerScanner().scan(BytesIO(SVG))
+        self.assertEqual([layer.id for layer in layers], ["la"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from lxml import etree
+from svgsanitizer import SVGSanitizer
+
+class TestRoundPathData(unittest.TestCase):
+
+    def testCompactArcFlags(self):
+        d = SVGSanitizer.roundPathData("M10 10a5.1234 5.1234 0 0110 10", 3)
+        self.assertEqual(d, "M10 10a5.123 5.123 0 0 1 10 10")
+
+    def testSeparatedArcFlags(self):
+        d = SVGSanitizer.roundPathData("M10 10 A 5 5 30 1 0 20 20 5 5 0 1,1 0 0z", 3)
+        self.assertEqual(d, "M10 10 A 5 5 30 1 0 20 20 5 5 0 1,1 0 0z")
+
+    def testNumbers(self):
+        d = SVGSanitizer.roundPathData("m 1.23456,-2.5 c 1,2 3,4 5,6 z", 3)
+        self.assertEqual(d, "m 1.235,-2.5 c 1,2 3,4 5,6 z")
+
+    def testUnreadable(self):
+        self.assertEqual(SVGSanitizer.roundPathData("M1 1 X 2", 3), "M1 1 X 2")
+
+class TestRoundTransform(unittest.TestCase):
+
+    def testMatrix(self):
+        t = SVGSanitizer.roundTransform("matrix(0.70710678,0.70710678,-0.70710678,0.70710678,10.123456,-5.5)", 3)
+        self.assertEqual(t, "matrix(0.707107,0.707107,-0.707107,0.707107,10.123,-5.5)")
+
+    def testList(self):
+        t = SVGSanitizer.roundTransform("translate(1.23456 2) rotate(33.3333333, 1.23456, 0) scale(1.0000001)", 3)
+        self.assertEqual(t, "translate(1.235 2) rotate(33.333333, 1.235, 0) scale(1)")
+
+    def testUnknown(self):
+        self.assertEqual(SVGSanitizer.roundTransform("foo(1.23456)", 3), "foo(1.23456)")
+
+class TestSanitize(unittest.TestCase):
+
+    def testDeepTree(self):
+        # deeper than the recursion limit
+        root = etree.Element("{http://www.w3.org/2000/svg}g")
+        node = root
+        for i in range(sys.getrecursionlimit() + 100):
+            node = etree.SubElement(node, "{http://www.w3.org/2000/svg}g")
+        node.attrib["style"] = "opacity:1;fill:#ff0000"
+        SVGSanitizer().sanitize(root)
+        self.assertEqual(node.get("style"), "fill:#ff0000")
+
+if __name__ == "__main__":
+    unittest.main()